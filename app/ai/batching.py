@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects concurrent calls into batches for a batch function.
+
+    Callers block on `__call__` (or hold the Future from `submit`) while a
+    single worker thread drains the queue: it takes the first waiting item,
+    keeps collecting until `max_batch_size` items or `max_wait_ms` has
+    passed, runs `batch_fn` on the list once and hands each caller its own
+    row of the output. While a batch runs, new requests pile up in the
+    queue and form the next batch.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=32, max_wait_ms=2.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, item):
+        """Queue item for the next batch and return a Future for its result"""
+        if self._thread is None:
+            self._start()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def stats(self):
+        """Batch size distribution and queue wait times since startup"""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "avg_queue_wait_ms": 1000 * self._wait_total / self._items if self._items else 0.0,
+                "max_queue_wait_ms": 1000 * self._wait_max,
+            }
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _record(self, batch, started):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._record(batch, time.monotonic())
+            futures = [future for _, future, _ in batch]
+            try:
+                outputs = self.batch_fn([item for item, _, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
@@ -0,0 +1,62 @@
+import clip
+import torch
+from app.config import CLIP_BACKEND, CLIP_INTRA_OP_THREADS, CLIP_INTER_OP_THREADS
+
+# OpenAI CLIP ViT-B/32 on torch; loaded by clip_model.load_model(). With
+# CLIP_BACKEND "clip-int8" the Linear layers (most of the transformer's
+# FLOPs) are quantized to int8 with dynamic activation scales, which only
+# runs on CPU.
+QUANTIZED = CLIP_BACKEND == "clip-int8"
+device = "cuda" if torch.cuda.is_available() and not QUANTIZED else "cpu"
+model = None
+_preprocess = None
+
+
+def set_threads(intra_op=CLIP_INTRA_OP_THREADS, inter_op=CLIP_INTER_OP_THREADS):
+    """Apply the CPU thread counts (0 = torch default)"""
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # Only possible before torch runs its first parallel operator
+            print(f"Keeping torch inter-op threads at {torch.get_num_interop_threads()}: {e}")
+
+
+def load():
+    global model, _preprocess
+    set_threads()
+    print(f"Loading CLIP ViT-B/32 on {device}{' (int8)' if QUANTIZED else ''}, "
+          f"{torch.get_num_threads()} intra-op threads")
+    model, _preprocess = clip.load("ViT-B/32", device=device, jit=False)
+    model.eval()
+    if QUANTIZED:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def preprocess(image):
+    """PIL image -> normalized 224x224 tensor"""
+    return _preprocess(image)
+
+
+def encode_image_batch(images):
+    """Encode a list of preprocessed image tensors in one forward pass"""
+    batch = torch.stack(images).to(device)
+
+    with torch.inference_mode():
+        emb = model.encode_image(batch)
+
+    emb = emb / emb.norm(dim=-1, keepdim=True)
+    return list(emb.cpu().numpy())
+
+
+def encode_text_batch(texts):
+    """Encode a list of strings in one forward pass"""
+    tokens = clip.tokenize(texts).to(device)
+
+    with torch.inference_mode():
+        emb = model.encode_text(tokens)
+
+    emb = emb / emb.norm(dim=-1, keepdim=True)
+    return list(emb.cpu().numpy())
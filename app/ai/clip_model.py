@@ -1,35 +1,326 @@
-import clip
-import torch
-import requests
-from PIL import Image, UnidentifiedImageError
-from io import BytesIO
+import asyncio
+import hashlib
+import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import UnidentifiedImageError
+from app import metrics
+from app.ai.batching import MicroBatcher
+from app.ai.embedding_cache import TieredCache
+from app.ai.image_decode import decode_rgb, dhash
+from app.ai.image_fetch import ImageFetchError, fetch_image_bytes, fetch_image_bytes_async
+from app.config import (
+    CLIP_BATCHING, CLIP_MAX_BATCH, CLIP_BATCH_WINDOW_MS, IMAGE_DECODE_WORKERS,
+    EMBEDDING_CACHE, INGEST_FETCH_WORKERS, CLIP_LOAD_MODE, CLIP_BACKEND
+)
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+if CLIP_BACKEND == "fake":
+    from app.ai import fake_encoder as backend
+elif CLIP_BACKEND in ("onnx", "onnx-int8"):
+    from app.ai import onnx_backend as backend
+else:
+    from app.ai import clip_backend as backend
+
+# The backend is loaded by load_model(): at import, in a background thread
+# or on first use depending on CLIP_LOAD_MODE
+_load_lock = threading.Lock()
+_load_error = None
+_ready = threading.Event()
+
+
+def load_model():
+    """Load the model once; later calls return immediately"""
+    global _load_error
+    if _ready.is_set():
+        return
+    with _load_lock:
+        if _ready.is_set():
+            return
+        try:
+            backend.load()
+        except Exception as e:
+            _load_error = e
+            raise
+        _load_error = None
+        _ready.set()
+        print(f"{CLIP_BACKEND} model ready")
+
+
+def _load_in_background():
+    try:
+        load_model()
+    except Exception as e:
+        print(f"Error loading CLIP model: {e}")
+
+
+def start_background_load():
+    """Begin loading the model without blocking the caller"""
+    if not _ready.is_set():
+        threading.Thread(target=_load_in_background, name="clip-load", daemon=True).start()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def load_error():
+    """The exception of the last failed load, if any"""
+    return _load_error
+
+
+def encode_image_batch(images):
+    """Encode a list of preprocessed images in one forward pass"""
+    load_model()
+    with metrics.timer("image_encode"):
+        return backend.encode_image_batch(images)
+
+
+def encode_text_batch(texts):
+    """Encode a list of strings in one forward pass"""
+    load_model()
+    with metrics.timer("text_encode"):
+        return backend.encode_text_batch(texts)
+
+
+image_batcher = MicroBatcher("clip-image", encode_image_batch, CLIP_MAX_BATCH, CLIP_BATCH_WINDOW_MS)
+text_batcher = MicroBatcher("clip-text", encode_text_batch, CLIP_MAX_BATCH, CLIP_BATCH_WINDOW_MS)
+
+if CLIP_LOAD_MODE == "eager":
+    load_model()
+
+
+# Bounded pool for CPU-bound decode + preprocess off the event loop
+decode_pool = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix="image-decode")
+
+INVALID_IMAGE_MESSAGE = "Invalid image URL. Please provide a direct image link."
+
+
+# Image embeddings by sha256 of the downloaded bytes, the digest of each URL
+# seen (Cloudinary URLs are versioned, so their content never changes) and
+# text embeddings by sha256 of the exact prompt. The perceptual hash of
+# each decoded image is kept by the same digest, for duplicate detection.
+image_cache = TieredCache("image")
+url_cache = TieredCache("url")
+text_cache = TieredCache("text")
+hash_cache = TieredCache("image_hash")
+
+
+def batching_stats():
+    return {"image": image_batcher.stats(), "text": text_batcher.stats()}
+
+
+def cache_stats():
+    return {"image": image_cache.stats(), "url": url_cache.stats(), "text": text_cache.stats(),
+            "image_hash": hash_cache.stats()}
+
+
+def _to_bytes(emb):
+    return np.asarray(emb, dtype="float32").tobytes()
+
+
+def _from_bytes(value):
+    return np.frombuffer(value, dtype="float32")
+
+
+def _cached_url_embedding(url):
+    """Embedding for a URL seen before, without downloading it again"""
+    if not EMBEDDING_CACHE:
+        return None
+    digest = url_cache.get(url.encode("utf-8"))
+    if digest is None:
+        return None
+    value = image_cache.get(digest)
+    return _from_bytes(value) if value is not None else None
+
+
+def _cached_content_embedding(url, data):
+    """Returns (digest, embedding or None) for downloaded image bytes"""
+    if not EMBEDDING_CACHE:
+        return None, None
+    digest = hashlib.sha256(data).digest()
+    value = image_cache.get(digest)
+    if value is not None:
+        url_cache.put(url.encode("utf-8"), digest)
+        return digest, _from_bytes(value)
+    return digest, None
+
+
+def _store_image_embedding(url, digest, emb):
+    if EMBEDDING_CACHE:
+        image_cache.put(digest, _to_bytes(emb))
+        url_cache.put(url.encode("utf-8"), digest)
+
+
+def image_hash(url):
+    """Perceptual hash (dhash) of the image last encoded from url, or None
+    if it is unknown (never decoded, or the embedding cache is off)"""
+    if not EMBEDDING_CACHE:
+        return None
+    digest = url_cache.get(url.encode("utf-8"))
+    value = hash_cache.get(digest) if digest is not None else None
+    return int.from_bytes(value, "big") if value is not None else None
+
+
+def decode_image(data: bytes, digest=None):
+    """Decode downloaded bytes (at reduced size) into a preprocessed image
+    tensor; with the content digest, the image's hash is cached too"""
+    try:
+        with metrics.timer("decode"):
+            image = decode_rgb(data)
+    except (UnidentifiedImageError, OSError):
+        metrics.increment("invalid_images")
+        raise ValueError(INVALID_IMAGE_MESSAGE)
+    if digest is not None:
+        hash_cache.put(digest, dhash(image).to_bytes(8, "big"))
+    load_model()
+    with metrics.timer("preprocess"):
+        return backend.preprocess(image)
 
 
 def encode_image_url(url: str):
+    emb = _cached_url_embedding(url)
+    if emb is not None:
+        return emb
+
+    try:
+        data = fetch_image_bytes(url)
+    except ImageFetchError:
+        raise ValueError(INVALID_IMAGE_MESSAGE)
+
+    digest, emb = _cached_content_embedding(url, data)
+    if emb is not None:
+        return emb
+
+    image = decode_image(data, digest)
+
+    if CLIP_BATCHING:
+        emb = image_batcher(image)
+    else:
+        emb = encode_image_batch([image])[0]
+    _store_image_embedding(url, digest, emb)
+    return emb
+
+
+async def encode_image_url_async(url: str):
+    """encode_image_url for the event loop: async fetch, pooled decode"""
+    loop = asyncio.get_running_loop()
+    emb = await loop.run_in_executor(decode_pool, _cached_url_embedding, url)
+    if emb is not None:
+        return emb
+
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-    except (requests.RequestException, UnidentifiedImageError):
-        raise ValueError("Invalid image URL. Please provide a direct image link.")
+        data = await fetch_image_bytes_async(url)
+    except ImageFetchError:
+        raise ValueError(INVALID_IMAGE_MESSAGE)
 
-    image = preprocess(image).unsqueeze(0).to(device)
+    digest, emb = await loop.run_in_executor(decode_pool, _cached_content_embedding, url, data)
+    if emb is not None:
+        return emb
 
-    with torch.no_grad():
-        emb = model.encode_image(image)
+    image = await loop.run_in_executor(decode_pool, decode_image, data, digest)
 
-    emb = emb / emb.norm(dim=-1, keepdim=True)
-    return emb.cpu().numpy()[0]
+    if CLIP_BATCHING:
+        emb = await asyncio.wrap_future(image_batcher.submit(image))
+    else:
+        emb = await loop.run_in_executor(decode_pool, lambda: encode_image_batch([image])[0])
+    await loop.run_in_executor(decode_pool, _store_image_embedding, url, digest, emb)
+    return emb
+
+
+def _text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
 
 
 def encode_text(text: str):
-    tokens = clip.tokenize([text]).to(device)
+    if EMBEDDING_CACHE:
+        value = text_cache.get(_text_key(text))
+        if value is not None:
+            return _from_bytes(value)
+
+    if CLIP_BATCHING:
+        emb = text_batcher(text)
+    else:
+        emb = encode_text_batch([text])[0]
+
+    if EMBEDDING_CACHE:
+        text_cache.put(_text_key(text), _to_bytes(emb))
+    return emb
+
+
+async def encode_text_async(text: str):
+    loop = asyncio.get_running_loop()
+    if EMBEDDING_CACHE:
+        value = await loop.run_in_executor(decode_pool, text_cache.get, _text_key(text))
+        if value is not None:
+            return _from_bytes(value)
+
+    if CLIP_BATCHING:
+        emb = await asyncio.wrap_future(text_batcher.submit(text))
+    else:
+        emb = await loop.run_in_executor(decode_pool, lambda: encode_text_batch([text])[0])
+
+    if EMBEDDING_CACHE:
+        await loop.run_in_executor(decode_pool, text_cache.put, _text_key(text), _to_bytes(emb))
+    return emb
+
+
+def _prepare_image(url):
+    """Fetch and decode one URL for encode_image_urls.
+
+    Returns (embedding, None, None) on a cache hit, (None, digest, tensor)
+    when the model has to run, or (error, None, None).
+    """
+    emb = _cached_url_embedding(url)
+    if emb is not None:
+        return emb, None, None
+    try:
+        data = fetch_image_bytes(url)
+    except ImageFetchError:
+        return ValueError(INVALID_IMAGE_MESSAGE), None, None
+    digest, emb = _cached_content_embedding(url, data)
+    if emb is not None:
+        return emb, None, None
+    try:
+        return None, digest, decode_image(data, digest)
+    except ValueError as e:
+        return e, None, None
+
+
+def encode_image_urls(urls):
+    """Encode many image URLs; returns an embedding or a ValueError per URL.
+
+    Downloads and decodes run concurrently, cache hits skip both, and the
+    misses go through the model in batches of CLIP_MAX_BATCH.
+    """
+    with ThreadPoolExecutor(max_workers=INGEST_FETCH_WORKERS, thread_name_prefix="image-fetch") as pool:
+        prepared = list(pool.map(_prepare_image, urls))
+
+    results = [result for result, _, _ in prepared]
+    pending = [(i, digest, image) for i, (_, digest, image) in enumerate(prepared) if image is not None]
+    for start in range(0, len(pending), CLIP_MAX_BATCH):
+        chunk = pending[start:start + CLIP_MAX_BATCH]
+        embs = encode_image_batch([image for _, _, image in chunk])
+        for (i, digest, _), emb in zip(chunk, embs):
+            _store_image_embedding(urls[i], digest, emb)
+            results[i] = emb
+    return results
 
-    with torch.no_grad():
-        emb = model.encode_text(tokens)
 
-    emb = emb / emb.norm(dim=-1, keepdim=True)
-    return emb.cpu().numpy()[0]
+def encode_texts(texts):
+    """Encode many strings, in batches of CLIP_MAX_BATCH for cache misses"""
+    results = [None] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        value = text_cache.get(_text_key(text)) if EMBEDDING_CACHE else None
+        if value is not None:
+            results[i] = _from_bytes(value)
+        else:
+            pending.append(i)
+    for start in range(0, len(pending), CLIP_MAX_BATCH):
+        chunk = pending[start:start + CLIP_MAX_BATCH]
+        embs = encode_text_batch([texts[i] for i in chunk])
+        for i, emb in zip(chunk, embs):
+            if EMBEDDING_CACHE:
+                text_cache.put(_text_key(texts[i]), _to_bytes(emb))
+            results[i] = emb
+    return results
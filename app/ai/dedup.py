@@ -0,0 +1,127 @@
+"""Duplicate report detection at ingest.
+
+People report the same item more than once: they upload the photo again,
+or the app retries a request that timed out. Stored as new items, these
+copies grow the index and crowd one item's copies into the top-K of every
+match. Before a report is stored, its fused embedding is searched among
+the same type and category reported in the last DEDUP_WINDOW_HOURS. A hit
+scoring DEDUP_EMBEDDING_THRESHOLD or more is a duplicate if the perceptual
+hashes of the two photos are also within DEDUP_HASH_DISTANCE bits: the
+embedding alone can rate two different photos of similar items that close,
+the hash does not. The duplicate is then linked to the item it repeats
+(duplicate_reports, last_reported_at) instead of being stored.
+
+Bulk ingest runs the same check for a whole chunk (find_duplicates), which
+also catches copies sent within one chunk.
+"""
+import contextlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import metrics
+from app.ai.faiss_index import search_vectors
+from app.ai.image_decode import hash_distance
+from app.config import (
+    DEDUP_WINDOW_HOURS, DEDUP_EMBEDDING_THRESHOLD, DEDUP_EMBEDDING_ONLY_THRESHOLD,
+    DEDUP_HASH_DISTANCE, DEDUP_CANDIDATES
+)
+from app.db.fake_db import get_item_by_id, get_item_fields, update_item
+
+log = logging.getLogger(__name__)
+
+# One duplicate check + store at a time per type and category, so that two
+# copies of a report arriving together are not both stored. Categories are
+# client text, so they share a fixed set of locks by hash. The API and bulk
+# ingest threads take the same locks.
+DEDUP_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(DEDUP_LOCK_STRIPES)]
+
+
+def _stripe(report_type, category):
+    return hash((report_type.lower(), category.upper())) % DEDUP_LOCK_STRIPES
+
+
+def dedup_lock(report_type, category):
+    """Lock to hold from the duplicate check until the report is stored"""
+    return _locks[_stripe(report_type, category)]
+
+
+@contextlib.contextmanager
+def dedup_locks(keys):
+    """Hold the locks of several (report_type, category) keys, taken in
+    stripe order so that two holders never wait on each other"""
+    stripes = sorted({_stripe(report_type, category) for report_type, category in keys})
+    for stripe in stripes:
+        _locks[stripe].acquire()
+    try:
+        yield
+    finally:
+        for stripe in reversed(stripes):
+            _locks[stripe].release()
+
+
+def _confirms(hit_id, score, image_hash, stored_hash):
+    """Whether a hit scoring DEDUP_EMBEDDING_THRESHOLD or more is a
+    duplicate, given the photo hashes (int or None) of both reports"""
+    if image_hash is not None and stored_hash is not None:
+        distance = hash_distance(image_hash, stored_hash)
+        log.debug("Duplicate candidate %s: score %.4f, hash distance %d", hit_id, score, distance)
+        return distance <= DEDUP_HASH_DISTANCE
+    return score >= DEDUP_EMBEDDING_ONLY_THRESHOLD
+
+
+def find_duplicate(report_type, category, embedding, image_hash=None, item_id=None):
+    """item_id of the recent item a new report repeats, or None. item_id
+    is the report's own ID when it may already be stored (a re-run)."""
+    with metrics.timer("dedup"):
+        since = datetime.utcnow() - timedelta(hours=DEDUP_WINDOW_HOURS)
+        hits = search_vectors(embedding, DEDUP_CANDIDATES, report_type=report_type,
+                              category=category, since=since)
+        hits = [hit for hit in hits if hit["score"] >= DEDUP_EMBEDDING_THRESHOLD and hit["item_id"] != item_id]
+        if not hits:
+            return None
+        hashes = get_item_fields([hit["item_id"] for hit in hits], ("imageHash",))
+        for hit in hits:
+            stored = hashes.get(hit["item_id"], {}).get("imageHash")
+            if _confirms(hit["item_id"], hit["score"], image_hash, None if stored is None else int(stored, 16)):
+                return hit["item_id"]
+    return None
+
+
+def find_duplicates(reports):
+    """find_duplicate for reports stored together, as (item_id, report_type,
+    category, embedding, image_hash). Each gets the item_id of the recent
+    item it repeats, the position of an earlier report of the batch it
+    repeats, or None. Hold dedup_locks for their keys until they are stored."""
+    originals = []
+    for i, (item_id, report_type, category, embedding, image_hash) in enumerate(reports):
+        original = find_duplicate(report_type, category, embedding, image_hash, item_id)
+        if original is None:
+            # Not indexed yet: earlier reports of the batch that will be stored
+            for j in range(i):
+                other_id, other_type, other_category, other_embedding, other_hash = reports[j]
+                if originals[j] is not None or other_type != report_type \
+                        or other_category.upper() != category.upper():
+                    continue
+                score = float(np.dot(embedding, other_embedding))
+                if score >= DEDUP_EMBEDDING_THRESHOLD and _confirms(other_id, score, image_hash, other_hash):
+                    original = j
+                    break
+        originals.append(original)
+    return originals
+
+
+def link_duplicate(item_id):
+    """Record another report of item_id; returns False if it is gone"""
+    # The full record: the display cache does not keep the count
+    item = get_item_by_id(item_id)
+    if item is None:
+        return False
+    update_item(item_id, {"duplicate_reports": item.get("duplicate_reports", 0) + 1,
+                          "last_reported_at": datetime.utcnow().isoformat()})
+    metrics.increment("duplicate_reports")
+    log.debug("Linked duplicate report to %s", item_id)
+    return True
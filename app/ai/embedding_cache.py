@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from app.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_ITEMS, EMBEDDING_CACHE_DISK_ITEMS
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def _connect():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH), exist_ok=True)
+        _db = sqlite3.connect(EMBEDDING_CACHE_PATH, check_same_thread=False)
+        # A cache can be rebuilt, so trade durability for write latency
+        _db.execute("PRAGMA journal_mode=WAL")
+        _db.execute("PRAGMA synchronous=OFF")
+        _db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " namespace TEXT NOT NULL, key BLOB NOT NULL, value BLOB NOT NULL,"
+            " used INTEGER NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        _db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (namespace, used)")
+    return _db
+
+
+class TieredCache:
+    """Two-tier key -> bytes cache: an in-memory LRU over an SQLite table.
+
+    Both tiers are bounded; the disk tier evicts its least recently used
+    tenth at once when full so eviction cost is amortized over many puts.
+    Values must be immutable once stored (they are shared with callers).
+    """
+
+    def __init__(self, namespace, memory_items=EMBEDDING_CACHE_MEMORY_ITEMS, disk_items=EMBEDDING_CACHE_DISK_ITEMS):
+        self.namespace = namespace
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                          "memory_evictions": 0, "disk_evictions": 0}
+        self._disk_count = None
+        self._clock = 0
+
+    def _open_disk(self):
+        if self._disk_count is None:
+            db = _connect()
+            self._disk_count, clock = db.execute(
+                "SELECT COUNT(*), COALESCE(MAX(used), 0) FROM entries WHERE namespace = ?",
+                (self.namespace,)
+            ).fetchone()
+            self._clock = clock
+        return _db
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return value
+
+        with _db_lock:
+            db = self._open_disk()
+            row = db.execute(
+                "SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is not None:
+                self._clock += 1
+                db.execute(
+                    "UPDATE entries SET used = ? WHERE namespace = ? AND key = ?",
+                    (self._clock, self.namespace, key)
+                )
+                db.commit()
+
+        with self._lock:
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            value = bytes(row[0])
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+
+        with _db_lock:
+            db = self._open_disk()
+            self._clock += 1
+            # Only a new key adds a row; a replaced one must not be counted
+            cursor = db.execute(
+                "UPDATE entries SET value = ?, used = ? WHERE namespace = ? AND key = ?",
+                (value, self._clock, self.namespace, key)
+            )
+            if cursor.rowcount == 0:
+                db.execute(
+                    "INSERT INTO entries (namespace, key, value, used) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, value, self._clock)
+                )
+                self._disk_count += 1
+            if self._disk_count > self.disk_items:
+                evict = self._disk_count - self.disk_items + max(1, self.disk_items // 10)
+                db.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key IN ("
+                    " SELECT key FROM entries WHERE namespace = ? ORDER BY used LIMIT ?)",
+                    (self.namespace, self.namespace, evict)
+                )
+                self._disk_count = db.execute(
+                    "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+                ).fetchone()[0]
+                with self._lock:
+                    self._counters["disk_evictions"] += evict
+            db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+        stats["disk_items"] = self._disk_count
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -1,155 +1,1439 @@
+import contextlib
 import faiss
+import functools
+import logging
 import numpy as np
 import os
 import json
-from app.db.fake_db import get_all_items
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from app.ai.index_factory import (
+    base_index, build_index, is_flat, make_search_params, new_flat_index, supports_remove
+)
+from app.config import (
+    WAL_SNAPSHOT_EVERY, WAL_FSYNC, ANN_MIN_VECTORS, INDEX_MMAP,
+    INDEX_COMPACT_MIN_DELETED, INDEX_COMPACT_RATIO, SERVE_ROLE, PREFILTER_EXACT_MAX, WRITE_BEHIND,
+    INDEX_SHARD_DAYS, INDEX_RETENTION_DAYS, INDEX_RETENTION_ACTION
+)
+from app import metrics
+from app.db import fake_db, vector_store
+from app.db.fake_db import claim_writer, get_all_items, get_items_since, get_item_fields, get_lost_item_ids
+from app.utils.location import normalize_location
+
+log = logging.getLogger(__name__)
 
 DIM = 512
+DATA_DIR = "./data"
 INDEX_PATH = "./data/faiss_index.index"
 ID_MAP_PATH = "./data/id_map.json"
+MANIFEST_PATH = "./data/faiss_manifest.json"
+WAL_PATH = "./data/faiss_ids.wal"
+# Time shards retired by the retention policy with INDEX_RETENTION_ACTION "archive"
+ARCHIVE_DIR = "./data/index_archive"
+# Row-addressed WAL of the previous layout, replayed once and then removed
+LEGACY_WAL_PATH = "./data/faiss_index.wal"
+# created_at up to which every database item is known to be in the index
+WATERMARK_PATH = "./data/sync_watermark.json"
+# Items are stamped before they are written, so the next sync looks back a
+# little further than the watermark to cover inserts racing with this one
+WATERMARK_SLACK = timedelta(seconds=5)
+
+# A reader process never writes: it maps the writer's snapshot and follows
+# the WAL with refresh()
+READ_ONLY = SERVE_ROLE == "reader"
+
+# Snapshot layout: 2 = partitions keyed by stable int64 vector ids, one per
+# report type; 3 = one per report type and time shard
+MANIFEST_FORMAT = 3
+
+# WAL record: header (lsn, crc32 of the body), then the body: op, vector id,
+# item_id length, the utf-8 item_id and, for adds, DIM float32 values
+WAL_HEADER = struct.Struct("<QI")
+WAL_BODY = struct.Struct("<BqH")
+WAL_ADD = 1
+WAL_DELETE = 2
+# Record header of the legacy WAL: lsn, item_id length, crc32 of the payload
+LEGACY_WAL_HEADER = struct.Struct("<QHI")
+VECTOR_BYTES = DIM * 4
+
+# Vectors added after a partition's time order was built are scanned
+# linearly by time filters until this many have accumulated
+TIME_TAIL_MAX = 4096
+
+# Time shards are aligned to Mondays (1970-01-05 was one); items without a
+# created_at go to an "undated" shard of their type, searched last
+SHARD_ORIGIN = 4 * 86400
+UNDATED = "undated"
 
 # Ensure data directory exists
-os.makedirs("./data", exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
 
-# Initialize or load FAISS index
-def get_index():
-    if os.path.exists(INDEX_PATH):
-        print(f"Loading FAISS index from {INDEX_PATH}")
-        index = faiss.read_index(INDEX_PATH)
-    else:
-        print(f"Creating new FAISS index")
-        index = faiss.IndexFlatIP(DIM)
+# Guards the partitions dict, indexed_ids and the WAL handle. Searches only
+# take it to pick their partitions; each Partition has a _SearchLock of its own
+_lock = threading.RLock()
+# Serializes snapshots so only one is written at a time
+_snapshot_lock = threading.Lock()
+_snapshot_thread = None
+_compaction_thread = None
+_retention_thread = None
+# Partitions being rebuilt in the background (ANN migration or compaction)
+_rebuilding = set()
+
+
+def partition_key(item_id):
+    """Report type prefix of an item's ID (LOST/FOUND)"""
+    return item_id.split('-')[0]
+
+
+def shard_key(report_type, created):
+    """Partition of an item of report_type (LOST/FOUND) created at epoch
+    seconds created: with INDEX_SHARD_DAYS, the type and the start of its
+    time shard, e.g. FOUND/2026-10-12; otherwise the type alone"""
+    if not INDEX_SHARD_DAYS:
+        return report_type
+    if np.isnan(created):
+        return f"{report_type}/{UNDATED}"
+    length = INDEX_SHARD_DAYS * 86400
+    start = SHARD_ORIGIN + (created - SHARD_ORIGIN) // length * length
+    return f"{report_type}/{datetime.fromtimestamp(start, timezone.utc):%Y-%m-%d}"
+
+
+@functools.lru_cache(maxsize=None)
+def shard_span(key):
+    """(start, end) epochs of the items a partition can hold, end exclusive;
+    unbounded for a partition without a time shard"""
+    _, _, day = key.partition("/")
+    if not day or day == UNDATED:
+        return -np.inf, np.inf
+    start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    return start, start + INDEX_SHARD_DAYS * 86400
+
+
+def retention_cutoff(now=None):
+    """Epoch before which time shards are retired, or None if none are"""
+    if not (INDEX_SHARD_DAYS and INDEX_RETENTION_DAYS):
+        return None
+    return (time.time() if now is None else now) - INDEX_RETENTION_DAYS * 86400
+
+
+def category_of(item_id):
+    """Category segment of an ID like LOST-WALLET-A9F2"""
+    return '-'.join(item_id.split('-')[1:-1])
+
+
+def _id_selector(ids):
+    """IDSelector of a set of vector ids: a hash set when they are sparse, a
+    bitmap over all ids (a bit per id, far cheaper to build) otherwise"""
+    if len(ids) * 64 < ids.max():
+        return faiss.IDSelectorBatch(ids)
+    bits = np.zeros(int(ids.max()) + 1, dtype=bool)
+    bits[ids] = True
+    bitmap = np.packbits(bits, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    selector.bitmap_array = bitmap  # the selector only points into it
+    return selector
+
+
+class _SearchLock:
+    """Shared/exclusive lock of a partition: any number of searches use it
+    at once, a change waits for them and has it alone. Searches arriving
+    while a change waits queue behind it. The exclusive side is reentrant,
+    and its owner may also search."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._searches = 0
+        self._owner = None
+        self._depth = 0
+        self._waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner != me:
+                while self._owner is not None or self._waiting:
+                    self._cond.wait()
+            self._searches += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._searches -= 1
+                if not self._searches:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner != me:
+                self._waiting += 1
+                while self._owner is not None or self._searches:
+                    self._cond.wait()
+                self._waiting -= 1
+                self._owner = me
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._owner = None
+                    self._cond.notify_all()
+
+
+def _prepare(index):
+    """Give an IVF index the direct map exact rescoring looks vectors up by
+    (a hashtable, which unlike an array survives remove_ids), before any
+    search can use it"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
     return index
 
-# Initialize or load ID map
-def get_id_map():
-    if os.path.exists(ID_MAP_PATH):
-        print(f"Loading ID map from {ID_MAP_PATH}")
-        with open(ID_MAP_PATH, 'r') as f:
+
+class Partition:
+    """Vectors of one report type and time shard, searched independently of
+    the others.
+
+    `index` is an IndexIDMap2 keyed by int64 vector ids that never change;
+    `item_ids` maps them back to item IDs. `places` and `times` hold the
+    normalized location and created_at (epoch seconds, NaN if unknown) of
+    each vector id, and together with `categories` they are indexed so
+    category, location and time filters can be pushed into the search.
+    Deleted ids stay in the index, hidden from search, until compaction
+    removes them. `index` starts as an exact flat index and is swapped for
+    an approximate one by _rebuild_partition once the partition is large
+    enough. A `mapped` index is a read-only view of the snapshot file; it
+    is copied into memory before the first change. A `shared` one (in a
+    reader process) is never changed: vectors added after the snapshot go
+    to a small flat `delta` index searched alongside it. `version` counts
+    changes, so a snapshot can keep the files of a partition that has not
+    changed since it was `saved` (version, files) instead of rewriting it.
+    Searches hold `lock` shared, every change holds it exclusively; a new
+    index is built aside and swapped in, never changed under a search.
+    """
+
+    def __init__(self, index=None, item_ids=None, deleted=(), mapped=False, shared=False,
+                 places=None, times=None):
+        self.index = index if index is not None else new_flat_index(DIM)
+        self.item_ids = item_ids if item_ids is not None else {}
+        self.places = places if places is not None else {}
+        self.times = times if times is not None else {}
+        self.deleted = set(deleted)
+        self.mapped = mapped
+        self.shared = shared
+        self.delta = None
+        self._live_selector = None
+        self.version = 0
+        self.saved = None
+        self.lock = _SearchLock()
+        # Guards the time order that concurrent searches build lazily
+        self._time_lock = threading.Lock()
+        self._index_attributes()
+
+    def _index_attributes(self):
+        self.categories = {}
+        for vector_id, item_id in self.item_ids.items():
+            self.categories.setdefault(category_of(item_id), []).append(vector_id)
+        self.locations = {}
+        for vector_id, place in self.places.items():
+            self.locations.setdefault(place, []).append(vector_id)
+        # (times, vector ids) sorted by time, built on the first time filter;
+        # later adds collect in a short unsorted tail until it is merged
+        self._by_time = None
+        self._recent_ids, self._recent_times = [], []
+
+    def live_count(self):
+        added = self.delta.ntotal if self.delta is not None else 0
+        return self.index.ntotal + added - len(self.deleted)
+
+    def materialize(self):
+        with self.lock.exclusive():
+            if self.mapped:
+                # faiss cannot modify a memory-mapped index in place
+                self.index = _prepare(faiss.deserialize_index(faiss.serialize_index(self.index)))
+                self.mapped = False
+
+    def add(self, vectors, item_ids, vector_ids, places, times):
+        with self.lock.exclusive():
+            self._add(vectors, item_ids, vector_ids, places, times)
+
+    def _add(self, vectors, item_ids, vector_ids, places, times):
+        if self.shared:
+            if self.delta is None:
+                self.delta = new_flat_index(DIM)
+            target = self.delta
+        else:
+            self.materialize()
+            target = self.index
+        target.add_with_ids(vectors, np.asarray(vector_ids, dtype="int64"))
+        for vector_id, item_id, place, created in zip(vector_ids, item_ids, places, times):
+            self.item_ids[vector_id] = item_id
+            self.places[vector_id] = place
+            self.times[vector_id] = created
+            self.categories.setdefault(category_of(item_id), []).append(vector_id)
+            self.locations.setdefault(place, []).append(vector_id)
+        if self._by_time is not None:
+            self._recent_ids.extend(vector_ids)
+            self._recent_times.extend(times)
+        self.version += 1
+
+    def delete(self, vector_ids):
+        """Hide vector ids from search; compaction removes them later"""
+        with self.lock.exclusive():
+            self.deleted.update(vector_ids)
+            self._live_selector = None
+            self.version += 1
+
+    def forget(self, vector_ids):
+        """Drop ids that compaction removed from the index"""
+        with self.lock.exclusive():
+            for vector_id in vector_ids:
+                self.item_ids.pop(vector_id, None)
+                self.places.pop(vector_id, None)
+                self.times.pop(vector_id, None)
+            self.deleted.difference_update(vector_ids)
+            self._live_selector = None
+            self._index_attributes()
+            self.version += 1
+
+    def swap(self, index, forgotten=()):
+        """Replace the index by one built aside (without the forgotten ids)"""
+        with self.lock.exclusive():
+            self.index = index
+            self.mapped = False
+            self.forget(forgotten)
+
+    def vectors(self, start, stop):
+        """Vectors and vector ids stored at rows start..stop of the index"""
+        vectors = base_index(self.index).reconstruct_n(start, stop - start)
+        ids = faiss.vector_to_array(self.index.id_map)[start:stop]
+        return vectors, ids
+
+    def _live(self):
+        """(deleted ids array, IDSelectorBatch of them, selector of the rest)"""
+        if self._live_selector is None:
+            deleted = np.fromiter(self.deleted, dtype="int64", count=len(self.deleted))
+            batch = faiss.IDSelectorBatch(deleted)
+            self._live_selector = (deleted, batch, faiss.IDSelectorNot(batch))
+        return self._live_selector
+
+    def in_window(self, since=None, until=None):
+        """Vector ids created in [since, until] (epoch seconds, None = open)"""
+        with self._time_lock:
+            return self._in_window(since, until)
+
+    def _in_window(self, since, until):
+        if self._by_time is None or len(self._recent_ids) > TIME_TAIL_MAX:
+            ids = np.fromiter(self.times, dtype="int64", count=len(self.times))
+            times = np.fromiter(self.times.values(), dtype="float64", count=len(self.times))
+            order = np.argsort(times, kind="stable")
+            self._by_time = (times[order], ids[order])
+            self._recent_ids, self._recent_times = [], []
+        times, ids = self._by_time
+        lo = 0 if since is None else np.searchsorted(times, since, "left")
+        hi = np.searchsorted(times, np.inf if until is None else until, "right")
+        selected = ids[lo:hi]
+        if self._recent_ids:
+            recent = np.asarray(self._recent_times, dtype="float64")
+            keep = recent <= (np.inf if until is None else until)
+            if since is not None:
+                keep &= recent >= since
+            selected = np.concatenate([selected, np.asarray(self._recent_ids, dtype="int64")[keep]])
+        return selected
+
+    def allowed(self, category=None, location=None, window=None):
+        """Live vector ids passing the category, normalized location and
+        (since, until) filters, or None when there is no filter"""
+        allowed = None
+        if category:
+            allowed = np.asarray(self.categories.get(category.upper(), ()), dtype="int64")
+        if location is not None:
+            ids = np.asarray(self.locations.get(location, ()), dtype="int64")
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        if window is not None:
+            ids = self.in_window(*window)
+            allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        if allowed is not None and self.deleted and len(allowed):
+            allowed = allowed[~np.isin(allowed, self._live()[0])]
+        return allowed
+
+    def _search_exact(self, query_vectors, top_k, ids):
+        """Exact top-k among a few vector ids, or None if the index cannot
+        reconstruct its vectors"""
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            # IVF lists are only reachable by id through a direct map, which
+            # _prepare adds before the index is searched
+            return None
+        try:
+            if self.delta is None:
+                vectors = self.index.reconstruct_batch(ids)
+            else:
+                in_delta = np.isin(ids, faiss.vector_to_array(self.delta.id_map))
+                vectors = np.empty((len(ids), DIM), dtype="float32")
+                if in_delta.any():
+                    vectors[in_delta] = self.delta.reconstruct_batch(ids[in_delta])
+                if not in_delta.all():
+                    vectors[~in_delta] = self.index.reconstruct_batch(ids[~in_delta])
+        except RuntimeError:
+            return None
+        scores = query_vectors @ vectors.T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_top in zip(scores, top):
+            row_top = row_top[np.argsort(-row_scores[row_top], kind="stable")]
+            results.append([(self.item_ids[ids[j]], float(row_scores[j])) for j in row_top])
+        return results
+
+    def search(self, query_vectors, top_k, category=None, location=None, window=None):
+        """Top-k over live vectors for each query row, restricted by the
+        filters of allowed() if given. Filters leaving few ids are scored
+        exactly; otherwise they become an IDSelector of the index search.
+        Runs alongside other searches; changes wait for it."""
+        with self.lock.shared():
+            return self._search(query_vectors, top_k, category, location, window)
+
+    def _search(self, query_vectors, top_k, category, location, window):
+        allowed = self.allowed(category, location, window)
+        if allowed is None:
+            candidates = self.live_count()
+            selector = self._live()[2] if self.deleted else None
+        else:
+            candidates = len(allowed)
+            if 0 < candidates <= PREFILTER_EXACT_MAX:
+                exact = self._search_exact(query_vectors, top_k, allowed)
+                if exact is not None:
+                    return exact
+            selector = _id_selector(allowed) if candidates else None
+        k = min(top_k, candidates)
+        if k <= 0:
+            return [[] for _ in query_vectors]
+        hits = [[] for _ in query_vectors]
+        for index in (self.index, self.delta):
+            if index is None or index.ntotal == 0:
+                continue
+            params = make_search_params(index, selector)
+            scores, indices = index.search(query_vectors, k, params=params)
+            for row_hits, row_ids, row_scores in zip(hits, indices, scores):
+                row_hits.extend(zip(row_ids, row_scores))
+        if self.delta is not None:
+            hits = [sorted(row_hits, key=lambda hit: hit[1], reverse=True)[:k] for row_hits in hits]
+        return [
+            [(self.item_ids[idx], float(score)) for idx, score in row_hits if idx >= 0]
+            for row_hits in hits
+        ]
+
+
+def _read_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, 'r') as f:
             return json.load(f)
+    return None
+
+
+def _load_single_index(manifest):
+    """Load a single-index snapshot (pre-partition manifest or legacy files)"""
+    index_path = manifest["index"] if manifest else INDEX_PATH
+    map_path = manifest["id_map"] if manifest else ID_MAP_PATH
+    if os.path.exists(index_path):
+        print(f"Loading FAISS index from {index_path}")
+        index = faiss.read_index(index_path)
+    else:
+        print(f"Creating new FAISS index")
+        index = faiss.IndexFlatIP(DIM)
+    if os.path.exists(map_path):
+        print(f"Loading ID map from {map_path}")
+        with open(map_path, 'r') as f:
+            id_map = json.load(f)
     else:
         print(f"Creating new ID map")
-        return []
+        id_map = []
+    return index, id_map
+
+
+def _allocate_ids(n):
+    """Next n vector ids; caller holds _lock"""
+    global next_id
+    first = next_id
+    next_id += n
+    return list(range(first, first + n))
+
+
+def epoch(created_at):
+    """Epoch seconds of an ISO created_at (naive = UTC) or datetime; NaN if unknown"""
+    if not created_at:
+        return float("nan")
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError:
+            return float("nan")
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+def _attributes(item_ids):
+    """Normalized locations and created_at epochs of items, for the
+    prefilters. They come from the item store, which every item is written
+    to before it is indexed."""
+    fields = get_item_fields(item_ids, ("location", "created_at"))
+    if READ_ONLY and len(fields) < len(set(item_ids)):
+        # The writer's WAL is ahead of the item log this reader has seen
+        fake_db.refresh()
+        fields = get_item_fields(item_ids, ("location", "created_at"))
+    places, times = [], []
+    for item_id in item_ids:
+        item = fields.get(item_id, {})
+        places.append(normalize_location(item.get("location")))
+        times.append(epoch(item.get("created_at")))
+    return places, times
+
+
+def _route(parts, vectors, item_ids, vector_ids, places, times, cutoff=None):
+    """Add vectors to the partitions of their report type and time shard in
+    parts, one add per partition; returns {item_id: (key, vector id)} of
+    those added. Vectors of shards ending by the cutoff epoch are left out."""
+    rows_by_key = {}
+    for row, (item_id, created) in enumerate(zip(item_ids, times)):
+        key = shard_key(partition_key(item_id), created)
+        if cutoff is None or shard_span(key)[1] > cutoff:
+            rows_by_key.setdefault(key, []).append(row)
+    added = {}
+    for key, rows in rows_by_key.items():
+        part = parts.get(key)
+        if part is None:
+            part = parts[key] = Partition()
+        part.add(vectors[rows], [item_ids[row] for row in rows], [vector_ids[row] for row in rows],
+                 [places[row] for row in rows], [times[row] for row in rows])
+        added.update((item_ids[row], (key, vector_ids[row])) for row in rows)
+    return added
+
+
+def _from_rows(index, id_map):
+    """Partitions for a row-addressed index (id_map[row] is the item ID).
+
+    Vectors get fresh ids in flat partitions; large ones are rebuilt as
+    approximate indexes in the background by _maybe_migrate.
+    """
+    parts = {}
+    if index.ntotal == 0:
+        return parts
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    item_ids = id_map[:index.ntotal]
+    _route(parts, vectors, item_ids, _allocate_ids(len(item_ids)), *_attributes(item_ids))
+    print(f"Assigned vector ids to {index.ntotal} vectors in {len(parts)} partitions")
+    return parts
+
+
+def _reshard(parts):
+    """Partitions of another layout (one per report type, or shards of
+    another length) regrouped into time shards, keeping their vector ids;
+    deleted vectors are left behind"""
+    resharded = {}
+    for key, part in parts.items():
+        ivf = faiss.try_extract_index_ivf(part.index)
+        if ivf is not None:
+            part.materialize()
+            ivf = faiss.try_extract_index_ivf(part.index)
+            ivf.make_direct_map()
+        vectors, ids = part.vectors(0, part.index.ntotal)
+        live = [row for row, vector_id in enumerate(ids) if vector_id not in part.deleted]
+        ids = [int(ids[row]) for row in live]
+        _route(resharded, vectors[live], [part.item_ids[vector_id] for vector_id in ids], ids,
+               [part.places.get(vector_id, "") for vector_id in ids],
+               [part.times.get(vector_id, np.nan) for vector_id in ids])
+    print(f"Split partitions {sorted(parts)} into {len(resharded)} time shards")
+    return resharded
+
+
+def _read_partition(files, mmap):
+    """Partition stored as an index file and an id map by _write_partition"""
+    with open(files["id_map"], 'r') as f:
+        id_map = json.load(f)
+    if mmap:
+        index = _prepare(faiss.read_index(files["index"], faiss.IO_FLAG_MMAP_IFC))
+    else:
+        index = _prepare(faiss.read_index(files["index"]))
+    if "created" in id_map:
+        places, times = id_map["locations"], [float("nan") if t is None else t for t in id_map["created"]]
+    else:
+        # Snapshot from before the prefilters: look the items up once
+        print(f"Indexing locations and dates of {len(id_map['ids'])} items in {files['index']}")
+        places, times = _attributes(id_map["item_ids"])
+    return Partition(index, dict(zip(id_map["ids"], id_map["item_ids"])), id_map["deleted"],
+                     mapped=mmap, shared=READ_ONLY,
+                     places=dict(zip(id_map["ids"], places)), times=dict(zip(id_map["ids"], times)))
+
+
+def _same_layout(manifest):
+    """Whether a snapshot's partitions are the time shards configured now"""
+    return manifest.get("format") == MANIFEST_FORMAT and manifest.get("shard_days") == INDEX_SHARD_DAYS
+
+
+def _gone_since_archived(part):
+    """Live vector ids of an archived shard whose items were deleted or
+    resolved after it was archived: remove_vectors skips retired shards"""
+    live = {vector_id: item_id for vector_id, item_id in part.item_ids.items() if vector_id not in part.deleted}
+    known = get_item_fields(list(set(live.values())), ("item_id", "status"))
+    return [vector_id for vector_id, item_id in live.items()
+            if item_id not in known or known[item_id]["status"] == "resolved"]
+
+
+def _load_partitions(manifest, archived=None):
+    """Partitions of a snapshot. Time shards in archived (key -> files) that
+    the retention no longer covers, since it was raised or the shards were
+    resized, are read back in, minus the items deleted or resolved since,
+    and taken out of archived."""
+    if manifest and manifest.get("format") in (2, MANIFEST_FORMAT):
+        parts = {}
+        for key, files in manifest["partitions"].items():
+            print(f"Loading FAISS partition {key} from {files['index']}")
+            parts[key] = part = _read_partition(files, INDEX_MMAP)
+            part.saved = (part.version, files)
+        cutoff = retention_cutoff()
+        for key, files in list((archived or {}).items()):
+            if _same_layout(manifest) and cutoff is not None and shard_span(key)[1] <= cutoff:
+                continue
+            print(f"Restoring archived FAISS partition {key} from {files['index']}")
+            parts[key] = part = _read_partition(files, INDEX_MMAP)
+            gone = _gone_since_archived(part)
+            if gone:
+                print(f"Removing {len(gone)} items deleted or resolved since {key} was archived")
+                part.delete(gone)
+            del archived[key]
+        if not _same_layout(manifest):
+            parts = _reshard(parts)
+        return parts
+    if manifest and "partitions" in manifest:
+        parts = {}
+        for key, files in manifest["partitions"].items():
+            print(f"Loading row-addressed FAISS partition {key} from {files['index']}")
+            with open(files["id_map"], 'r') as f:
+                id_map = json.load(f)
+            parts.update(_from_rows(faiss.read_index(files["index"]), id_map))
+        return parts
+    return _from_rows(*_load_single_index(manifest))
+
+
+def _remove_locked(item_ids):
+    """Hide items from search in their partitions; caller holds _lock"""
+    by_key = {}
+    for item_id in item_ids:
+        entry = indexed_ids.pop(item_id, None)
+        if entry is not None:
+            by_key.setdefault(entry[0], []).append(entry[1])
+    for key, vector_ids in by_key.items():
+        partitions[key].delete(vector_ids)
+
+
+def _add_locked(vectors, item_ids, vector_ids):
+    """Route vectors into their partitions, one add per partition; an item
+    that is already indexed has its previous vector deleted. Caller holds _lock"""
+    global next_id
+    _remove_locked([item_id for item_id in item_ids if item_id in indexed_ids])
+    # Items of shards past retention would be retired right away
+    indexed_ids.update(_route(partitions, vectors, item_ids, vector_ids, *_attributes(item_ids),
+                              cutoff=retention_cutoff()))
+    next_id = max(next_id, max(vector_ids) + 1)
+
+
+def _wal_records(f):
+    """Intact WAL records as (end offset, lsn, op, vector id, item_id, vector)"""
+    while True:
+        header = f.read(WAL_HEADER.size)
+        if len(header) < WAL_HEADER.size:
+            return
+        lsn, crc = WAL_HEADER.unpack(header)
+        fixed = f.read(WAL_BODY.size)
+        if len(fixed) < WAL_BODY.size:
+            return
+        op, vector_id, id_len = WAL_BODY.unpack(fixed)
+        size = id_len + (VECTOR_BYTES if op == WAL_ADD else 0)
+        rest = f.read(size)
+        if len(rest) < size or zlib.crc32(fixed + rest) != crc:
+            return
+        item_id = rest[:id_len].decode("utf-8")
+        vector = None
+        if op == WAL_ADD:
+            vector = np.frombuffer(rest, dtype="float32", offset=id_len).reshape(1, DIM)
+        yield f.tell(), lsn, op, vector_id, item_id, vector
+
+
+def _legacy_wal_records(f):
+    """Records of the row-addressed WAL; their vector ids are allocated on replay"""
+    while True:
+        header = f.read(LEGACY_WAL_HEADER.size)
+        if len(header) < LEGACY_WAL_HEADER.size:
+            return
+        lsn, id_len, crc = LEGACY_WAL_HEADER.unpack(header)
+        payload = f.read(id_len + VECTOR_BYTES)
+        if len(payload) < id_len + VECTOR_BYTES or zlib.crc32(payload) != crc:
+            return
+        item_id = payload[:id_len].decode("utf-8")
+        vector = np.frombuffer(payload, dtype="float32", offset=id_len).reshape(1, DIM)
+        yield f.tell(), lsn, WAL_ADD, None, item_id, vector
+
+
+def _replay_wal(path, records, snapshot_lsn):
+    """Apply WAL records newer than the snapshot; returns the last LSN seen.
+    Items it adds are collected in _replayed_ids.
+
+    A torn or corrupt record at the tail (crash mid-append) ends the replay
+    and is truncated away so later appends start from a clean offset.
+    """
+    last_lsn = snapshot_lsn
+    if not os.path.exists(path):
+        return last_lsn
+
+    replayed = 0
+    good_offset = 0
+    with open(path, 'rb') as f:
+        for good_offset, lsn, op, vector_id, item_id, vector in records(f):
+            if lsn <= snapshot_lsn:
+                continue
+            if op == WAL_DELETE:
+                _remove_locked([item_id])
+                _replayed_ids.discard(item_id)
+            else:
+                vector_ids = [vector_id] if vector_id is not None else _allocate_ids(1)
+                _add_locked(vector, [item_id], vector_ids)
+                _replayed_ids.add(item_id)
+            last_lsn = lsn
+            replayed += 1
+
+    if good_offset < os.path.getsize(path):
+        print(f"Truncating torn WAL tail at offset {good_offset}")
+        with open(path, 'r+b') as f:
+            f.truncate(good_offset)
+
+    print(f"Replayed {replayed} WAL records from {path} on top of snapshot (lsn {snapshot_lsn})")
+    return last_lsn
+
+
+def _live_ids(parts):
+    """item_id -> (partition key, vector id) of every searchable item"""
+    return {
+        item_id: (key, vector_id)
+        for key, part in parts.items()
+        for vector_id, item_id in part.item_ids.items()
+        if vector_id not in part.deleted
+    }
+
+
+# Items added by WAL replay at startup. With WRITE_BEHIND a power loss can
+# keep a WAL record whose item record did not reach the disk;
+# sync_with_database drops those.
+_replayed_ids = set()
+# WAL appends not fsynced yet (WRITE_BEHIND leaves that to sync_wal())
+_wal_unsynced = False
+
+# Global variables. A reader starts empty and loads the writer's latest
+# snapshot with refresh() at the end of this module.
+if not READ_ONLY:
+    claim_writer()
+_manifest = None if READ_ONLY else _read_manifest()
+generation = _manifest["generation"] if _manifest else 0
+snapshot_lsn = _manifest["lsn"] if _manifest else 0
+next_id = _manifest.get("next_id", 0) if _manifest else 0
+# Retired time shards kept in ARCHIVE_DIR: key -> files
+_archived = dict(_manifest.get("archived", {})) if _manifest else {}
+partitions = {} if READ_ONLY else _load_partitions(_manifest, _archived)
+indexed_ids = _live_ids(partitions)
+if READ_ONLY:
+    wal_lsn = 0
+    _wal = None
+else:
+    wal_lsn = max(_replay_wal(LEGACY_WAL_PATH, _legacy_wal_records, snapshot_lsn),
+                  _replay_wal(WAL_PATH, _wal_records, snapshot_lsn))
+    _wal = open(WAL_PATH, 'ab')
+# Reader: offset in _wal after the last record applied
+_wal_offset = 0
+
+
+def ntotal():
+    """Number of searchable vectors across all partitions"""
+    return sum(part.live_count() for part in partitions.values())
+
+
+def _append_wal(first_lsn, records):
+    """Append (op, vector id, item_id, vector or None) records with a single
+    write and fsync (or, with WRITE_BEHIND, a single write)"""
+    global _wal_unsynced
+    chunks = []
+    for lsn, (op, vector_id, item_id, vector) in enumerate(records, start=first_lsn):
+        id_bytes = item_id.encode("utf-8")
+        body = WAL_BODY.pack(op, vector_id, len(id_bytes)) + id_bytes
+        if vector is not None:
+            body += vector.tobytes()
+        chunks.append(WAL_HEADER.pack(lsn, zlib.crc32(body)) + body)
+    _wal.write(b"".join(chunks))
+    _wal.flush()
+    if WRITE_BEHIND:
+        _wal_unsynced = True
+    elif WAL_FSYNC:
+        os.fsync(_wal.fileno())
+
+
+def sync_wal():
+    """Make every WAL append so far durable; returns False if there were
+    none. The fsync runs outside the lock so adds go on meanwhile"""
+    global _wal_unsynced
+    with _lock:
+        if not _wal_unsynced or _wal is None or READ_ONLY:
+            return False
+        _wal_unsynced = False
+        # A snapshot may swap the WAL meanwhile; the new one is fsynced
+        fd = os.dup(_wal.fileno())
+    try:
+        if WAL_FSYNC:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _compact_wal(upto_offset):
+    """Drop WAL records already covered by the latest snapshot.
+
+    Must be called with _lock held; only the records appended while the
+    snapshot was being written are copied into the new log.
+    """
+    global _wal
+    _wal.flush()
+    with open(WAL_PATH, 'rb') as f:
+        f.seek(upto_offset)
+        tail = f.read()
+    tmp_path = WAL_PATH + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(tail)
+        f.flush()
+        os.fsync(f.fileno())
+    _wal.close()
+    os.replace(tmp_path, WAL_PATH)
+    _wal = open(WAL_PATH, 'ab')
+
+
+def _manifest_files(manifest):
+    if not manifest:
+        return set()
+    if "partitions" not in manifest:
+        return {manifest["index"], manifest["id_map"]}
+    return {path for entries in (manifest["partitions"], manifest.get("archived", {}))
+            for files in entries.values() for path in files.values()}
+
+
+def _partition_state(part):
+    """Serialized index and id map of a partition; caller holds _lock"""
+    return faiss.serialize_index(part.index), {
+        "ids": list(part.item_ids),
+        "item_ids": list(part.item_ids.values()),
+        "locations": [part.places.get(vector_id, "") for vector_id in part.item_ids],
+        "created": [None if np.isnan(t) else t for t in
+                    (part.times.get(vector_id, np.nan) for vector_id in part.item_ids)],
+        "deleted": sorted(part.deleted),
+    }
+
+
+def _write_partition(directory, stem, data, id_map):
+    """fsync a partition's index and id map to directory; returns the files"""
+    files = {"index": os.path.join(directory, f"faiss_index.{stem}.index"),
+             "id_map": os.path.join(directory, f"id_map.{stem}.json")}
+    with open(files["index"], 'wb') as f:
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    with open(files["id_map"], 'w') as f:
+        json.dump(id_map, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return files
 
-# Global variables
-index = get_index()
-id_map = get_id_map()
 
 def save_index():
-    """Save FAISS index and ID map to disk"""
-    print(f"Saving FAISS index to {INDEX_PATH}")
-    faiss.write_index(index, INDEX_PATH)
-    
-    print(f"Saving ID map to {ID_MAP_PATH}")
-    with open(ID_MAP_PATH, 'w') as f:
-        json.dump(id_map, f, indent=2)
+    """Snapshot all partitions to disk and compact the WAL. Partitions
+    unchanged since the last snapshot, such as past time shards, keep their
+    files instead of being written again."""
+    global generation, snapshot_lsn, _manifest
+    with _snapshot_lock:
+        # Copy the state under the lock, write it out without blocking adds
+        with _lock:
+            _wal.flush()
+            wal_offset = _wal.tell()
+            files, state = {}, {}
+            for key, part in partitions.items():
+                if part.saved is not None and part.saved[0] == part.version:
+                    files[key] = part.saved[1]
+                else:
+                    state[key] = (part, part.version) + _partition_state(part)
+            archived = dict(_archived)
+            lsn = wal_lsn
+            ids_from = next_id
+            new_generation = generation + 1
+        # The items a snapshot covers must be durable in the item store
+        # first; every one of them was stored before the copy, so syncing
+        # after it covers them all
+        vector_store.sync()
+        fake_db.sync()
+
+        for key, (part, version, data, id_map) in sorted(state.items()):
+            files[key] = _write_partition(DATA_DIR, f"{new_generation}.{key.replace('/', '-')}", data, id_map)
+            print(f"Saved FAISS partition {key} to {files[key]['index']}")
+
+        # The manifest swap is the commit point of the snapshot
+        manifest = {"format": MANIFEST_FORMAT, "shard_days": INDEX_SHARD_DAYS, "generation": new_generation,
+                    "lsn": lsn, "next_id": ids_from, "partitions": files, "archived": archived}
+        tmp_path = MANIFEST_PATH + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, MANIFEST_PATH)
+
+        with _lock:
+            _compact_wal(wal_offset)
+            old_manifest = _manifest
+            _manifest = manifest
+            generation = new_generation
+            snapshot_lsn = lsn
+            for key, (part, version, _, _) in state.items():
+                part.saved = (version, files[key])
+
+        for path in _manifest_files(old_manifest) - _manifest_files(manifest):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _schedule_snapshot():
+    """Start a background snapshot unless one is already running"""
+    global _snapshot_thread
+    with _lock:
+        if _snapshot_thread is not None and _snapshot_thread.is_alive():
+            return
+        _snapshot_thread = threading.Thread(target=save_index, name="faiss-snapshot", daemon=True)
+        _snapshot_thread.start()
+
+def _rebuild_partition(key):
+    """Rebuild a partition as an approximate index without its deleted
+    vectors and swap it in.
+
+    Training and filling run without the lock; vectors added meanwhile are
+    copied over from the current index right before the swap, and ids
+    deleted meanwhile stay hidden until the next compaction, so searches
+    and adds never wait on the build. The swap waits for the searches
+    still running on the old index.
+    """
+    try:
+        with _lock:
+            part = partitions.get(key)
+            if part is None:
+                return
+            n0 = part.index.ntotal
+            vectors, ids = part.vectors(0, n0)
+            dropped = set(part.deleted)
+
+        keep = ~np.isin(ids, np.fromiter(dropped, dtype="int64", count=len(dropped)))
+        print(f"Building approximate index for partition {key} ({int(keep.sum())} vectors)")
+        if keep.any():
+            ann = _prepare(build_index(vectors[keep], ids=ids[keep]))
+        else:
+            ann = new_flat_index(DIM)
+
+        with _lock:
+            if partitions.get(key) is not part:
+                print(f"Partition {key} was retired while it was rebuilt")
+                return
+            # part.index may have been copied out of its memory map meanwhile
+            n1 = part.index.ntotal
+            if n1 > n0:
+                ann.add_with_ids(*part.vectors(n0, n1))
+            part.swap(ann, dropped)
+        print(f"Partition {key} now uses {type(base_index(ann)).__name__}")
+
+        # Persist the new index so a restart does not rebuild it
+        save_index()
+    except Exception as e:
+        print(f"Error building approximate index for partition {key}: {e}")
+    finally:
+        with _lock:
+            _rebuilding.discard(key)
+        _maybe_migrate()
+
+
+def _maybe_migrate():
+    """Start a background migration for a flat partition past
+    ANN_MIN_VECTORS; one at a time, the next starts when it is done"""
+    with _lock:
+        if _rebuilding:
+            return
+        for key, part in partitions.items():
+            if is_flat(part.index) and part.live_count() >= ANN_MIN_VECTORS:
+                _rebuilding.add(key)
+                threading.Thread(target=_rebuild_partition, args=(key,),
+                                 name=f"faiss-migrate-{key}", daemon=True).start()
+                return
+
+
+def _needs_compaction(part):
+    deleted = len(part.deleted)
+    return deleted >= INDEX_COMPACT_MIN_DELETED and deleted >= INDEX_COMPACT_RATIO * part.index.ntotal
+
+
+def compact_index(force=False):
+    """Physically remove deleted vectors from partitions that have enough of
+    them (any, with force). Flat partitions drop them from a copy that is
+    swapped in, so searches keep using the old index meanwhile; approximate
+    ones (HNSW, IVF) are rebuilt without them."""
+    removed = 0
+    for key in list(partitions):
+        with _lock:
+            part = partitions.get(key)
+            if part is None or key in _rebuilding or not part.deleted or not (force or _needs_compaction(part)):
+                continue
+            if not supports_remove(part.index):
+                _rebuilding.add(key)
+            else:
+                # Holding _lock, nothing changes the index while it is copied
+                dropped = list(part.deleted)
+                compacted = faiss.deserialize_index(faiss.serialize_index(part.index))
+                compacted.remove_ids(faiss.IDSelectorBatch(np.array(dropped, dtype="int64")))
+                part.swap(_prepare(compacted), dropped)
+                removed += len(dropped)
+                print(f"Compacted partition {key}: removed {len(dropped)} deleted vectors")
+                continue
+        _rebuild_partition(key)
+    if removed:
+        save_index()
+
+
+def start_compaction(force=False):
+    """Run compact_index on a background thread; returns False without
+    starting one if a compaction is already running"""
+    global _compaction_thread
+    with _lock:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return False
+        _compaction_thread = threading.Thread(target=compact_index, kwargs={"force": force},
+                                              name="faiss-compact", daemon=True)
+        _compaction_thread.start()
+        return True
+
+
+def _maybe_compact():
+    """Start a background compaction when some partition needs one"""
+    with _lock:
+        if any(_needs_compaction(part) for part in partitions.values()):
+            start_compaction()
+
+
+def apply_retention(now=None):
+    """Retire the time shards that ended INDEX_RETENTION_DAYS or more ago.
+
+    With INDEX_RETENTION_ACTION "archive" their files are written to
+    ARCHIVE_DIR and listed in the manifest, so a raised retention restores
+    them at startup; otherwise they are dropped. Their item records stay in
+    the database. Returns the keys of the retired shards.
+    """
+    cutoff = retention_cutoff(now)
+    if cutoff is None or READ_ONLY:
+        return []
+    retired, state = {}, {}
+    with _lock:
+        for key in list(partitions):
+            if shard_span(key)[1] <= cutoff and key not in _rebuilding:
+                part = retired[key] = partitions.pop(key)
+                for item_id in part.item_ids.values():
+                    if indexed_ids.get(item_id, (None,))[0] == key:
+                        del indexed_ids[item_id]
+                if INDEX_RETENTION_ACTION == "archive":
+                    state[key] = _partition_state(part)
+    if not retired:
+        return []
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for key, part in sorted(retired.items()):
+        if key in state:
+            files = _write_partition(ARCHIVE_DIR, key.replace("/", "-"), *state[key])
+            with _lock:
+                _archived[key] = files
+            print(f"Archived index shard {key} ({part.live_count()} items) to {files['index']}")
+        else:
+            print(f"Dropped index shard {key} ({part.live_count()} items)")
+    metrics.increment("index_shards_retired", len(retired))
+    save_index()
+    return sorted(retired)
+
+
+def _maybe_retire():
+    """Start a background retention pass when some time shard has expired"""
+    global _retention_thread
+    cutoff = retention_cutoff()
+    if cutoff is None:
+        return
+    with _lock:
+        if not any(shard_span(key)[1] <= cutoff for key in partitions):
+            return
+        if _retention_thread is not None and _retention_thread.is_alive():
+            return
+        _retention_thread = threading.Thread(target=apply_retention, name="faiss-retention", daemon=True)
+        _retention_thread.start()
+
+
+def shard_stats():
+    """Per-partition counts: live vectors, deleted ones awaiting compaction,
+    index type and span, newest first within each report type"""
+    with _lock:
+        stats = [
+            {"partition": key, "vectors": part.live_count(), "deleted": len(part.deleted),
+             "index": type(base_index(part.index)).__name__, "mapped": part.mapped}
+            for key, part in partitions.items()
+        ]
+        archived = sorted(_archived)
+    stats.sort(key=lambda entry: (entry["partition"].split("/")[0], -shard_span(entry["partition"])[0]))
+    return {"shard_days": INDEX_SHARD_DAYS, "retention_days": INDEX_RETENTION_DAYS,
+            "partitions": stats, "archived": archived}
+
+
+def _follow_wal():
+    """Reader: apply the WAL records the writer appended since the last call.
+
+    After every snapshot the writer replaces the WAL by a new file holding
+    the records the snapshot does not cover. The old file is read to its
+    end before moving on, and records seen twice are skipped by LSN.
+    Caller holds _lock.
+    """
+    global _wal, _wal_offset, wal_lsn
+    while True:
+        if _wal is None:
+            if not os.path.exists(WAL_PATH):
+                return
+            _wal, _wal_offset = open(WAL_PATH, 'rb'), 0
+        try:
+            replaced = os.stat(WAL_PATH).st_ino != os.fstat(_wal.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = False
+        _wal.seek(_wal_offset)
+        for end, lsn, op, vector_id, item_id, vector in _wal_records(_wal):
+            _wal_offset = end
+            if lsn <= wal_lsn:
+                continue
+            if op == WAL_DELETE:
+                _remove_locked([item_id])
+            else:
+                _add_locked(vector, [item_id], [vector_id])
+            wal_lsn = lsn
+        if not replaced:
+            return
+        _wal.close()
+        _wal = None
+
+
+def _reload(manifest):
+    """Reader: swap in a snapshot generation the writer committed"""
+    global _manifest, generation, snapshot_lsn, partitions, indexed_ids, wal_lsn, _wal
+    parts = _load_partitions(manifest)
+    ids = _live_ids(parts)
+    with _lock:
+        if _wal is not None:
+            _wal.close()
+        _manifest, generation, snapshot_lsn = manifest, manifest["generation"], manifest["lsn"]
+        partitions, indexed_ids, wal_lsn, _wal = parts, ids, manifest["lsn"], None
+        _follow_wal()
+
+
+def refresh():
+    """Reader: move to the writer's newest snapshot generation, if any, and
+    apply the WAL records appended since, without blocking searches while a
+    new generation is loaded"""
+    manifest = _read_manifest()
+    if manifest and manifest.get("format") == MANIFEST_FORMAT and manifest["generation"] != generation:
+        try:
+            _reload(manifest)
+            print(f"Loaded index generation {generation} ({ntotal()} items)")
+            return
+        except (OSError, RuntimeError) as e:
+            # Superseded and removed by a newer snapshot meanwhile
+            print(f"Skipping index generation {manifest['generation']}: {e}")
+    with _lock:
+        _follow_wal()
+
+
+def _read_watermark():
+    if os.path.exists(WATERMARK_PATH):
+        with open(WATERMARK_PATH, 'r') as f:
+            return json.load(f).get("created_at")
+    return None
+
+
+def _write_watermark(created_at):
+    tmp_path = WATERMARK_PATH + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"created_at": created_at}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, WATERMARK_PATH)
+
 
 def sync_with_database():
-    """Sync FAISS index with database items"""
+    """Sync FAISS index with database items.
+
+    Only items created since the last sync's watermark are read; a full
+    scan happens when there is no watermark or no index snapshot, and also
+    drops indexed items the database no longer has. Resolved items are
+    removed from the index.
+    """
     print("Syncing FAISS index with database...")
-    
+
     try:
-        # Get all items from database
-        db_items = get_all_items()
-        print(f"Found {len(db_items)} items in database")
-        
-        # Load existing index and ID map first
-        global index, id_map
-        current_index = get_index()
-        current_id_map = get_id_map()
-        
-        print(f"Current index has {current_index.ntotal} items")
-        print(f"Current ID map has {len(current_id_map)} items")
-        
-        # Check if we need to rebuild index
-        db_item_ids = {item['item_id'] for item in db_items if 'item_id' in item}
-        indexed_item_ids = set(current_id_map)
-        
-        # Find items that are in database but not in index
+        started = datetime.utcnow()
+        watermark = _read_watermark() if _manifest is not None else None
+        if watermark:
+            db_items = get_items_since(watermark)
+            print(f"Found {len(db_items)} items in database created since {watermark}")
+        else:
+            db_items = get_all_items()
+            print(f"Found {len(db_items)} items in database")
+
+        print(f"Current index has {ntotal()} items in {len(partitions)} partitions")
+
+        # Find items that are in database but not in index, and resolved
+        # items that are still searchable
+        # items of time shards past retention are not missing
+        cutoff = retention_cutoff()
         missing_items = []
+        stale_ids = []
         for item in db_items:
-            if item.get('item_id') not in indexed_item_ids and 'embedding' in item and item['embedding']:
-                missing_items.append(item)
-        
+            if item.get('status') == 'resolved':
+                if item.get('item_id') in indexed_ids:
+                    stale_ids.append(item['item_id'])
+            elif item.get('item_id') not in indexed_ids and item.get('embedding_row') is not None:
+                if cutoff is None or shard_span(shard_key(partition_key(item['item_id']),
+                                                          epoch(item.get('created_at'))))[1] > cutoff:
+                    missing_items.append(item)
+        if not watermark:
+            db_ids = {item.get('item_id') for item in db_items}
+            stale_ids.extend(item_id for item_id in list(indexed_ids) if item_id not in db_ids)
+        else:
+            # Replayed WAL entries whose record was lost, and snapshotted
+            # items the item store dropped on open because their vectors were
+            suspects = set(_replayed_ids) | get_lost_item_ids()
+            known = get_item_fields(list(suspects), ("item_id",)) if suspects else {}
+            stale_ids.extend(item_id for item_id in suspects
+                             if item_id in indexed_ids and item_id not in known)
+        _replayed_ids.clear()
+
         print(f"Found {len(missing_items)} items not in index")
-        
-        # Only rebuild if there are missing items or index is empty
-        if missing_items or current_index.ntotal == 0:
-            if current_index.ntotal == 0:
-                print("Index is empty, creating new index...")
-                new_index = faiss.IndexFlatIP(DIM)
-                new_id_map = []
-            else:
-                print("Adding missing items to existing index...")
-                new_index = current_index
-                new_id_map = current_id_map.copy()
-            
-            # Add missing items to index
-            for item in missing_items:
-                try:
-                    vector = np.array(item['embedding']).astype("float32")
-                    new_index.add(vector)
-                    new_id_map.append(item['item_id'])
-                    print(f"Added item {item['item_id']} to index")
-                except Exception as e:
-                    print(f"Error adding item {item['item_id']}: {e}")
-            
-            # Replace global variables
-            index = new_index
-            id_map = new_id_map
-            
+
+        if stale_ids:
+            print(f"Removing {len(stale_ids)} resolved or deleted items from index")
+            remove_vectors(stale_ids)
+
+        # Earlier layouts (single index, row-addressed partitions, legacy WAL,
+        # other time shards) are rewritten as id-keyed time shards, and
+        # restored archives are written back
+        needs_migration = os.path.exists(LEGACY_WAL_PATH) or (
+            ntotal() > 0 and (_manifest is None or not _same_layout(_manifest))) or (
+            _manifest is not None and _archived != _manifest.get("archived", {}))
+
+        if missing_items or needs_migration:
+            print("Adding missing items to existing index...")
+            if missing_items:
+                # One gather from the vector store, one add per partition
+                vectors = vector_store.get_rows([item['embedding_row'] for item in missing_items])
+                with _lock:
+                    _add_locked(vectors, [item['item_id'] for item in missing_items],
+                                _allocate_ids(len(missing_items)))
+                print(f"Added {len(missing_items)} items to index")
+
             # Save to disk
             save_index()
-            print(f"Sync complete: {len(new_id_map)} items in index")
+            if os.path.exists(LEGACY_WAL_PATH):
+                os.remove(LEGACY_WAL_PATH)
+            print(f"Sync complete: {ntotal()} items in index")
         else:
             print("Index is already up to date")
-        
+
+        # Everything created before the sync started is now durable in the index
+        _write_watermark((started - WATERMARK_SLACK).isoformat())
+
     except Exception as e:
         print(f"Error syncing with database: {e}")
 
 def add_vector(vector, item_id):
-    """Add vector to FAISS index and save to disk"""
-    global index, id_map
-    
-    vector = np.array([vector]).astype("float32")
-    index.add(vector)
-    id_map.append(item_id)
-    
-    # Save after each addition
-    save_index()
-    print(f"Added vector for {item_id}, total items: {len(id_map)}")
+    """Add vector to its FAISS partition and append it to the WAL"""
+    add_vectors([vector], [item_id])
+    log.debug("Added vector for %s", item_id)
+
+def update_vector(vector, item_id):
+    """Replace the vector of an item, or add it if it is not indexed yet"""
+    add_vectors([vector], [item_id], replace=True)
+    log.debug("Updated vector for %s", item_id)
+
+@metrics.timed("persist_index")
+def add_vectors(vectors, item_ids, replace=False):
+    """Bulk add: one WAL write + fsync and one index add per partition.
+
+    Ids that are already indexed are skipped, so re-running an interrupted
+    batch is safe; with replace=True their vectors are replaced instead.
+    Returns the number of vectors added.
+    """
+    global wal_lsn
+
+    vectors = np.asarray(vectors, dtype="float32").reshape(-1, DIM)
+    with _lock:
+        rows, seen = [], set()
+        for row, item_id in enumerate(item_ids):
+            if (replace or item_id not in indexed_ids) and item_id not in seen:
+                rows.append(row)
+                seen.add(item_id)
+        if not rows:
+            return 0
+        vectors = np.ascontiguousarray(vectors[rows])
+        item_ids = [item_ids[row] for row in rows]
+        vector_ids = _allocate_ids(len(item_ids))
+        _append_wal(wal_lsn + 1, [
+            (WAL_ADD, vector_id, item_id, vector)
+            for vector_id, item_id, vector in zip(vector_ids, item_ids, vectors)
+        ])
+        wal_lsn += len(item_ids)
+        _add_locked(vectors, item_ids, vector_ids)
+        pending = wal_lsn - snapshot_lsn
+
+    # Snapshot in the background instead of rewriting the index on every add
+    if pending >= WAL_SNAPSHOT_EVERY:
+        _schedule_snapshot()
+    _maybe_migrate()
+    _maybe_retire()
+    if replace:
+        _maybe_compact()
+    return len(item_ids)
+
+def remove_vector(item_id):
+    """Drop an item from search; returns False if it was not indexed"""
+    return remove_vectors([item_id]) == 1
+
+def remove_vectors(item_ids):
+    """Hide items from search at once and log the deletion to the WAL.
+
+    Their vectors stay in the index until compaction reclaims the space.
+    Returns the number of items removed.
+    """
+    global wal_lsn
+
+    with _lock:
+        item_ids = [item_id for item_id in dict.fromkeys(item_ids) if item_id in indexed_ids]
+        if not item_ids:
+            return 0
+        _append_wal(wal_lsn + 1, [
+            (WAL_DELETE, indexed_ids[item_id][1], item_id, None) for item_id in item_ids
+        ])
+        wal_lsn += len(item_ids)
+        _remove_locked(item_ids)
+        pending = wal_lsn - snapshot_lsn
+
+    if pending >= WAL_SNAPSHOT_EVERY:
+        _schedule_snapshot()
+    _maybe_compact()
+    return len(item_ids)
+
+def search_vectors(query_vector, top_k, report_type=None, category=None, location=None,
+                   since=None, until=None, stop_after=None):
+    """Search vectors in FAISS index.
+
+    With report_type ("lost"/"found") only that type's partitions are
+    searched, and category further restricts them, so top_k is taken over
+    eligible items only. Without it every partition is searched and the
+    results merged. location (normalized like the stored ones) and a
+    since/until window on created_at (ISO strings or datetimes) narrow the
+    candidates the same way; time shards outside the window are skipped.
+    Shards are searched newest first; with stop_after=(count, min_score)
+    older ones are skipped once count hits score min_score or more.
+    Deleted items are never returned.
+    """
+    return search_vectors_batch([query_vector], top_k, report_type, category, location, since, until,
+                                stop_after)[0]
+
+@metrics.timed("search")
+def search_vectors_batch(query_vectors, top_k, report_type=None, category=None, location=None,
+                         since=None, until=None, stop_after=None):
+    """search_vectors for many queries (n x DIM) with one index search per
+    partition; returns one result list per query. With stop_after, older
+    shards are skipped once every query has its count of hits. Searches
+    run concurrently with each other and with adds to other partitions."""
+    query_vectors = np.ascontiguousarray(np.asarray(query_vectors, dtype="float32").reshape(-1, DIM))
+    # A location naming no place ("", "near the entrance") does not filter
+    place = normalize_location(location) or None
+    window = None
+    if since is not None or until is not None:
+        window = (None if since is None else epoch(since), None if until is None else epoch(until))
+    lo = -np.inf if window is None or window[0] is None else window[0]
+    hi = np.inf if window is None or window[1] is None else window[1]
+    cutoff = retention_cutoff()
+    with _lock:
+        shards = []
+        for key, part in partitions.items():
+            kind, _, day = key.partition("/")
+            start, end = shard_span(key)
+            if report_type is not None and kind != report_type.upper():
+                continue
+            # Undated items never pass a time filter
+            if end <= lo or start > hi or (window is not None and day == UNDATED):
+                continue
+            if cutoff is not None and end <= cutoff:
+                continue
+            # A shard wholly inside the window needs no time filter
+            shards.append((start, part, None if lo <= start and end <= hi else window))
+    shards.sort(key=lambda shard: shard[0], reverse=True)
+
+    # Searched without _lock: partitions swapped or retired meanwhile are
+    # still whole, and adds only wait for the partition they go to
+    hits = [[] for _ in query_vectors]
+    confident = np.zeros(len(query_vectors), dtype="int64")
+    searched = 0
+    for start, part, part_window in shards:
+        # Shards of the same week (LOST and FOUND) are searched together
+        if stop_after is not None and searched and start < shards[searched - 1][0] \
+                and (confident >= stop_after[0]).all():
+            break
+        for row, part_hits in enumerate(part.search(query_vectors, top_k, category, place, part_window)):
+            hits[row].extend(part_hits)
+            if stop_after is not None:
+                confident[row] += sum(score >= stop_after[1] for _, score in part_hits)
+        searched += 1
+
+    metrics.increment("index_shards_searched", searched)
+    if searched < len(shards):
+        metrics.increment("search_early_stops")
+
+    if not any(hits):
+        log.debug("FAISS index has no eligible items")
 
-def search_vectors(query_vector, top_k):
-    """Search vectors in FAISS index"""
-    if index.ntotal == 0:
-        print("FAISS index is empty")
-        return []
-    
-    query_vector = np.array([query_vector]).astype("float32")
-    scores, indices = index.search(query_vector, top_k)
-    
     results = []
-    # Handle different FAISS return formats
-    if len(indices.shape) == 1:
-        # Single query results
-        for idx, score in zip(indices, scores):
-            if idx < len(id_map):
-                results.append({
-                    "item_id": id_map[idx],
-                    "score": float(score)
-                })
-    else:
-        # Multiple query results (shouldn't happen with single query)
-        for idx, score in zip(indices[0], scores[0]):
-            if idx < len(id_map):
-                results.append({
-                    "item_id": id_map[idx],
-                    "score": float(score)
-                })
-    
-    print(f"FAISS search returned {len(results)} results")
+    for row_hits in hits:
+        row_hits.sort(key=lambda hit: hit[1], reverse=True)
+        results.append([{"item_id": item_id, "score": score} for item_id, score in row_hits[:top_k]])
+
+    log.debug("FAISS search returned %d result lists", len(results))
     return results
 
-# Initialize sync with database on startup
-print("Initializing FAISS index...")
-sync_with_database()
+if READ_ONLY:
+    print("Opening FAISS index read-only")
+    refresh()
+else:
+    # Initialize sync with database on startup
+    print("Initializing FAISS index...")
+    sync_with_database()
+    apply_retention()
+    _maybe_migrate()
+    _maybe_compact()
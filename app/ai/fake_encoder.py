@@ -0,0 +1,52 @@
+import hashlib
+import time
+import numpy as np
+from app.config import EMBEDDING_DIM, FAKE_ENCODER_BATCH_MS, FAKE_ENCODER_ITEM_MS
+
+# Deterministic, torch-free stand-in for clip_backend with the same
+# interface. Images are downscaled to 32x32 and projected with a fixed
+# random matrix, so similar pictures get similar embeddings; texts get a
+# vector seeded by their hash. Same input, same embedding, on any machine.
+PIXELS = 32
+device = "cpu"
+_projection = None
+
+
+def load():
+    global _projection
+    print("Loading fake encoder")
+    rng = np.random.default_rng(0)
+    _projection = rng.standard_normal((PIXELS * PIXELS * 3, EMBEDDING_DIM)).astype("float32")
+
+
+def preprocess(image):
+    """PIL image -> flattened 32x32 RGB array in [0, 1]"""
+    small = image.resize((PIXELS, PIXELS))
+    return np.asarray(small, dtype="float32").reshape(-1) / 255.0
+
+
+def _simulate_cost(n):
+    delay_ms = FAKE_ENCODER_BATCH_MS + FAKE_ENCODER_ITEM_MS * n
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+
+
+def _normalize(emb):
+    return emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+
+
+def encode_image_batch(images):
+    _simulate_cost(len(images))
+    pixels = np.stack(images)
+    emb = (pixels - pixels.mean(axis=1, keepdims=True)) @ _projection
+    return list(_normalize(emb))
+
+
+def encode_text_batch(texts):
+    _simulate_cost(len(texts))
+    emb = np.stack([
+        np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little"))
+        .standard_normal(EMBEDDING_DIM).astype("float32")
+        for text in texts
+    ])
+    return list(_normalize(emb))
@@ -1,7 +1,48 @@
 import numpy as np
+from app import metrics
 from app.config import IMAGE_WEIGHT, TEXT_WEIGHT
 
 def fuse_embeddings(image_emb, text_emb):
     fused = IMAGE_WEIGHT * image_emb + TEXT_WEIGHT * text_emb
     fused = fused / np.linalg.norm(fused)
     return fused
+
+def text_prompt(description, location):
+    """Text fed to CLIP for an item"""
+    return f"a photo of {description} at {location}"
+
+def has_text_signal(description):
+    """Very short descriptions carry no signal"""
+    return len(description.strip()) >= 5
+
+@metrics.timed("fusion")
+def item_embedding(image_emb, text_emb, description):
+    """Adaptive fusion: very short descriptions carry no signal, use the image only"""
+    if not has_text_signal(description):
+        return image_emb
+    return fuse_embeddings(image_emb, text_emb)
+
+def fusion_weights(description, image_weight=None, text_weight=None):
+    """(image, text) weights of a query's re-rank, normalized to sum to 1.
+
+    Per-query weights override IMAGE_WEIGHT/TEXT_WEIGHT (one given alone
+    implies the other); a query with a short description is image-only.
+    """
+    if not has_text_signal(description):
+        return 1.0, 0.0
+    if image_weight is None and text_weight is None:
+        image_weight, text_weight = IMAGE_WEIGHT, TEXT_WEIGHT
+    elif text_weight is None:
+        text_weight = 1.0 - image_weight
+    elif image_weight is None:
+        image_weight = 1.0 - text_weight
+    total = image_weight + text_weight
+    if image_weight < 0 or text_weight < 0 or total <= 0:
+        raise ValueError("Fusion weights must be non-negative and not both zero")
+    return image_weight / total, text_weight / total
+
+def late_fusion_scores(image_sim, text_sim, has_text, weights):
+    """Weighted image + text similarity of each candidate; candidates
+    without a text embedding are scored on the image alone"""
+    image_weight, text_weight = weights
+    return np.where(has_text, image_weight * image_sim + text_weight * text_sim, image_sim)
@@ -0,0 +1,44 @@
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from app.config import IMAGE_DECODE_MIN_SIDE
+
+# Downloaded photos are often 12 MP or more while CLIP looks at 224x224, so
+# they are decoded no larger than needed. JPEGs are decoded at 1/2 to 1/8
+# scale straight from their DCT coefficients (the full-size bitmap is never
+# allocated); other formats, whose Pillow decoders cannot scale (PNG, WebP),
+# are decoded in full and box-reduced by an integer factor, which is much
+# cheaper than the bicubic resize of preprocessing over the full image.
+
+
+def decode_rgb(data: bytes, min_side=IMAGE_DECODE_MIN_SIDE):
+    """Decode image bytes to RGB with the shorter side reduced towards, but
+    not below, min_side (0: full size)"""
+    image = Image.open(BytesIO(data))
+    if min_side:
+        # No-op for formats other than JPEG
+        image.draft("RGB", (min_side, min_side))
+    # Decode here, so that corrupt data fails inside the caller's try
+    image.load()
+    if image.mode != "RGB":
+        # convert() to the same mode would copy the full-size bitmap
+        image = image.convert("RGB")
+    factor = min(image.size) // min_side if min_side else 1
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+
+def dhash(image):
+    """64-bit difference hash of an image: one bit per horizontally adjacent
+    pixel pair of a 9x8 grayscale thumbnail (set where the left one is
+    brighter). Re-encoded, rescaled or slightly recompressed copies of a
+    photo differ in a few bits; different photos in about half of them."""
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype="int16")
+    bits = np.packbits(pixels[:, :-1] > pixels[:, 1:])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def hash_distance(a, b):
+    """Number of differing bits of two image hashes"""
+    return bin(a ^ b).count("1")
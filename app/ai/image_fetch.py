@@ -0,0 +1,93 @@
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.config import IMAGE_FETCH_TIMEOUT, IMAGE_MAX_BYTES, HTTP_POOL_CONNECTIONS
+from app import metrics
+
+
+class ImageFetchError(ValueError):
+    """The image could not be downloaded (bad URL, HTTP error, too large)"""
+
+
+# Shared keep-alive pools: one for sync callers, one for the event loop
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_CONNECTIONS))
+_session.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_CONNECTIONS))
+_async_client = None
+
+
+def _check_length(headers):
+    length = headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > IMAGE_MAX_BYTES:
+        raise ImageFetchError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+
+
+def fetch_image_bytes(url: str) -> bytes:
+    """Download an image over the shared session, capped at IMAGE_MAX_BYTES"""
+    with metrics.timer("fetch"):
+        try:
+            return _fetch(url)
+        except ImageFetchError:
+            metrics.increment("image_fetch_errors")
+            raise
+
+
+def _fetch(url):
+    try:
+        with _session.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            _check_length(response.headers)
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > IMAGE_MAX_BYTES:
+                    raise ImageFetchError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+            return bytes(data)
+    except requests.RequestException as e:
+        raise ImageFetchError(str(e))
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=IMAGE_FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_CONNECTIONS,
+            ),
+        )
+    return _async_client
+
+
+async def fetch_image_bytes_async(url: str) -> bytes:
+    """Async variant of fetch_image_bytes that never blocks a worker thread"""
+    with metrics.timer("fetch"):
+        try:
+            return await _fetch_async(url)
+        except ImageFetchError:
+            metrics.increment("image_fetch_errors")
+            raise
+
+
+async def _fetch_async(url):
+    try:
+        async with get_async_client().stream("GET", url) as response:
+            response.raise_for_status()
+            _check_length(response.headers)
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > IMAGE_MAX_BYTES:
+                    raise ImageFetchError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+            return bytes(data)
+    except httpx.HTTPError as e:
+        raise ImageFetchError(str(e))
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
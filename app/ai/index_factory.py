@@ -0,0 +1,88 @@
+import math
+import faiss
+from app.config import ANN_INDEX_FACTORY, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, IVF_NPROBE
+
+# Search-time knobs, adjustable at runtime with set_search_params
+search_params = {"nprobe": IVF_NPROBE, "efSearch": HNSW_EF_SEARCH}
+
+
+def set_search_params(nprobe=None, ef_search=None):
+    """Tune recall vs latency of approximate partitions without a rebuild"""
+    if nprobe is not None:
+        search_params["nprobe"] = int(nprobe)
+    if ef_search is not None:
+        search_params["efSearch"] = int(ef_search)
+    return dict(search_params)
+
+
+def new_flat_index(dim):
+    """Empty exact index addressed by int64 vector ids"""
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def base_index(index):
+    """The index an IndexIDMap2 wraps, or index itself"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def is_flat(index):
+    return isinstance(base_index(index), faiss.IndexFlat)
+
+
+def factory_key(n, factory=ANN_INDEX_FACTORY):
+    """Resolve the "{nlist}" placeholder of an IVF factory string for n vectors"""
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    return factory.format(nlist=nlist)
+
+
+def build_index(vectors, factory=ANN_INDEX_FACTORY, ids=None):
+    """Train (if needed) and fill an approximate index from float32 vectors.
+
+    With ids the index is wrapped in an IndexIDMap2 keyed by them.
+    """
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_key(n, factory), faiss.METRIC_INNER_PRODUCT)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    if ids is None:
+        index.add(vectors)
+        return index
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(vectors, ids)
+    return index
+
+
+def supports_remove(index):
+    """Whether remove_ids works in place. Only a flat index qualifies: the
+    IndexIDMap2 around it expects the remaining rows to be renumbered, which
+    IVF lists do not do, and HNSW graphs cannot drop nodes at all."""
+    return is_flat(index)
+
+
+def _hnsw(index):
+    index = base_index(index)
+    return index.hnsw if hasattr(index, "hnsw") else None
+
+
+def make_search_params(index, selector=None, nprobe=None, ef_search=None):
+    """SearchParameters for index carrying the tuning knobs and an optional
+    IDSelector, or None when there is nothing to pass"""
+    if faiss.try_extract_index_ivf(index) is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or search_params["nprobe"]
+    elif _hnsw(index) is not None:
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or search_params["efSearch"]
+    elif selector is None:
+        return None
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
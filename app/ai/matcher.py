@@ -1,6 +1,15 @@
-from app.ai.faiss_index import search_vectors, add_vector
-from app.config import SCORE_THRESHOLD
-from app.db.fake_db import get_all_items, update_item_embedding
+import logging
+import numpy as np
+from app import metrics
+from app.ai.faiss_index import search_vectors_batch, add_vector, update_vector
+from app.ai.fusion import late_fusion_scores
+from app.config import (
+    SCORE_THRESHOLD, RERANK, RERANK_CANDIDATES, IMAGE_WEIGHT, TEXT_WEIGHT, SEARCH_EARLY_STOP_SCORE
+)
+from app.db import vector_store
+from app.db.fake_db import get_items_by_ids, update_item_embedding
+
+log = logging.getLogger(__name__)
 
 def confidence_label(score):
     if score >= 0.75:
@@ -10,74 +19,151 @@ def confidence_label(score):
     else:
         return "Low"
 
-def find_matches(query_embedding, top_k, report_type=None):
+# Items a query of each report type should be matched against
+OPPOSITE_TYPE = {"lost": "found", "found": "lost"}
+
+# How a report's location narrows its matches: not at all, same place
+# first (nearby_first), or same place only
+LOCATION_SCOPES = ("any", "nearby", "same")
+
+def _modality_sims(rows, query):
+    """Similarity of query to the stored rows that are not None, 0 elsewhere"""
+    sims = np.zeros(len(rows), dtype="float32")
+    present = np.array([row is not None for row in rows], dtype=bool)
+    if query is not None and present.any():
+        sims[present] = vector_store.get_rows([row for row in rows if row is not None]) @ query
+    return sims, present
+
+
+@metrics.timed("rerank")
+def rerank(candidates, item_details, image_embedding, text_embedding, weights):
+    """Re-score ANN candidates from their image and text embeddings.
+
+    One gather per modality and one matrix-vector product each over the
+    whole candidate set. Returns the candidates sorted by the new score.
+    """
+    image_rows = [item_details.get(r["item_id"], {}).get("image_embedding_row") for r in candidates]
+    text_rows = [item_details.get(r["item_id"], {}).get("text_embedding_row") for r in candidates]
+    image_query = np.asarray(image_embedding, dtype="float32").ravel()
+    text_query = np.asarray(text_embedding, dtype="float32").ravel() if text_embedding is not None else None
+    image_sim, has_image = _modality_sims(image_rows, image_query)
+    text_sim, has_text = _modality_sims(text_rows, text_query)
+
+    fused = np.array([r["score"] for r in candidates], dtype="float32")
+    scores = np.where(has_image, late_fusion_scores(image_sim, text_sim, has_text, weights), fused)
+    order = np.argsort(-scores, kind="stable")
+    return [{"item_id": candidates[i]["item_id"], "score": float(scores[i])} for i in order]
+
+
+def _match_results(raw_results, item_details):
+    """Hydrated matches at or above SCORE_THRESHOLD"""
+    final_results = []
+    for r in raw_results:
+        if r["score"] < SCORE_THRESHOLD:
+            continue
+        # Get full item details from database
+        item_detail = item_details.get(r["item_id"])
+        if item_detail:
+            final_results.append({
+                "item_id": r["item_id"],
+                "itemType": item_detail.get("itemType", ""),
+                "description": item_detail.get("description", ""),
+                "location": item_detail.get("location", ""),
+                "reportType": item_detail.get("reportType", ""),
+                "imageUrl": item_detail.get("imageUrl", ""),
+                "score": round(r["score"],3),
+                "confidence": confidence_label(r["score"]),
+                "reason": "Image and description are semantically similar"
+            })
+    return final_results
+
+def _ranked_matches(raw_results, top_k, two_stage, image_embeddings, text_embeddings, weights):
+    """Hydrate (one lookup for all queries), re-rank and threshold the raw
+    search results of each query"""
+    # Fetch details only for the ids FAISS returned
+    with metrics.timer("hydration"):
+        item_details = get_items_by_ids(list(dict.fromkeys(
+            r["item_id"] for hits in raw_results for r in hits
+        )))
+
+    matches = []
+    for i, hits in enumerate(raw_results):
+        if two_stage and hits and image_embeddings[i] is not None:
+            hits = rerank(hits, item_details, image_embeddings[i],
+                          text_embeddings[i] if text_embeddings is not None else None,
+                          (weights[i] if weights is not None else None) or (IMAGE_WEIGHT, TEXT_WEIGHT))
+        matches.append(_match_results(hits[:top_k], item_details))
+    return matches
+
+def find_matches(query_embedding, top_k, report_type=None, category=None,
+                 image_embedding=None, text_embedding=None, weights=None,
+                 location=None, nearby_first=False, since=None, until=None):
+    """Match a query against the index.
+
+    report_type is the type of the query item: a "lost" query searches only
+    FOUND items and vice versa, with the filter applied inside the index so
+    top_k is computed over eligible items only. location and since/until
+    (created_at window) are prefilters pushed into the index the same way;
+    with nearby_first the location only ranks matches at the same place
+    ahead of the rest instead of excluding other places.
+
+    Given the query's image embedding (and text embedding, unless the
+    query is image-only), RERANK_CANDIDATES candidates are fetched by the
+    fused query_embedding and re-ranked with the (image, text) weights.
+    Time shards are searched newest first, and older ones are skipped once
+    top_k candidates score SEARCH_EARLY_STOP_SCORE or more, if it is set.
+    """
+    return find_matches_batch(
+        [query_embedding], top_k, report_type, category,
+        image_embeddings=None if image_embedding is None else [image_embedding],
+        text_embeddings=[text_embedding], weights=[weights],
+        location=location, nearby_first=nearby_first, since=since, until=until
+    )[0]
+
+def find_matches_batch(query_embeddings, top_k, report_type=None, category=None,
+                       image_embeddings=None, text_embeddings=None, weights=None,
+                       location=None, nearby_first=False, since=None, until=None):
+    """find_matches for many queries of the same report type: one index
+    search and one hydration for all of them (two searches for
+    nearby_first). The optional per-query lists (image_embeddings,
+    text_embeddings, weights) may hold None entries. Returns one match list
+    per query."""
     try:
-        raw_results = search_vectors(query_embedding, top_k)
-        print(f"Raw results from search: {raw_results}")
-        
-        # Get all items from database to fetch full details
-        db_items = get_all_items()
-        item_details = {item['item_id']: item for item in db_items}
-        
-        final_results = []
-        for r in raw_results:
-            print(f"Processing result: {r}")
-            if isinstance(r, dict) and "score" in r and r["score"] >= SCORE_THRESHOLD:
-                # If report_type is specified, only return matches of opposite type
-                if report_type is None:
-                    # Get full item details from database
-                    item_detail = item_details.get(r["item_id"])
-                    if item_detail:
-                        final_results.append({
-                            "item_id": r["item_id"],
-                            "itemType": item_detail.get("itemType", ""),
-                            "description": item_detail.get("description", ""),
-                            "location": item_detail.get("location", ""),
-                            "reportType": item_detail.get("reportType", ""),
-                            "imageUrl": item_detail.get("imageUrl", ""),
-                            "score": round(r["score"],3),
-                            "confidence": confidence_label(r["score"]),
-                            "reason": "Image and description are semantically similar"
-                        })
-                else:
-                    # For lost items, only return found items
-                    # For found items, only return lost items
-                    item_id = r["item_id"]
-                    item_type = item_id.split('-')[0]  # Extract LOST or FOUND from ID
-                    print(f"Filtering: report_type={report_type}, item_id={item_id}, item_type={item_type}")
-                    
-                    if (report_type == "lost" and item_type == "FOUND") or \
-                       (report_type == "found" and item_type == "LOST"):
-                        print(f"Adding match: {item_id}")
-                        # Get full item details from database
-                        item_detail = item_details.get(r["item_id"])
-                        if item_detail:
-                            final_results.append({
-                                "item_id": r["item_id"],
-                                "itemType": item_detail.get("itemType", ""),
-                                "description": item_detail.get("description", ""),
-                                "location": item_detail.get("location", ""),
-                                "reportType": item_detail.get("reportType", ""),
-                                "imageUrl": item_detail.get("imageUrl", ""),
-                                "score": round(r["score"],3),
-                                "confidence": confidence_label(r["score"]),
-                                "reason": "Image and description are semantically similar"
-                            })
-                    else:
-                        print(f"Skipping match: {item_id} (report_type={report_type}, item_type={item_type})")
-
-        return final_results
+        search_type = OPPOSITE_TYPE.get(report_type) if report_type is not None else None
+        two_stage = RERANK and image_embeddings is not None
+        fetch_k = max(top_k, RERANK_CANDIDATES) if two_stage else top_k
+        filters = {"report_type": search_type, "category": category, "since": since, "until": until}
+        # Older time shards are not searched once top_k confident matches are in
+        if SEARCH_EARLY_STOP_SCORE is not None:
+            filters["stop_after"] = (top_k, SEARCH_EARLY_STOP_SCORE)
+        raw_results = search_vectors_batch(query_embeddings, fetch_k, location=location, **filters)
+        log.debug("Raw results from search: %s", raw_results)
+        matches = _ranked_matches(raw_results, top_k, two_stage, image_embeddings, text_embeddings, weights)
+
+        # Matches from any place fill up what the same place leaves open
+        if location and nearby_first and any(len(found) < top_k for found in matches):
+            wider = search_vectors_batch(query_embeddings, fetch_k, **filters)
+            for hits, more in zip(raw_results, wider):
+                seen = {r["item_id"] for r in hits}
+                more[:] = [r for r in more if r["item_id"] not in seen]
+            more_matches = _ranked_matches(wider, top_k, two_stage, image_embeddings, text_embeddings, weights)
+            matches = [found + more[:top_k - len(found)] for found, more in zip(matches, more_matches)]
+
+        metrics.increment("matches_returned", sum(len(found) for found in matches))
+        return matches
     except Exception as e:
-        print(f"Error in find_matches: {e}")
-        return []
+        log.exception("Error in find_matches: %s", e)
+        return [[] for _ in query_embeddings]
 
 def store_embedding(item_id, embedding):
     """Store embedding in MongoDB for an item"""
     try:
         success = update_item_embedding(item_id, embedding)
         if success:
-            print(f"Stored embedding for {item_id}")
+            # Searches see the new embedding instead of the old one
+            update_vector(embedding, item_id)
+            log.debug("Stored embedding for %s", item_id)
         else:
-            print(f"Failed to store embedding for {item_id}")
+            log.warning("Failed to store embedding for %s", item_id)
     except Exception as e:
-        print(f"Error storing embedding for {item_id}: {e}")
+        log.exception("Error storing embedding for %s: %s", item_id, e)
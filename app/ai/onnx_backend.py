@@ -0,0 +1,125 @@
+import os
+import clip
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+from app.config import CLIP_BACKEND, CLIP_ONNX_DIR, CLIP_INTRA_OP_THREADS, CLIP_INTER_OP_THREADS
+
+# CLIP ViT-B/32 as two ONNX graphs (image and text tower) run by
+# onnxruntime on CPU; loaded by clip_model.load_model(). The graphs are
+# exported from the torch model into CLIP_ONNX_DIR on first load and reused
+# afterwards. With CLIP_BACKEND "onnx-int8" their weights are additionally
+# quantized to int8 (dynamic activation scales), also once.
+QUANTIZED = CLIP_BACKEND == "onnx-int8"
+IMAGE_GRAPH = "image.onnx"
+TEXT_GRAPH = "text.onnx"
+OPSET = 17
+
+# Preprocessing of the CLIP release: bicubic resize of the short side and
+# center crop to 224, RGB scaled to [0, 1] and normalized per channel
+INPUT_SIZE = 224
+MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype="float32").reshape(3, 1, 1)
+STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype="float32").reshape(3, 1, 1)
+
+device = "cpu"
+_image_session = None
+_text_session = None
+
+
+def export(directory=CLIP_ONNX_DIR):
+    """Export both towers of the torch model to ONNX graphs in directory"""
+    import torch
+
+    class Tower(torch.nn.Module):
+        def __init__(self, model, method):
+            super().__init__()
+            self.model = model
+            self.method = method
+
+        def forward(self, x):
+            return getattr(self.model, self.method)(x)
+
+    print(f"Exporting CLIP ViT-B/32 to ONNX in {directory}")
+    model, _ = clip.load("ViT-B/32", device="cpu", jit=False)
+    model.eval()
+    os.makedirs(directory, exist_ok=True)
+    towers = [(IMAGE_GRAPH, "encode_image", torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)),
+              (TEXT_GRAPH, "encode_text", clip.tokenize(["a photo of a wallet"]))]
+    for name, method, example in towers:
+        path = os.path.join(directory, name)
+        with torch.no_grad():
+            torch.onnx.export(Tower(model, method), example, path + ".tmp", opset_version=OPSET,
+                              input_names=["input"], output_names=["embedding"],
+                              dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}})
+        os.replace(path + ".tmp", path)
+
+
+def quantize(directory=CLIP_ONNX_DIR):
+    """Write int8 (dynamically quantized) copies of the exported graphs"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for name in (IMAGE_GRAPH, TEXT_GRAPH):
+        path = os.path.join(directory, name)
+        print(f"Quantizing {path} to int8")
+        quantize_dynamic(path, _int8_path(path) + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(_int8_path(path) + ".tmp", _int8_path(path))
+
+
+def _int8_path(path):
+    return path[:-len(".onnx")] + ".int8.onnx"
+
+
+def _session(path):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if CLIP_INTRA_OP_THREADS:
+        options.intra_op_num_threads = CLIP_INTRA_OP_THREADS
+    if CLIP_INTER_OP_THREADS:
+        options.inter_op_num_threads = CLIP_INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def load():
+    global _image_session, _text_session
+    paths = [os.path.join(CLIP_ONNX_DIR, name) for name in (IMAGE_GRAPH, TEXT_GRAPH)]
+    if not all(os.path.exists(path) for path in paths):
+        export()
+    if QUANTIZED:
+        if not all(os.path.exists(_int8_path(path)) for path in paths):
+            quantize()
+        paths = [_int8_path(path) for path in paths]
+    print(f"Loading CLIP ViT-B/32 ONNX graphs {paths} on onnxruntime")
+    _image_session, _text_session = (_session(path) for path in paths)
+
+
+def preprocess(image):
+    """PIL image -> normalized 3x224x224 float32 array"""
+    width, height = image.size
+    # Same rounding as torchvision's Resize(224)
+    if width <= height:
+        size = (INPUT_SIZE, int(INPUT_SIZE * height / width))
+    else:
+        size = (int(INPUT_SIZE * width / height), INPUT_SIZE)
+    image = image.convert("RGB").resize(size, Image.BICUBIC)
+    left, top = round((size[0] - INPUT_SIZE) / 2), round((size[1] - INPUT_SIZE) / 2)
+    image = image.crop((left, top, left + INPUT_SIZE, top + INPUT_SIZE))
+    pixels = np.asarray(image, dtype="float32").transpose(2, 0, 1) / 255.0
+    return (pixels - MEAN) / STD
+
+
+def _normalize(emb):
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def encode_image_batch(images):
+    """Encode a list of preprocessed images in one run of the image graph"""
+    emb = _image_session.run(None, {"input": np.stack(images).astype("float32")})[0]
+    return list(_normalize(emb.astype("float32")))
+
+
+def encode_text_batch(texts):
+    """Encode a list of strings in one run of the text graph"""
+    tokens = clip.tokenize(texts).numpy()
+    emb = _text_session.run(None, {"input": tokens})[0]
+    return list(_normalize(emb.astype("float32")))
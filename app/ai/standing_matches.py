@@ -0,0 +1,143 @@
+"""Standing-query matching: new FOUND items against the open LOST reports.
+
+The open LOST reports already form a searchable set, the LOST partition of
+the index (resolved and deleted items leave it), so matching a FOUND item
+against all of them is one reverse search rather than a rescan. FOUND
+items are queued as they are stored and matched in micro-batches on a
+worker thread, off the request path. Every LOST report scoring at least
+SCORE_THRESHOLD becomes a match event in EVENTS_PATH, which consumers read
+after a cursor (the last event_id they saw) with GET /matches/events.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from app import metrics
+from app.ai.batching import MicroBatcher
+from app.ai.fusion import fusion_weights
+from app.ai.matcher import find_matches_batch
+from app.config import (
+    DB_FSYNC, STANDING_MATCHES, STANDING_MATCH_TOP_K, STANDING_MATCH_BATCH, STANDING_MATCH_WINDOW_MS
+)
+
+log = logging.getLogger(__name__)
+
+# One JSON event per line; event_id n is line n
+EVENTS_PATH = "./data/match_events.log"
+
+_lock = threading.Lock()
+_file = None
+# event_id - 1 -> offset of the event in EVENTS_PATH
+_offsets = []
+
+
+def _open():
+    global _file
+    if _file is not None:
+        return
+    with _lock:
+        if _file is not None:
+            return
+        os.makedirs(os.path.dirname(EVENTS_PATH), exist_ok=True)
+        offset = 0
+        if os.path.exists(EVENTS_PATH):
+            with open(EVENTS_PATH, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    _offsets.append(offset)
+                    offset += len(line)
+            if offset < os.path.getsize(EVENTS_PATH):
+                print(f"Truncating torn event at offset {offset} in {EVENTS_PATH}")
+                with open(EVENTS_PATH, 'r+b') as f:
+                    f.truncate(offset)
+        _file = open(EVENTS_PATH, 'ab')
+
+
+def _append_events(events):
+    """Number the events and append them with a single write"""
+    _open()
+    with _lock:
+        offset = _file.seek(0, os.SEEK_END)
+        lines = []
+        for event in events:
+            event["event_id"] = len(_offsets) + 1
+            line = (json.dumps(event) + "\n").encode("utf-8")
+            _offsets.append(offset)
+            offset += len(line)
+            lines.append(line)
+        _file.write(b"".join(lines))
+        _file.flush()
+        if DB_FSYNC:
+            os.fsync(_file.fileno())
+
+
+@metrics.timed("standing_match")
+def match_found_items(items):
+    """Reverse-search FOUND items (dicts with item_id, embedding and
+    optionally image_embedding, text_embedding, description) against the
+    open LOST reports and record the matches as events. Returns the number
+    of events per item."""
+    weights = [fusion_weights(item.get("description", "")) for item in items]
+    matches = find_matches_batch(
+        [item["embedding"] for item in items], STANDING_MATCH_TOP_K, report_type="found",
+        image_embeddings=[item.get("image_embedding") for item in items],
+        text_embeddings=[item.get("text_embedding") if w[1] else None for item, w in zip(items, weights)],
+        weights=weights
+    )
+    created_at = datetime.utcnow().isoformat()
+    events = [
+        {"created_at": created_at, "found_item_id": item["item_id"],
+         "lost_item_id": match["item_id"], "score": match["score"],
+         "confidence": match["confidence"], "lost_item": match}
+        for item, found in zip(items, matches)
+        for match in found
+    ]
+    if events:
+        _append_events(events)
+        metrics.increment("match_events", len(events))
+    return [len(found) for found in matches]
+
+
+_batcher = MicroBatcher("standing-match", match_found_items, STANDING_MATCH_BATCH, STANDING_MATCH_WINDOW_MS)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        log.error("Standing match failed: %s", future.exception())
+
+
+def submit_found(item_id, embedding, image_embedding=None, text_embedding=None, description=""):
+    """Queue a stored FOUND item for matching; returns a Future of its
+    number of events, or None when standing matches are off"""
+    if not STANDING_MATCHES:
+        return None
+    future = _batcher.submit({
+        "item_id": item_id, "embedding": embedding, "image_embedding": image_embedding,
+        "text_embedding": text_embedding, "description": description
+    })
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def last_event_id():
+    _open()
+    return len(_offsets)
+
+
+def events_after(after=0, limit=100):
+    """Up to limit events with event_id > after, oldest first"""
+    _open()
+    with _lock:
+        offsets = _offsets[max(after, 0):max(after, 0) + limit]
+    if not offsets:
+        return []
+    with open(EVENTS_PATH, 'rb') as f:
+        f.seek(offsets[0])
+        return [json.loads(f.readline()) for _ in offsets]
+
+
+def stats():
+    return {"events": last_event_id(), "batching": _batcher.stats()}
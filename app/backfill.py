@@ -0,0 +1,94 @@
+"""Offline bulk import of historical items.
+
+    python -m app.backfill items.jsonl
+    python -m app.backfill items.csv --chunk-size 512
+    python -m app.backfill --resume <job_id>
+    python -m app.backfill --list
+
+Input rows need image_url, description, location and report_type ("lost" or
+"found"); category defaults to "general". It writes the service's ./data
+directly, so run it from the service directory while the API is stopped: it
+refuses to start while another process holds ./data (see
+app.db.fake_db.claim_writer). To import into a running service, send the
+items to its POST /report/batch instead. An interrupted run is resumed with
+--resume using the job id it printed.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from app.config import INGEST_CHUNK_SIZE
+
+
+def read_items(path):
+    if path.endswith(".csv"):
+        with open(path, newline='') as f:
+            return list(csv.DictReader(f))
+    if path.endswith(".json"):
+        with open(path, 'r') as f:
+            return json.load(f)
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", help="JSONL, JSON array or CSV file of items")
+    parser.add_argument("--resume", metavar="JOB_ID", help="continue an interrupted job")
+    parser.add_argument("--list", action="store_true", help="list unfinished jobs")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    # Before anything opens ./data: the API may be writing it
+    from app.db.fake_db import claim_writer, WriterLockError
+    try:
+        claim_writer()
+    except WriterLockError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    # Imported here so --help does not load CLIP and the index
+    from app.ingest import create_job, run_job, job_status, unfinished_jobs
+
+    if args.list:
+        for job_id in unfinished_jobs():
+            status = job_status(job_id)
+            print(f"{job_id}: {status['processed']}/{status['total']} processed")
+        return 0
+
+    if args.resume:
+        job_id = args.resume
+        if job_status(job_id) is None:
+            print(f"Unknown job {job_id}", file=sys.stderr)
+            return 1
+    elif args.path:
+        items = read_items(args.path)
+        job_id = create_job(items, chunk_size=args.chunk_size)
+        print(f"Created job {job_id} with {len(items)} items (resume with --resume {job_id})")
+    else:
+        parser.print_usage()
+        return 2
+
+    started = time.monotonic()
+
+    def progress(processed, total):
+        elapsed = time.monotonic() - started
+        print(f"[{job_id}] {processed}/{total} items ({elapsed:.1f}s)", flush=True)
+
+    if not run_job(job_id, progress=progress):
+        print(f"Job {job_id} is already running elsewhere", file=sys.stderr)
+        return 1
+
+    status = job_status(job_id)
+    print(f"Job {job_id} complete: {status['indexed']} indexed, {status['duplicates']} duplicates, "
+          f"{status['failed']} failed")
+    for result in status["results"]:
+        if result["status"] == "error":
+            print(f"  {result['item_id'] or '-'}: {result['error']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
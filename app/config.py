@@ -41,9 +41,209 @@
 
 # settings = get_settings()
 
+import os
+
 TOP_K = 5
 
+EMBEDDING_DIM = 512
+
 IMAGE_WEIGHT = 0.6
 TEXT_WEIGHT = 0.4
 
+# Two-stage retrieval: the index over fused vectors fetches
+# RERANK_CANDIDATES candidates, which are re-scored from their stored image
+# and text embeddings as IMAGE_WEIGHT * image similarity + TEXT_WEIGHT *
+# text similarity (weights can be set per query). Items stored before the
+# modalities were kept retain their fused score.
+RERANK = True
+RERANK_CANDIDATES = 50
+
+# Standing queries: every FOUND item stored is matched against the open
+# LOST reports (top STANDING_MATCH_TOP_K) on a background thread, grouped
+# into micro-batches of up to STANDING_MATCH_BATCH items; matches above
+# SCORE_THRESHOLD become events served by GET /matches/events.
+STANDING_MATCHES = True
+STANDING_MATCH_TOP_K = 10
+STANDING_MATCH_BATCH = 64
+STANDING_MATCH_WINDOW_MS = 5.0
+
+# Match prefilters: a search can be restricted to items at the same
+# normalized location and/or created in a time window; the partitions index
+# both so the restriction is applied inside the index search. When a filter
+# leaves at most PREFILTER_EXACT_MAX items they are scored exactly instead
+# of through the ANN graph, whose recall drops under selective filters.
+PREFILTER_EXACT_MAX = 4096
+
+# POST /find-similar matches up to FIND_SIMILAR_MAX_QUERIES embeddings per
+# request in one batched search, each for at most FIND_SIMILAR_MAX_TOP_K
+# items.
+FIND_SIMILAR_MAX_QUERIES = 1024
+FIND_SIMILAR_MAX_TOP_K = 100
+
 SCORE_THRESHOLD = 0.3
+
+# FAISS write-ahead log: every add is appended to the WAL and a full
+# snapshot (which compacts the log) is taken in the background once this
+# many records have accumulated since the last one.
+WAL_SNAPSHOT_EVERY = 1000
+WAL_FSYNC = True
+
+# Item store: fsync every appended record, and compact the log once dead
+# (superseded) records take up more than half of it and at least this much.
+DB_FSYNC = True
+DB_COMPACT_MIN_BYTES = 16 * 1024 * 1024
+
+# Write-behind persistence: appends to the item log, the vector store and
+# the WAL only reach the OS on the request path (visible to searches and
+# reader processes at once, and surviving a crash of the process); one
+# background thread group-commits their fsyncs, at the latest
+# WRITE_BEHIND_FLUSH_MS after a write. /report returns once its item is in
+# memory (durability "memory") or once it is on disk ("fsync"), per call.
+WRITE_BEHIND = True
+WRITE_BEHIND_FLUSH_MS = 50
+REPORT_DURABILITY = "memory"
+
+# Item IDs (LOST-WALLET-A9F2) come from a sequence per type/category
+# prefix, scrambled into 4 base-36 characters (5 and more once a prefix
+# has used all 1.7M 4-character codes). The writer reserves ID_BLOCK_SIZE
+# numbers at a time from ./data/id_sequences.json and never hands out a
+# reserved number again, so IDs stay unique across restarts and across the
+# processes that take turns writing ./data (the API, the backfill CLI).
+ID_BLOCK_SIZE = 256
+
+# Duplicate reports (the same photo uploaded again, or a retried request)
+# are linked to the item they repeat instead of being stored and indexed
+# again. A report duplicates a same-type, same-category item reported in
+# the last DEDUP_WINDOW_HOURS whose fused embedding scores at least
+# DEDUP_EMBEDDING_THRESHOLD and whose image hash differs in at most
+# DEDUP_HASH_DISTANCE of 64 bits; without a hash on either side (embedding
+# cache off, items stored before hashing) the score alone must reach
+# DEDUP_EMBEDDING_ONLY_THRESHOLD. DEDUP_CANDIDATES nearest items are checked.
+DEDUP = True
+DEDUP_WINDOW_HOURS = 72
+DEDUP_EMBEDDING_THRESHOLD = 0.95
+DEDUP_EMBEDDING_ONLY_THRESHOLD = 0.99
+DEDUP_HASH_DISTANCE = 8
+DEDUP_CANDIDATES = 5
+
+# Item metadata cache used to hydrate search results. "display" keeps only
+# the fields shown in match results (no embeddings), "full" whole records.
+ITEM_CACHE_MODE = "display"
+ITEM_CACHE_MAX_ITEMS = 100000
+
+# CLIP micro-batching: concurrent encode calls are grouped into one forward
+# pass of up to CLIP_MAX_BATCH items, waiting at most CLIP_BATCH_WINDOW_MS
+# for the batch to fill. Image and text requests are batched separately.
+CLIP_BATCHING = True
+CLIP_MAX_BATCH = 32
+CLIP_BATCH_WINDOW_MS = 2.0
+
+# Image download and decode: shared keep-alive connection pool, a size cap
+# on downloads, and a bounded pool of threads for decode + preprocess.
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+HTTP_POOL_CONNECTIONS = 64
+IMAGE_DECODE_WORKERS = 4
+
+# Images are decoded only as large as the encoder needs: JPEGs at a reduced
+# scale (libjpeg DCT scaling, 1/2 to 1/8) and then any image box-reduced by
+# an integer factor, keeping the shorter side at or above
+# IMAGE_DECODE_MIN_SIDE for CLIP preprocessing to resize to 224. 0 decodes
+# at full size.
+IMAGE_DECODE_MIN_SIDE = 448
+
+# Content-addressed embedding cache: image embeddings keyed by a hash of the
+# downloaded bytes (plus a URL -> hash map), text embeddings by the prompt.
+EMBEDDING_CACHE = True
+EMBEDDING_CACHE_PATH = "./data/embedding_cache.sqlite3"
+EMBEDDING_CACHE_MEMORY_ITEMS = 10000
+EMBEDDING_CACHE_DISK_ITEMS = 500000
+
+# Bulk ingest (/report/batch and python -m app.backfill): items are processed
+# in chunks of INGEST_CHUNK_SIZE, each persisted with one store append and
+# one index add, and downloaded by INGEST_FETCH_WORKERS threads.
+INGEST_CHUNK_SIZE = 256
+INGEST_FETCH_WORKERS = 16
+
+# Approximate search: a partition still on the exact IndexFlatIP is rebuilt
+# in the background with ANN_INDEX_FACTORY (a faiss.index_factory string,
+# "{nlist}" is sized from the data, e.g. "IVF{nlist},PQ64") once it holds
+# ANN_MIN_VECTORS vectors. The count is per partition, i.e. per time shard
+# (see INDEX_SHARD_DAYS): at 512 dims an exact scan of 10k vectors is as
+# fast as HNSW32 on one core, while at 20k HNSW is over 3x faster.
+# Search knobs can be changed at runtime.
+ANN_INDEX_FACTORY = "HNSW32,Flat"
+ANN_MIN_VECTORS = 20000
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 128
+IVF_NPROBE = 16
+
+# Embeddings live in a memory-mapped, row-addressed binary file instead of
+# the JSON records. "float16" halves its size at a small precision cost;
+# an existing store keeps the dtype it was created with.
+VECTOR_STORE_DTYPE = "float32"
+
+# Startup: the CLIP model loads in a background thread ("background"), on
+# first use ("lazy") or at import ("eager"); GET /ready reports when it is
+# usable. Index snapshots are memory-mapped instead of read into memory and
+# are only copied into RAM when a partition first receives an add.
+CLIP_LOAD_MODE = "background"
+INDEX_MMAP = True
+
+# Deleted or resolved items are hidden from search at once and physically
+# removed from their partition by a background compaction once it holds
+# INDEX_COMPACT_MIN_DELETED of them and they are INDEX_COMPACT_RATIO of it.
+INDEX_COMPACT_MIN_DELETED = 1000
+INDEX_COMPACT_RATIO = 0.1
+
+# Each report type's vectors are split into time shards of INDEX_SHARD_DAYS
+# days of created_at (weeks starting on Monday; 0 keeps one partition per
+# type). Searches visit the newest shards first and skip those outside a
+# since/until window. With SEARCH_EARLY_STOP_SCORE set (0.75 is the "High"
+# confidence), matching stops going further back once every query has
+# top_k candidates scoring that or more; older items scoring higher are
+# then missed, so it is off (None: every shard is searched) by default.
+# Shards that ended more than INDEX_RETENTION_DAYS ago are retired with
+# INDEX_RETENTION_ACTION: "archive" moves them to ./data/index_archive, from
+# where they are restored at startup if the retention is raised again,
+# "drop" deletes them. Their item records are kept either way. Retired
+# items can no longer be matched, so it is off (0: never) by default;
+# e.g. 182 keeps half a year searchable.
+INDEX_SHARD_DAYS = 7
+SEARCH_EARLY_STOP_SCORE = None
+INDEX_RETENTION_DAYS = 0
+INDEX_RETENTION_ACTION = "archive"
+
+# Encoder behind clip_model: "clip" (OpenAI CLIP ViT-B/32 on torch),
+# "clip-int8" (the same with its Linear layers dynamically quantized to
+# int8, CPU only), "onnx" (the model exported once to CLIP_ONNX_DIR and run
+# by onnxruntime), "onnx-int8" (the exported graphs with their weights
+# quantized to int8 once, also CPU only) or "fake", a deterministic
+# torch-free stand-in used by the benchmarks. The fake one can sleep per batch and per item to emulate
+# model cost. benchmarks/bench_clip_backends.py compares the real ones.
+CLIP_BACKEND = "clip"
+CLIP_ONNX_DIR = "./data/clip_onnx"
+FAKE_ENCODER_BATCH_MS = 0.0
+FAKE_ENCODER_ITEM_MS = 0.0
+
+# Threads of the CPU inference runtime: within one operator (intra-op) and
+# across independent operators (inter-op); 0 keeps the runtime's default
+# (all cores for intra-op). Set intra-op to the cores one process may use
+# when several processes share a node.
+CLIP_INTRA_OP_THREADS = int(os.environ.get("CLIP_INTRA_OP_THREADS", "0"))
+CLIP_INTER_OP_THREADS = int(os.environ.get("CLIP_INTER_OP_THREADS", "0"))
+
+# Level of the "app" logger ("DEBUG" adds per-request detail such as raw
+# search results); switchable at runtime with POST /log-level.
+LOG_LEVEL = "INFO"
+
+# Multi-process serving. "single": one process does everything. "writer":
+# owns ingest, the item log, the WAL and snapshots. "reader": serves search
+# from the writer's memory-mapped snapshot, follows its WAL and item log
+# every READER_REFRESH_SECONDS and hands writes to WRITER_URL. Set per
+# process through the environment, e.g. one writer and
+# SERVE_ROLE=reader uvicorn app.main:app --workers 8. Only one "single" or
+# "writer" process can run per data directory (it holds ./data/writer.lock).
+SERVE_ROLE = os.environ.get("SERVE_ROLE", "single")
+WRITER_URL = os.environ.get("WRITER_URL", "http://127.0.0.1:8001")
+READER_REFRESH_SECONDS = 1.0
@@ -1,60 +1,646 @@
 import os
 import json
+import fcntl
+import atexit
+import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from app.config import (
+    DB_FSYNC, DB_COMPACT_MIN_BYTES, ITEM_CACHE_MODE, ITEM_CACHE_MAX_ITEMS, SERVE_ROLE, WRITE_BEHIND
+)
+from app import metrics
+from app.db import vector_store
+
+log = logging.getLogger(__name__)
+
+# Local log-structured storage: one JSON record per line, appended on every
+# insert or update. The in-memory keydir maps item_id -> (offset, length,
+# created_at) of the latest version so point lookups are a single seek +
+# read. A hint file with the keydir lets the next open skip re-parsing the
+# records it already covers.
+# Embeddings are not kept in the records: they go to the binary vector
+# store and the record holds their row, e.g. "embedding_row" for the fused
+# vector and "image_embedding_row"/"text_embedding_row" for the separate
+# modalities used to re-rank search candidates. Deleting an item
+# appends a tombstone record {"item_id": ..., "_deleted": true}.
+DB_FILE = "./data/items.json"  # legacy whole-file store, migrated on first open
+LOG_FILE = "./data/items.log"
+HINT_FILE = "./data/items.hint"
+
+# A reader process opens the writer's log read-only and follows it with
+# refresh(). It reads through its own handle, so the keydir keeps pointing
+# into the file it was built from even after the writer swaps in a
+# compacted log; refresh() then moves over to the new one.
+READ_ONLY = SERVE_ROLE == "reader"
+
+# Only one process may write ./data: vector store rows, the keydir and the
+# FAISS WAL sequence are handed out from process memory, so a second writer
+# would reuse them. The writer (the API in role "single" or "writer", or
+# the backfill CLI) holds an exclusive lock on WRITER_LOCK_PATH for as long
+# as it runs; readers take no lock.
+WRITER_LOCK_PATH = "./data/writer.lock"
+
+# Record field holding an embedding -> field holding its vector store row
+EMBEDDING_FIELDS = {"embedding": "embedding_row",
+                    "image_embedding": "image_embedding_row",
+                    "text_embedding": "text_embedding_row"}
+
+# Fields kept by the metadata cache in "display" mode: those shown in match
+# results plus the modality rows the re-rank reads, the image hash the
+# duplicate check reads and the status a restored index shard is checked by
+DISPLAY_FIELDS = ("item_id", "itemType", "category", "description", "location",
+                  "reportType", "imageUrl", "created_at",
+                  "image_embedding_row", "text_embedding_row", "imageHash", "status")
+
+_lock = threading.RLock()
+_keydir = None
+_log = None
+_dead_bytes = 0
+_inline_embeddings = False
+# Reader: end offset of the last complete record applied to the keydir
+_log_end = 0
+# LRU of item_id -> metadata, kept coherent by every write below
+_cache = OrderedDict()
+# With WRITE_BEHIND, appends only reach the OS and sync() (called by the
+# group commit of app.write_behind) makes them durable
+_unsynced = False
+# Items dropped on open because a power loss kept their record but not the
+# vector store rows it points at (see _drop_lost)
+_lost_ids = set()
+_writer_lock = None
+
+
+class WriterLockError(RuntimeError):
+    """Another process already writes ./data"""
+
+
+def claim_writer():
+    """Take the writer lock on ./data for the life of the process, or raise
+    WriterLockError naming the process that holds it"""
+    global _writer_lock
+    with _lock:
+        if _writer_lock is not None:
+            return
+        os.makedirs(os.path.dirname(WRITER_LOCK_PATH), exist_ok=True)
+        lock = open(WRITER_LOCK_PATH, 'a+')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.seek(0)
+            holder = lock.read().strip() or "unknown"
+            lock.close()
+            raise WriterLockError(f"./data is being written by process {holder}; stop it first, "
+                                  f"or send the items to its POST /report/batch") from None
+        lock.truncate(0)
+        lock.write(str(os.getpid()))
+        lock.flush()
+        _writer_lock = lock
+
+
+def _encode(item):
+    return (json.dumps(item, default=str) + "\n").encode("utf-8")
+
+
+def _key(item, position):
+    return item.get('item_id') or f"__row_{position}"
+
+
+def _write_log(path, items):
+    """Write items as a fresh log, returning the keydir for it"""
+    keydir = {}
+    offset = 0
+    with open(path, 'wb') as f:
+        for item in items:
+            line = _encode(item)
+            f.write(line)
+            keydir[_key(item, len(keydir))] = (offset, len(line), item.get('created_at'))
+            offset += len(line)
+        f.flush()
+        os.fsync(f.fileno())
+    return keydir
+
+
+def _migrate_legacy():
+    """Import the old items.json into the log and set the JSON file aside"""
+    with open(DB_FILE, 'r') as f:
+        items = json.load(f)
+    tmp_path = LOG_FILE + ".tmp"
+    _write_log(tmp_path, items)
+    os.replace(tmp_path, LOG_FILE)
+    os.replace(DB_FILE, DB_FILE + ".migrated")
+    print(f"Migrated {len(items)} items from {DB_FILE} to {LOG_FILE}")
+
+
+def _load_hint(stat):
+    """Keydir, log offset and dead bytes from the hint file if it still
+    describes the log with this stat (same file, not truncated), else a
+    fresh start"""
+    if os.path.exists(HINT_FILE):
+        try:
+            with open(HINT_FILE, 'r') as f:
+                hint = json.load(f)
+            if hint["inode"] == stat.st_ino and hint["size"] <= stat.st_size:
+                keydir = {key: (offset, length, created_at)
+                          for key, offset, length, created_at in hint["entries"]}
+                return keydir, hint["size"], hint["dead_bytes"]
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Ignoring unreadable {HINT_FILE}: {e}")
+    return {}, 0, 0
+
+
+def save_hint():
+    """Persist the keydir so the next open only parses records appended since"""
+    if _keydir is None or READ_ONLY:
+        return
+    with _lock:
+        _log.flush()
+        stat = os.fstat(_log.fileno())
+        entries = [[key, *entry] for key, entry in _keydir.items()]
+        dead_bytes = _dead_bytes
+    # The next open does not check the records the hint covers (see
+    # _drop_lost), so they and their vector rows must be durable first
+    vector_store.sync()
+    sync()
+    tmp_path = HINT_FILE + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"inode": stat.st_ino, "size": stat.st_size,
+                   "dead_bytes": dead_bytes, "entries": entries}, f)
+    os.replace(tmp_path, HINT_FILE)
+
+
+def _scan_records(f, keydir, offset, lost=None):
+    """Apply the records of f from offset on to keydir; returns the offset
+    after the last complete one. A torn final record, or one the writer is
+    still appending, is left unread. With lost, the keys of live records
+    pointing past the end of the vector store are collected in it."""
+    global _dead_bytes, _inline_embeddings
+    rows = vector_store.count() if lost is not None else None
+    f.seek(offset)
+    for line in f:
+        try:
+            if not line.endswith(b"\n"):
+                raise ValueError("incomplete record")
+            item = json.loads(line)
+        except ValueError:
+            break
+        key = _key(item, len(keydir))
+        if 'embedding' in item:
+            _inline_embeddings = True
+        if key in keydir:
+            _dead_bytes += keydir[key][1]
+        if item.get('_deleted'):
+            keydir.pop(key, None)
+            _dead_bytes += len(line)
+        else:
+            keydir[key] = (offset, len(line), item.get('created_at'))
+        if lost is not None:
+            if not item.get('_deleted') and any(item.get(field) is not None and item[field] >= rows
+                                                for field in EMBEDDING_FIELDS.values()):
+                lost.add(key)
+            else:
+                lost.discard(key)
+        _cache.pop(key, None)
+        offset += len(line)
+    return offset
+
+
+def _scan_log():
+    """Rebuild the keydir from the hint plus the log records after it,
+    dropping a torn final record; returns the keydir, the bytes parsed and
+    the keys of records whose vector store rows are gone"""
+    global _dead_bytes
+    keydir, start, _dead_bytes = _load_hint(os.stat(LOG_FILE))
+    lost = set()
+    with open(LOG_FILE, 'rb') as f:
+        offset = _scan_records(f, keydir, start, lost)
+    if offset < os.path.getsize(LOG_FILE):
+        print(f"Truncating torn record at offset {offset} in {LOG_FILE}")
+        with open(LOG_FILE, 'r+b') as f:
+            f.truncate(offset)
+    return keydir, offset - start, lost
+
+
+def _drop_lost(keys):
+    """Tombstone records whose embeddings did not survive a power loss.
+
+    A write is durable once its vector rows and then its record are
+    fsynced, but the OS may write back a record before the rows it points
+    at, so after a power loss the log can hold records past the end of the
+    vector store. They were never acknowledged as durable; dropping them
+    (durably, before the rows are handed out again) keeps them from
+    pointing at other items' vectors later."""
+    global _dead_bytes
+    lines = [_encode({"item_id": key, "_deleted": True}) for key in keys]
+    _log.write(b"".join(lines))
+    _log.flush()
+    if DB_FSYNC:
+        os.fsync(_log.fileno())
+    for key, line in zip(keys, lines):
+        _dead_bytes += _keydir.pop(key)[1] + len(line)
+    _lost_ids.update(keys)
+    print(f"Dropped {len(keys)} records whose embeddings were lost: {sorted(keys)[:5]}")
+
+
+def get_lost_item_ids():
+    """Items dropped on open by _drop_lost; the index may still hold them"""
+    return set(_lost_ids)
+
+
+def _open_replica():
+    """Reader: the current log opened read-only, its keydir and end offset"""
+    if not os.path.exists(LOG_FILE):
+        return None, {}, 0
+    f = open(LOG_FILE, 'rb')
+    keydir, start, _ = _load_hint(os.fstat(f.fileno()))
+    return f, keydir, _scan_records(f, keydir, start)
+
+
+def refresh():
+    """Reader: apply the records the writer appended since the last call,
+    or switch to the new log after the writer compacted it"""
+    global _keydir, _log, _log_end
+    _open()
+    try:
+        inode = os.stat(LOG_FILE).st_ino
+    except FileNotFoundError:
+        return
+    if _log is not None and inode == os.fstat(_log.fileno()).st_ino:
+        with _lock:
+            _log_end = _scan_records(_log, _keydir, _log_end)
+        return
+    log_file, keydir, end = _open_replica()
+    with _lock:
+        old, _log, _keydir, _log_end = _log, log_file, keydir, end
+        _cache.clear()
+    if old is not None:
+        old.close()
+
+
+def _open():
+    """Open the store once per process"""
+    global _keydir, _log, _log_end
+    if _keydir is not None:
+        return
+    with _lock:
+        if _keydir is not None:
+            return
+        os.makedirs("./data", exist_ok=True)
+        if READ_ONLY:
+            _log, _keydir, _log_end = _open_replica()
+            return
+        claim_writer()
+        if not os.path.exists(LOG_FILE) and os.path.exists(DB_FILE):
+            _migrate_legacy()
+        scanned, lost = 0, ()
+        if os.path.exists(LOG_FILE):
+            keydir, scanned, lost = _scan_log()
+        else:
+            keydir = {}
+        _log = open(LOG_FILE, 'ab')
+        _keydir = keydir
+        if lost:
+            _drop_lost(sorted(lost))
+        if _inline_embeddings:
+            _move_embeddings_out()
+        elif scanned > os.path.getsize(LOG_FILE) // 10:
+            save_hint()
+        atexit.register(save_hint)
+
+
+def _move_embeddings_out():
+    """One-time migration of JSON float-list embeddings into the vector store"""
+    global _inline_embeddings
+    items = get_db()
+    _extract_embeddings(items)
+    save_db(items)
+    _inline_embeddings = False
+    print(f"Moved embeddings of {len(items)} items into {vector_store.VECTOR_STORE_PATH}")
+
+
+def _extract_embeddings(items):
+    """Replace each item's embeddings (EMBEDDING_FIELDS) by the rows they
+    are appended at in the vector store, with a single append for all"""
+    with_vectors = []
+    for item in items:
+        for field, row_field in EMBEDDING_FIELDS.items():
+            embedding = item.pop(field, None)
+            if embedding is not None and len(embedding):
+                with_vectors.append((item, row_field, embedding))
+    if with_vectors:
+        first = vector_store.append([embedding for _, _, embedding in with_vectors])
+        for row, (item, row_field, _) in enumerate(with_vectors, start=first):
+            item[row_field] = row
+
+
+def get_embedding(item):
+    """float32 embedding of a stored record, or None"""
+    row = item.get('embedding_row')
+    if row is not None:
+        return vector_store.get(row)
+    return None
+
+
+def _fsync_log():
+    """fsync the log after an append, or leave it to the group commit"""
+    global _unsynced
+    if WRITE_BEHIND:
+        _unsynced = True
+    elif DB_FSYNC:
+        os.fsync(_log.fileno())
+
+
+def sync():
+    """Make every append so far durable; returns False if there were none.
+    The fsync runs outside the lock so appends go on meanwhile"""
+    global _unsynced
+    with _lock:
+        if not _unsynced or _log is None:
+            return False
+        _unsynced = False
+        # A compaction may swap the log meanwhile; it fsyncs the new one
+        fd = os.dup(_log.fileno())
+    try:
+        if DB_FSYNC:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _append(key, item):
+    line = _encode(item)
+    offset = _log.seek(0, os.SEEK_END)
+    _log.write(line)
+    _log.flush()
+    _fsync_log()
+    _keydir[key] = (offset, len(line), item.get('created_at'))
+
+
+def _cache_put(item_id, item):
+    if ITEM_CACHE_MODE == "display":
+        item = {field: item[field] for field in DISPLAY_FIELDS if field in item}
+    _cache[item_id] = item
+    _cache.move_to_end(item_id)
+    while len(_cache) > ITEM_CACHE_MAX_ITEMS:
+        _cache.popitem(last=False)
+
+
+def _read(entry):
+    offset, length = entry[:2]
+    if READ_ONLY:
+        return json.loads(os.pread(_log.fileno(), length, offset))
+    with open(LOG_FILE, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+def _read_many(entries):
+    """Read several records with one open file, in log order"""
+    if READ_ONLY:
+        return [_read(entry) for entry in sorted(entries)]
+    items = []
+    with open(LOG_FILE, 'rb') as f:
+        for offset, length, _ in sorted(entries):
+            f.seek(offset)
+            items.append(json.loads(f.read(length)))
+    return items
+
+
+def compact_db():
+    """Rewrite the log with only the latest version of every record"""
+    with _lock:
+        items = get_db()
+        save_db(items)
+    print(f"Compacted {LOG_FILE} to {len(items)} records")
 
-# Local JSON file storage
-DB_FILE = "./data/items.json"
 
 def get_db():
-    """Get items from local JSON file"""
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, 'r') as f:
-            return json.load(f)
-    else:
-        return []
+    """Get all live items from the log in insertion order"""
+    _open()
+    with _lock:
+        entries = list(_keydir.values())
+        if READ_ONLY:
+            data = os.pread(_log.fileno(), _log_end, 0) if _log is not None else b""
+        else:
+            _log.flush()
+            with open(LOG_FILE, 'rb') as f:
+                data = f.read()
+    return [json.loads(data[offset:offset + length]) for offset, length, _ in entries]
 
 def save_db(items):
-    """Save items to local JSON file"""
-    os.makedirs("./data", exist_ok=True)
-    with open(DB_FILE, 'w') as f:
-        json.dump(items, f, indent=2, default=str)
+    """Replace the whole store with items"""
+    global _keydir, _log, _dead_bytes
+    _open()
+    with _lock:
+        tmp_path = LOG_FILE + ".tmp"
+        keydir = _write_log(tmp_path, items)
+        _log.close()
+        os.replace(tmp_path, LOG_FILE)
+        _log = open(LOG_FILE, 'ab')
+        _keydir = keydir
+        _dead_bytes = 0
+        _cache.clear()
+    save_hint()
 
+@metrics.timed("persist_db")
 def insert_item(item):
-    """Insert item into local JSON storage"""
-    items = get_db()
-    
+    """Append item to the local log"""
+    global _dead_bytes
+    _open()
+
     # Add timestamp
     item['created_at'] = datetime.utcnow().isoformat()
-    
-    items.append(item)
-    save_db(items)
-    print(f"Inserted item {item.get('item_id', 'unknown')} into local storage")
-    return len(items) - 1  # Return index as ID
+    _extract_embeddings([item])
+
+    with _lock:
+        position = len(_keydir)
+        key = _key(item, position)
+        if key in _keydir:
+            # Re-inserting an existing id replaces it, like an update would
+            _dead_bytes += _keydir[key][1]
+            position = list(_keydir).index(key)
+        _append(key, item)
+        _cache_put(key, item)
+    log.debug("Inserted item %s into local storage", item.get('item_id', 'unknown'))
+    return position  # Return index as ID
+
+@metrics.timed("persist_db")
+def insert_items(items):
+    """Append many items with a single write and fsync"""
+    global _dead_bytes
+    _open()
+
+    created_at = datetime.utcnow().isoformat()
+    _extract_embeddings(items)
+    with _lock:
+        offset = _log.seek(0, os.SEEK_END)
+        lines = []
+        for item in items:
+            item['created_at'] = created_at
+            line = _encode(item)
+            key = _key(item, len(_keydir))
+            if key in _keydir:
+                _dead_bytes += _keydir[key][1]
+            _keydir[key] = (offset, len(line), created_at)
+            _cache_put(key, item)
+            offset += len(line)
+            lines.append(line)
+        _log.write(b"".join(lines))
+        _log.flush()
+        _fsync_log()
+    log.debug("Inserted %d items into local storage", len(items))
+    return len(items)
 
 def get_all_items():
-    """Get all items from local JSON storage"""
+    """Get all items from local storage"""
     items = get_db()
-    print(f"Retrieved {len(items)} items from local storage")
+    log.debug("Retrieved %d items from local storage", len(items))
     return items
 
+def get_items_since(created_at):
+    """Items created after created_at (an ISO timestamp) without reading the rest"""
+    _open()
+    with _lock:
+        _log.flush()
+        entries = [entry for entry in _keydir.values() if (entry[2] or "") > created_at]
+    return _read_many(entries)
+
+def has_item(item_id):
+    """Whether item_id is stored (and not deleted)"""
+    _open()
+    return item_id in _keydir
+
 def get_item_by_id(item_id):
     """Get specific item by ID"""
-    items = get_db()
-    for item in items:
-        if item.get('item_id') == item_id:
-            return item
-    return None
+    _open()
+    with _lock:
+        entry = _keydir.get(item_id)
+        if entry is None:
+            return None
+        _log.flush()
+        return _read(entry)
+
+def get_items_by_ids(item_ids):
+    """Get cached metadata for item_ids as a dict; unknown ids are left out.
+
+    Only misses touch the log. In "display" mode the returned records hold
+    DISPLAY_FIELDS only; they are shared with the cache and must not be
+    modified by callers.
+    """
+    _open()
+    found = {}
+    with _lock:
+        for item_id in item_ids:
+            item = _cache.get(item_id)
+            if item is None:
+                entry = _keydir.get(item_id)
+                if entry is None:
+                    continue
+                _log.flush()
+                _cache_put(item_id, _read(entry))
+                item = _cache[item_id]
+            else:
+                _cache.move_to_end(item_id)
+            found[item_id] = item
+    return found
+
+def get_item_fields(item_ids, fields):
+    """{item_id: {field: value}} of a few fields of each known item; unknown
+    ids are left out. Misses are read in log order without going through
+    the cache, so whole partitions can be looked up without evicting it."""
+    _open()
+    found, misses = {}, []
+    with _lock:
+        for item_id in item_ids:
+            item = _cache.get(item_id)
+            if item is not None:
+                found[item_id] = {field: item.get(field) for field in fields}
+            elif item_id in _keydir:
+                misses.append((_keydir[item_id], item_id))
+        if misses:
+            _log.flush()
+            misses.sort()
+            items = _read_many([entry for entry, _ in misses])
+            for item, (_, item_id) in zip(items, misses):
+                found[item_id] = {field: item.get(field) for field in fields}
+    return found
+
+def get_item_embedding(item_id):
+    """Embedding of an item as float32, or None"""
+    item = get_item_by_id(item_id)
+    return get_embedding(item) if item else None
+
+def update_item(item_id, changes):
+    """Write a new version of an item with changes applied; returns the
+    updated record, or None if the item does not exist"""
+    global _dead_bytes
+    _open()
+
+    with _lock:
+        entry = _keydir.get(item_id)
+        if entry is None:
+            return None
+        _log.flush()
+        item = _read(entry)
+        item.update(changes)
+        _append(item_id, item)
+        _cache_put(item_id, item)
+        _dead_bytes += entry[1]
+    _maybe_compact()
+    log.debug("Updated item %s", item_id)
+    return item
+
+def delete_item(item_id):
+    """Remove an item by appending a tombstone; returns False if unknown"""
+    global _dead_bytes
+    _open()
+
+    with _lock:
+        entry = _keydir.get(item_id)
+        if entry is None:
+            return False
+        line = _encode({"item_id": item_id, "_deleted": True})
+        _log.seek(0, os.SEEK_END)
+        _log.write(line)
+        _log.flush()
+        _fsync_log()
+        del _keydir[item_id]
+        _cache.pop(item_id, None)
+        _dead_bytes += entry[1] + len(line)
+    _maybe_compact()
+    log.debug("Deleted item %s", item_id)
+    return True
+
+def _maybe_compact():
+    """Compact once dead records make up most of a large enough log"""
+    with _lock:
+        needs_compaction = _dead_bytes >= DB_COMPACT_MIN_BYTES and \
+            _dead_bytes > os.path.getsize(LOG_FILE) // 2
+    if needs_compaction:
+        compact_db()
 
 def update_item_embedding(item_id, embedding):
     """Update item with embedding vector"""
-    items = get_db()
-    
-    for i, item in enumerate(items):
-        if item.get('item_id') == item_id:
-            items[i]['embedding'] = embedding.tolist() if hasattr(embedding, 'tolist') else embedding
-            save_db(items)
-            print(f"Updated embedding for item {item_id}")
-            return True
-    
-    print(f"Item {item_id} not found for embedding update")
-    return False
+    global _dead_bytes
+    _open()
+
+    with _lock:
+        entry = _keydir.get(item_id)
+        if entry is not None:
+            _log.flush()
+            item = _read(entry)
+            item['embedding_row'] = vector_store.append(embedding)
+            # The separate modalities no longer describe the new vector
+            item.pop('image_embedding_row', None)
+            item.pop('text_embedding_row', None)
+            _append(item_id, item)
+            _cache_put(item_id, item)
+            _dead_bytes += entry[1]
+            log.debug("Updated embedding for item %s", item_id)
+        else:
+            log.warning("Item %s not found for embedding update", item_id)
+            return False
+
+    _maybe_compact()
+    return True
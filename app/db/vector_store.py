@@ -0,0 +1,149 @@
+import os
+import struct
+import threading
+import numpy as np
+from app.config import EMBEDDING_DIM, VECTOR_STORE_DTYPE, DB_FSYNC, SERVE_ROLE, WRITE_BEHIND
+
+# Contiguous row-addressed embedding file: a fixed header followed by
+# fixed-size rows. Rows are only ever appended, so a row number handed out
+# once stays valid for the lifetime of the file.
+# Rows are never reclaimed either: the rows of deleted items, and the old
+# rows of re-embedded ones, stay in the file (compact_db and compact_index
+# only drop their records and vectors). Reclaiming them would mean
+# rewriting the file and every record's row numbers while readers map it
+# and power-loss recovery checks records against its length.
+VECTOR_STORE_PATH = "./data/embeddings.vec"
+
+MAGIC = b"FVEC"
+HEADER = struct.Struct("<4sHII")  # magic, version, dim, dtype code
+HEADER_BYTES = 64
+DTYPES = {1: "float32", 2: "float16"}
+DTYPE_CODES = {name: code for code, name in DTYPES.items()}
+
+# Reader processes map the writer's file and never modify it
+READ_ONLY = SERVE_ROLE == "reader"
+
+_lock = threading.RLock()
+_file = None
+_dtype = None
+_dim = None
+_rows = 0
+_mapped = None
+# Appends not fsynced yet (WRITE_BEHIND leaves that to sync())
+_unsynced = False
+
+
+def _open():
+    global _file, _dtype, _dim, _rows
+    if _file is not None:
+        return
+    with _lock:
+        if _file is not None:
+            return
+        os.makedirs(os.path.dirname(VECTOR_STORE_PATH), exist_ok=True)
+        if not os.path.exists(VECTOR_STORE_PATH) and not READ_ONLY:
+            with open(VECTOR_STORE_PATH, 'wb') as f:
+                header = HEADER.pack(MAGIC, 1, EMBEDDING_DIM, DTYPE_CODES[VECTOR_STORE_DTYPE])
+                f.write(header.ljust(HEADER_BYTES, b"\0"))
+                f.flush()
+                os.fsync(f.fileno())
+        with open(VECTOR_STORE_PATH, 'rb') as f:
+            magic, _, dim, code = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{VECTOR_STORE_PATH} is not a vector store")
+        # The file keeps the dtype it was created with
+        _dtype, _dim = np.dtype(DTYPES[code]), dim
+        row_bytes = _dim * _dtype.itemsize
+        size = os.path.getsize(VECTOR_STORE_PATH) - HEADER_BYTES
+        _rows = size // row_bytes
+        if READ_ONLY:
+            # A partial last row is one the writer is still appending
+            _file = open(VECTOR_STORE_PATH, 'rb')
+            return
+        if size % row_bytes:
+            # A crash mid-append left a partial row. A record may point at
+            # it (or past it) after a power loss; fake_db drops those on
+            # open, before these row numbers are handed out again
+            with open(VECTOR_STORE_PATH, 'r+b') as f:
+                f.truncate(HEADER_BYTES + _rows * row_bytes)
+        _file = open(VECTOR_STORE_PATH, 'ab')
+
+
+def _view():
+    """Memory map covering every row written so far"""
+    global _mapped
+    if _mapped is None or len(_mapped) < _rows:
+        _file.flush()
+        _mapped = np.memmap(VECTOR_STORE_PATH, dtype=_dtype, mode='r',
+                            offset=HEADER_BYTES, shape=(_rows, _dim)) if _rows else np.empty((0, _dim), _dtype)
+    return _mapped
+
+
+def append(vectors):
+    """Append vectors (n x dim) and return the row number of the first one"""
+    global _rows, _unsynced
+    _open()
+    vectors = np.asarray(vectors, dtype="float32").reshape(-1, EMBEDDING_DIM)
+    with _lock:
+        first = _rows
+        _file.write(vectors.astype(_dtype, copy=False).tobytes())
+        _file.flush()
+        if WRITE_BEHIND:
+            _unsynced = True
+        elif DB_FSYNC:
+            os.fsync(_file.fileno())
+        _rows += len(vectors)
+    return first
+
+
+def sync():
+    """fsync the rows appended since the last call (write-behind group
+    commit); returns False if there were none"""
+    global _unsynced
+    with _lock:
+        if not _unsynced:
+            return False
+        _unsynced = False
+        fd = _file.fileno()
+    if DB_FSYNC:
+        os.fsync(fd)
+    return True
+
+
+def count():
+    _open()
+    return _rows
+
+
+def get(row):
+    """One embedding as float32"""
+    return get_rows([row])[0]
+
+
+def _follow():
+    """Reader: count the rows the writer appended since the last look"""
+    global _rows
+    size = os.fstat(_file.fileno()).st_size - HEADER_BYTES
+    _rows = max(_rows, size // (_dim * _dtype.itemsize))
+
+
+def get_rows(rows):
+    """Embeddings for the given rows as a float32 (n x dim) array"""
+    _open()
+    rows = np.asarray(rows, dtype="int64")
+    with _lock:
+        if READ_ONLY and len(rows) and rows.max() >= _rows:
+            _follow()
+        view = _view()
+    return np.asarray(view[rows], dtype="float32")
+
+
+def view(start=0, stop=None):
+    """Zero-copy float32 view of a contiguous range of rows.
+
+    Only possible for float32 stores; float16 rows are converted (copied).
+    """
+    _open()
+    with _lock:
+        rows = _view()[start:stop]
+    return rows if rows.dtype == np.float32 else rows.astype("float32")
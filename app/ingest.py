@@ -0,0 +1,286 @@
+"""Bulk ingest shared by POST /report/batch and the backfill CLI.
+
+A job is a list of items written to ./data/ingest_jobs/<job_id>.json with
+their item_ids assigned up front. Items are processed in chunks: fetch and
+encode the whole chunk, then one store append and one index add. After each
+chunk a line is appended to <job_id>.progress.jsonl, so an interrupted job
+resumes at the first chunk without a progress line. Re-running a chunk is
+harmless: the store replaces records with the same item_id and the index
+skips ids it already holds. With DEDUP, a report repeating a recent item
+(or an earlier one of its chunk) is linked to it instead of being stored,
+as for POST /report; a re-run may count such a link twice.
+"""
+import fcntl
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from app import write_behind
+from app.ai.clip_model import encode_image_urls, encode_texts, image_hash
+from app.ai.dedup import dedup_locks, find_duplicates, link_duplicate
+from app.ai.faiss_index import add_vectors
+from app.ai.standing_matches import submit_found
+from app.ai.fusion import text_prompt, item_embedding, has_text_signal
+from app.config import INGEST_CHUNK_SIZE, DEDUP
+from app.db.fake_db import insert_items
+from app.utils.id_generator import generate_item_id
+
+JOBS_DIR = "./data/ingest_jobs"
+REPORT_TYPES = ("lost", "found")
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _progress_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.progress.jsonl")
+
+
+def build_record(item_id, category, location, report_type, image_url, description, embedding,
+                 image_embedding=None, text_embedding=None, image_hash=None):
+    """Item record as passed to insert_item, which moves the embeddings
+    into the vector store. The text embedding is only kept when the
+    description carries signal, so re-ranking treats the item as image-only.
+    The image hash (see clip_model.image_hash) is stored as 16 hex digits."""
+    record = {
+        "item_id": item_id,
+        "category": category,
+        "location": location,
+        "reportType": report_type,
+        "imageUrl": image_url,
+        "description": description,
+        "embedding": embedding
+    }
+    if image_embedding is not None:
+        record["image_embedding"] = image_embedding
+    if text_embedding is not None and has_text_signal(description):
+        record["text_embedding"] = text_embedding
+    if image_hash is not None:
+        record["imageHash"] = f"{image_hash:016x}"
+    return record
+
+
+def create_job(items, job_id=None, chunk_size=INGEST_CHUNK_SIZE):
+    """Persist a new job for items (dicts with image_url, description,
+    location, category, report_type) and return its id"""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job_id = job_id or uuid.uuid4().hex[:12]
+    job_items = []
+    for item in items:
+        report_type = str(item.get("report_type", "")).lower()
+        category = item.get("category") or "general"
+        job_items.append({
+            "item_id": generate_item_id(report_type, category) if report_type in REPORT_TYPES else None,
+            "image_url": item.get("image_url", ""),
+            "description": item.get("description", ""),
+            "location": item.get("location", ""),
+            "category": category,
+            "report_type": report_type
+        })
+
+    tmp_path = _job_path(job_id) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "job_id": job_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "chunk_size": chunk_size,
+            "items": job_items
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _job_path(job_id))
+    return job_id
+
+
+def _load_job(job_id):
+    with open(_job_path(job_id), 'r') as f:
+        return json.load(f)
+
+
+def _load_progress(job_id):
+    """Completed chunks as {chunk index: results}, plus whether the job finished"""
+    chunks, complete = {}, False
+    path = _progress_path(job_id)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn line from a crash: that chunk is redone
+                if entry.get("status") == "complete":
+                    complete = True
+                else:
+                    chunks[entry["chunk"]] = entry["results"]
+    return chunks, complete
+
+
+def _end_partial_line(path):
+    """Terminate a line left half-written by a crash so appends start clean"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def ingest_chunk(items):
+    """Encode and persist one chunk; returns a result per item"""
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        if item["item_id"] is None:
+            results[i] = {"item_id": None, "status": "error",
+                          "error": "Invalid report_type (use 'lost' or 'found')"}
+        else:
+            valid.append(i)
+
+    img_embs = encode_image_urls([items[i]["image_url"] for i in valid])
+    txt_embs = encode_texts([text_prompt(items[i]["description"], items[i]["location"]) for i in valid])
+
+    encoded = []
+    for i, img_emb, txt_emb in zip(valid, img_embs, txt_embs):
+        item = items[i]
+        if isinstance(img_emb, Exception):
+            results[i] = {"item_id": item["item_id"], "status": "error", "error": str(img_emb)}
+            continue
+        final_emb = item_embedding(img_emb, txt_emb, item["description"])
+        encoded.append((i, final_emb, img_emb, txt_emb, image_hash(item["image_url"])))
+
+    if not DEDUP:
+        _store_chunk(items, encoded, results)
+        return results
+    # Held from the duplicate check until the chunk is indexed, like the
+    # per-report check of POST /report
+    with dedup_locks((items[i]["report_type"], items[i]["category"]) for i, *_ in encoded):
+        originals = find_duplicates([
+            (items[i]["item_id"], items[i]["report_type"], items[i]["category"], final_emb, photo_hash)
+            for i, final_emb, _, _, photo_hash in encoded
+        ])
+        # A recent original may have been deleted since: store the report then
+        linked = {}
+        for n, original in enumerate(originals):
+            if isinstance(original, str) and link_duplicate(original):
+                linked[n] = original
+        stored = [n for n, original in enumerate(originals) if original is None or
+                  (isinstance(original, str) and n not in linked)]
+        _store_chunk(items, [encoded[n] for n in stored], results)
+        # Copies within the chunk, now that their originals are stored
+        for n, original in enumerate(originals):
+            if isinstance(original, int) and link_duplicate(items[encoded[original][0]]["item_id"]):
+                linked[n] = items[encoded[original][0]]["item_id"]
+    for n, original_id in linked.items():
+        results[encoded[n][0]] = {"item_id": original_id, "status": "duplicate"}
+    return results
+
+
+def _store_chunk(items, encoded, results):
+    """Persist and index the encoded (position, fused, image and text
+    embeddings, photo hash) items of a chunk"""
+    records, vectors, found = [], [], []
+    for i, final_emb, img_emb, txt_emb, photo_hash in encoded:
+        item = items[i]
+        records.append(build_record(
+            item["item_id"], item["category"], item["location"], item["report_type"],
+            item["image_url"], item["description"], final_emb, img_emb, txt_emb, photo_hash
+        ))
+        vectors.append(final_emb)
+        if item["report_type"] == "found":
+            found.append((item, final_emb, img_emb, txt_emb))
+        results[i] = {"item_id": item["item_id"], "status": "indexed"}
+
+    # One persistence step per chunk: store first, so a crash in between
+    # leaves items that sync_with_database or a re-run will index
+    if records:
+        insert_items(records)
+        add_vectors(vectors, [record["item_id"] for record in records])
+        # Match the new FOUND items against open LOST reports
+        for item, final_emb, img_emb, txt_emb in found:
+            submit_found(item["item_id"], final_emb, img_emb, txt_emb, item["description"])
+
+
+def run_job(job_id, progress=None):
+    """Process the remaining chunks of a job.
+
+    progress(processed, total) is called after every chunk. Returns False
+    without doing anything if another thread or process is running the job.
+    """
+    with _running_lock:
+        if job_id in _running:
+            return False
+        _running.add(job_id)
+    lock_file = open(_job_path(job_id) + ".lock", 'w')
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        job = _load_job(job_id)
+        items = job["items"]
+        done, complete = _load_progress(job_id)
+        if complete:
+            return True
+
+        # Chunk boundaries are fixed at creation so resumes line up
+        chunk_size = job["chunk_size"]
+        _end_partial_line(_progress_path(job_id))
+        with open(_progress_path(job_id), 'a') as log:
+            for chunk, start in enumerate(range(0, len(items), chunk_size)):
+                if chunk not in done:
+                    results = ingest_chunk(items[start:start + chunk_size])
+                    # A chunk only counts as done once it is on disk
+                    write_behind.durable()
+                    log.write(json.dumps({"chunk": chunk, "results": results}) + "\n")
+                    log.flush()
+                    os.fsync(log.fileno())
+                if progress:
+                    progress(min(start + chunk_size, len(items)), len(items))
+            log.write(json.dumps({"status": "complete"}) + "\n")
+        return True
+    finally:
+        lock_file.close()
+        with _running_lock:
+            _running.discard(job_id)
+
+
+def start_job(job_id):
+    """Run a job on a background thread"""
+    thread = threading.Thread(target=run_job, args=(job_id,), name=f"ingest-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def job_status(job_id):
+    """Progress and per-item results of a job, or None if it does not exist"""
+    if not os.path.exists(_job_path(job_id)):
+        return None
+    job = _load_job(job_id)
+    done, complete = _load_progress(job_id)
+    results = [result for chunk in sorted(done) for result in done[chunk]]
+    indexed = sum(1 for result in results if result["status"] == "indexed")
+    duplicates = sum(1 for result in results if result["status"] == "duplicate")
+    return {
+        "job_id": job_id,
+        "status": "complete" if complete else ("running" if job_id in _running else "pending"),
+        "total": len(job["items"]),
+        "processed": len(results),
+        "indexed": indexed,
+        "duplicates": duplicates,
+        "failed": len(results) - indexed - duplicates,
+        "results": results
+    }
+
+
+def unfinished_jobs():
+    """Ids of jobs without a completion marker"""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    job_ids = [name[:-len(".json")] for name in os.listdir(JOBS_DIR) if name.endswith(".json")]
+    return [job_id for job_id in sorted(job_ids) if not _load_progress(job_id)[1]]
@@ -1,86 +1,422 @@
-from fastapi import FastAPI, Form
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from fastapi import FastAPI, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from app import metrics, serving, write_behind
+from app.utils.log import set_level, get_level
 from app.utils.id_generator import generate_item_id
 
-from app.ai.clip_model import encode_image_url, encode_text
-from app.ai.fusion import fuse_embeddings
-from app.ai.faiss_index import add_vector
-from app.ai.matcher import find_matches, store_embedding
-from app.db.fake_db import insert_item
-from app.config import TOP_K
+from app.ai.clip_model import (
+    encode_image_url_async, encode_text_async, image_hash, batching_stats, cache_stats,
+    start_background_load, is_ready, load_error
+)
+from app.ai.dedup import dedup_lock, find_duplicate, link_duplicate
+from app.ai.image_fetch import close_async_client
+from app.ai.fusion import text_prompt, item_embedding, fusion_weights
+from app.ai.faiss_index import add_vector, remove_vector, start_compaction, apply_retention, shard_stats, ntotal
+from app.ai.index_factory import set_search_params
+from app.ai.matcher import find_matches, find_matches_batch, store_embedding, OPPOSITE_TYPE, LOCATION_SCOPES
+from app.ai.standing_matches import submit_found, events_after, last_event_id, stats as standing_stats
+from app.db.fake_db import insert_item, update_item, delete_item
+from app.ingest import build_record, create_job, start_job, job_status, unfinished_jobs
+from app.schemas.item import BatchReportRequest, FindSimilarRequest, StoreItemRequest
+from app.config import (
+    TOP_K, CLIP_LOAD_MODE, EMBEDDING_DIM, FIND_SIMILAR_MAX_QUERIES, FIND_SIMILAR_MAX_TOP_K,
+    REPORT_DURABILITY, DEDUP
+)
 
 app = FastAPI(title="Lost & Found AI System")
 
 
+@app.on_event("startup")
+def load_clip_model():
+    """Serve immediately and load CLIP off the startup path"""
+    if CLIP_LOAD_MODE == "background":
+        start_background_load()
+
+
+@app.on_event("startup")
+def follow_writer():
+    """Readers catch up with the writer's index and item log continuously"""
+    if serving.IS_READER:
+        serving.start_refresher()
+
+
+@app.on_event("startup")
+def resume_ingest_jobs():
+    """Pick up bulk ingest jobs interrupted by a crash or restart"""
+    if serving.IS_READER:
+        return
+    for job_id in unfinished_jobs():
+        print(f"Resuming ingest job {job_id}")
+        start_job(job_id)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_async_client()
+    await serving.close()
+
+
+@app.middleware("http")
+async def route_writes(request: Request, call_next):
+    """Readers hand requests that change state to the writer process"""
+    if serving.IS_READER and serving.is_writer_route(request.method, request.url.path):
+        return await serving.forward(request)
+    return await call_next(request)
+
+
+@app.get("/ready")
+def readiness():
+    """200 once the model can encode, 503 while it is still loading"""
+    if is_ready():
+        return {"status": "ready"}
+    error = load_error()
+    if error is not None:
+        return JSONResponse(status_code=503, content={"status": "error", "detail": str(error)})
+    return JSONResponse(status_code=503, content={"status": "loading"})
+
+
+@app.get("/metrics")
+def get_metrics(format: str = "prometheus"):
+    """Per-stage latency histograms and counters (Prometheus text, or ?format=json)"""
+    if format == "json":
+        return metrics.snapshot()
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/log-level")
+def read_log_level():
+    return {"level": get_level()}
+
+
+@app.post("/log-level")
+def update_log_level(level: str = Form(...)):
+    """Switch request-level debug logging on or off without a restart; only
+    in the process serving the request (see app.serving)"""
+    if level.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        raise HTTPException(status_code=400, detail="Unknown log level")
+    return {"level": set_level(level)}
+
+
+@app.get("/stats/batching")
+def get_batching_stats():
+    """Batch sizes and queue wait times of the CLIP micro-batchers"""
+    return batching_stats()
+
+
+@app.get("/stats/embedding-cache")
+def get_cache_stats():
+    """Hit/miss/eviction counters and sizes of the embedding caches"""
+    return cache_stats()
+
+
+@app.get("/stats/write-behind")
+def get_write_behind_stats():
+    """Group commits of the write-behind persistence and waiters per commit"""
+    return write_behind.stats()
+
+
+@app.get("/stats/standing-matches")
+def get_standing_match_stats():
+    """Match events recorded so far and batch sizes of the standing matcher"""
+    return standing_stats()
+
+
+@app.get("/stats/index-shards")
+def get_index_shard_stats():
+    """Vectors per index partition (report type and time shard) and the
+    shards archived by the retention policy"""
+    return shard_stats()
+
+
+@app.get("/matches/events")
+async def match_events(after: int = 0, limit: int = 100, wait: float = 0):
+    """Match events of new FOUND items against open LOST reports with
+    event_id > after, oldest first. Poll with the returned cursor as the
+    next `after`; with wait > 0 (seconds, at most 30) the request is held
+    until an event arrives."""
+    deadline = time.monotonic() + min(max(wait, 0), 30)
+    while last_event_id() <= after and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    events = await run_in_threadpool(events_after, after, min(max(limit, 1), 1000))
+    return {"events": events, "cursor": events[-1]["event_id"] if events else after}
+
+
+@app.post("/search-params")
+def update_search_params(
+    nprobe: Optional[int] = Form(None),
+    ef_search: Optional[int] = Form(None)
+):
+    """Tune IVF nprobe / HNSW efSearch of approximate partitions at runtime;
+    only in the process serving the request (see app.serving)"""
+    return set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+
 @app.post("/report")
-def report_item(
+async def report_item(
     image_url: str = Form(...),
     description: str = Form(...),
     location: str = Form(...),
     category: str = Form("general"),
-    report_type: str = Form(...)
+    report_type: str = Form(...),
+    image_weight: Optional[float] = Form(None),
+    text_weight: Optional[float] = Form(None),
+    lost_date: Optional[str] = Form(None),
+    location_scope: str = Form("any"),
+    durability: str = Form(REPORT_DURABILITY)
 ):
+    """Report an item; image_weight/text_weight override the fusion weights
+    used to re-rank this report's matches. A lost report is only matched
+    against items found on or after lost_date (ISO date), if given, and
+    location_scope decides how its location narrows the matches: "any"
+    (not at all), "nearby" (same place first) or "same" (same place only).
+    durability "memory" answers as soon as the item is stored and
+    searchable, "fsync" once it is also on disk."""
+    # Label values come from a fixed set: client text would add a series per value
+    metrics.increment("reports", report_type=report_type if report_type in OPPOSITE_TYPE else "invalid")
+    with metrics.timer("report"):
+        try:
+            weights = fusion_weights(description, image_weight, text_weight)
+            if lost_date:
+                datetime.fromisoformat(lost_date)
+        except ValueError as e:
+            return {"error": str(e)}
+        if location_scope not in LOCATION_SCOPES:
+            return {"error": f"Invalid location_scope (use one of {', '.join(LOCATION_SCOPES)})"}
+        if durability not in write_behind.DURABILITY_MODES:
+            return {"error": f"Invalid durability (use one of {', '.join(write_behind.DURABILITY_MODES)})"}
+        return await _report(image_url, description, location, category, report_type, weights,
+                             lost_date or None, location_scope, durability)
+
+
+async def _store(category, location, report_type, image_url, description, embedding,
+                 image_embedding=None, text_embedding=None, durability=REPORT_DURABILITY,
+                 photo_hash=None):
+    """Persist and index a new item; returns (item_id, duplicate). With
+    DEDUP, a report repeating a recent item (see app.ai.dedup) is linked to
+    it instead and that item's ID returned with duplicate True. A reader
+    hands this to the writer, which allocates the ID. With durability
+    "fsync" it returns once the item is on disk (group-committed with other
+    writes)."""
+    if serving.IS_READER:
+        return await serving.store_on_writer({
+            "category": category, "location": location, "report_type": report_type,
+            "image_url": image_url, "description": description,
+            "embedding": np.asarray(embedding).tolist(),
+            "image_embedding": None if image_embedding is None else np.asarray(image_embedding).tolist(),
+            "text_embedding": None if text_embedding is None else np.asarray(text_embedding).tolist(),
+            "durability": durability, "image_hash": photo_hash
+        })
+
+    if DEDUP:
+        # A thread lock, shared with bulk ingest: wait for it off the event loop
+        lock = dedup_lock(report_type, category)
+        await run_in_threadpool(lock.acquire)
+        try:
+            original = await run_in_threadpool(find_duplicate, report_type, category, embedding, photo_hash)
+            if original is not None and await run_in_threadpool(link_duplicate, original):
+                item_id, duplicate = original, True
+            else:
+                item_id, duplicate = await _insert(category, location, report_type, image_url, description,
+                                                   embedding, image_embedding, text_embedding, photo_hash), False
+        finally:
+            lock.release()
+    else:
+        item_id, duplicate = await _insert(category, location, report_type, image_url, description,
+                                           embedding, image_embedding, text_embedding, photo_hash), False
+
+    # Match found items against the open lost reports in the background
+    if report_type == "found" and not duplicate:
+        submit_found(item_id, embedding, image_embedding, text_embedding, description)
+
+    if durability == "fsync":
+        with metrics.timer("durable_wait"):
+            await write_behind.durable_async()
+    return item_id, duplicate
+
+
+async def _insert(category, location, report_type, image_url, description, embedding,
+                  image_embedding, text_embedding, photo_hash):
     # Auto-generate item ID
     item_id = generate_item_id(report_type, category)
 
+    # Store the item in database with its fused and per-modality embeddings
+    await run_in_threadpool(insert_item, build_record(
+        item_id, category, location, report_type, image_url, description, embedding,
+        image_embedding, text_embedding, photo_hash
+    ))
+
+    # Store embedding in FAISS
+    await run_in_threadpool(add_vector, embedding, item_id)
+    return item_id
+
+
+async def _report(image_url, description, location, category, report_type, weights,
+                  lost_date=None, location_scope="any", durability=REPORT_DURABILITY):
+    # Fetch/encode the image and encode the text concurrently; storage calls
+    # below block on disk, so they run in the threadpool
+    text_input = text_prompt(description, location)
     try:
-        img_emb = encode_image_url(image_url)
+        img_emb, txt_emb = await asyncio.gather(
+            encode_image_url_async(image_url),
+            encode_text_async(text_input)
+        )
     except ValueError as e:
         return {"error": str(e)}
 
-    text_input = f"a photo of {description} at {location}"
-    txt_emb = encode_text(text_input)
-
     # Adaptive fusion
-    if len(description.strip()) < 5:
-        final_emb = img_emb
-    else:
-        final_emb = fuse_embeddings(img_emb, txt_emb)
+    final_emb = item_embedding(img_emb, txt_emb, description)
+    photo_hash = await run_in_threadpool(image_hash, image_url)
 
     if report_type == "lost":
         # For lost items, find similar found items to help user find their lost item
-        matches = find_matches(final_emb, TOP_K, report_type="found")
-        
-        # Store the lost item in database with embedding
-        insert_item({
-            "item_id": item_id,
-            "category": category,
-            "location": location,
-            "reportType": report_type,
-            "imageUrl": image_url,
-            "description": description,
-            "embedding": final_emb.tolist() if hasattr(final_emb, 'tolist') else final_emb
-        })
+        # (candidates by the fused vector, re-ranked with this query's weights)
+        # among items found since the loss and, per location_scope, nearby
+        matches = await run_in_threadpool(
+            find_matches, final_emb, TOP_K, report_type="lost",
+            image_embedding=img_emb, text_embedding=txt_emb if weights[1] else None, weights=weights,
+            location=location if location_scope != "any" else None,
+            nearby_first=location_scope == "nearby", since=lost_date
+        )
 
-        # Store embedding in FAISS
-        add_vector(final_emb, item_id)
+        # Store the lost item with its embeddings
+        item_id, duplicate = await _store(category, location, report_type, image_url, description,
+                                          final_emb, img_emb, txt_emb, durability, photo_hash)
 
         return {
             "status": "success",
-            "message": "Lost item reported successfully",
+            "message": "Lost item already reported" if duplicate else "Lost item reported successfully",
             "item_id": item_id,
+            "duplicate": duplicate,
+            "embedding": np.asarray(final_emb).tolist(),
             "matches": matches
         }
 
     elif report_type == "found":
         # For found items, just store them to help others find their lost items
-        # Store the found item in database with embedding
-        insert_item({
-            "item_id": item_id,
-            "category": category,
-            "location": location,
-            "reportType": report_type,
-            "imageUrl": image_url,
-            "description": description,
-            "embedding": final_emb.tolist() if hasattr(final_emb, 'tolist') else final_emb
-        })
-
-        # Store embedding in FAISS
-        add_vector(final_emb, item_id)
+        item_id, duplicate = await _store(category, location, report_type, image_url, description,
+                                          final_emb, img_emb, txt_emb, durability, photo_hash)
 
         return {
             "status": "success",
-            "message": "Found item reported successfully",
-            "item_id": item_id
+            "message": "Found item already reported" if duplicate else "Found item reported successfully",
+            "item_id": item_id,
+            "duplicate": duplicate,
+            "embedding": np.asarray(final_emb).tolist()
         }
 
-    return {"error": "Invalid report_type (use 'lost' or 'found')"}
\ No newline at end of file
+    return {"error": "Invalid report_type (use 'lost' or 'found')"}
+
+
+@app.post("/find-similar")
+def find_similar(request: FindSimilarRequest):
+    """Matches for a stored or new embedding, e.g. the one /report returns.
+
+    {"embedding": [...]} returns {"matches": [...]}; {"embeddings": [[...],
+    ...]} runs all of them as one batched search and returns {"results":
+    [{"matches": [...]}, ...]} in query order. Matches are thresholded and
+    hydrated like those of /report and, given report_type, drawn from the
+    opposite type only."""
+    queries = request.embeddings if request.embeddings is not None else (
+        [request.embedding] if request.embedding is not None else [])
+    if not queries:
+        raise HTTPException(status_code=400, detail="Provide embedding or embeddings")
+    if len(queries) > FIND_SIMILAR_MAX_QUERIES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {FIND_SIMILAR_MAX_QUERIES} embeddings per request")
+    if not 1 <= request.top_k <= FIND_SIMILAR_MAX_TOP_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be 1 to {FIND_SIMILAR_MAX_TOP_K}")
+    if request.report_type is not None and request.report_type not in OPPOSITE_TYPE:
+        raise HTTPException(status_code=400, detail="Invalid report_type (use 'lost' or 'found')")
+    if any(len(query) != EMBEDDING_DIM for query in queries):
+        raise HTTPException(status_code=400, detail=f"Embeddings must have {EMBEDDING_DIM} values")
+
+    # Scores are cosine similarities, like those of the stored vectors
+    matrix = np.asarray(queries, dtype="float32")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    if not np.isfinite(norms).all() or (norms == 0).any():
+        raise HTTPException(status_code=400, detail="Embeddings must be finite and non-zero")
+
+    metrics.increment("find_similar_queries", len(queries))
+    with metrics.timer("find_similar"):
+        matches = find_matches_batch(matrix / norms, request.top_k, report_type=request.report_type,
+                                     category=request.category)
+    if request.embeddings is None:
+        return {"matches": matches[0]}
+    return {"results": [{"matches": found} for found in matches]}
+
+
+@app.post("/internal/items")
+async def store_item(request: StoreItemRequest):
+    """Persist and index an item a reader process encoded (writer only)"""
+    if serving.IS_READER:
+        raise HTTPException(status_code=409, detail="Reader processes do not store items")
+    def vector(values):
+        return None if values is None else np.asarray(values, dtype="float32")
+    item_id, duplicate = await _store(request.category, request.location, request.report_type,
+                                      request.image_url, request.description, vector(request.embedding),
+                                      vector(request.image_embedding), vector(request.text_embedding),
+                                      request.durability, request.image_hash)
+    return {"item_id": item_id, "duplicate": duplicate}
+
+
+@app.post("/items/{item_id}/resolve")
+def resolve_item(item_id: str):
+    """Mark an item as resolved (returned to its owner) and stop matching it"""
+    item = update_item(item_id, {"status": "resolved", "resolved_at": datetime.utcnow().isoformat()})
+    if item is None:
+        raise HTTPException(status_code=404, detail="Unknown item_id")
+    remove_vector(item_id)
+    return {"status": "success", "item_id": item_id}
+
+
+@app.delete("/items/{item_id}")
+def remove_item(item_id: str):
+    """Delete an item from storage and from search"""
+    if not delete_item(item_id):
+        raise HTTPException(status_code=404, detail="Unknown item_id")
+    remove_vector(item_id)
+    return {"status": "success", "item_id": item_id}
+
+
+@app.post("/index/compact", status_code=202)
+def compact():
+    """Start reclaiming the space of deleted vectors now instead of waiting
+    for the background compaction. Rebuilding an approximate partition can
+    take minutes, so this returns at once; GET /stats/index-shards shows
+    the deleted counts going down. Vector store rows are not reclaimed (see
+    app.db.vector_store)."""
+    started = start_compaction(force=True)
+    return {"status": "started" if started else "already running", "items": ntotal()}
+
+
+@app.post("/index/retention")
+def retire_shards():
+    """Retire the time shards past INDEX_RETENTION_DAYS now instead of on
+    the next add"""
+    return {"status": "success", "retired": apply_retention(), "items": ntotal()}
+
+
+@app.post("/report/batch")
+def report_batch(request: BatchReportRequest):
+    """Queue many items for bulk ingest; poll GET /report/batch/{job_id}"""
+    job_id = create_job([item.dict() for item in request.items])
+    start_job(job_id)
+    return {
+        "status": "accepted",
+        "job_id": job_id,
+        "total": len(request.items)
+    }
+
+
+@app.get("/report/batch/{job_id}")
+def report_batch_status(job_id: str):
+    status = job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    return status
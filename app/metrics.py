@@ -0,0 +1,141 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process latency histograms per pipeline stage and event counters,
+# exported by GET /metrics. Recording is a perf_counter pair, a bisect and
+# a few increments under a lock.
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class Histogram:
+    """Bucketed latency distribution with count and sum"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def observe(stage, seconds):
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+
+def increment(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def timer(stage):
+    """Time the body of a with block as one observation of stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """Decorator recording every call of a function under stage"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot():
+    """Counters and per-stage count/mean/p50/p95/p99/max in milliseconds"""
+    with _lock:
+        stages = {
+            stage: {
+                "count": h.count,
+                "mean_ms": round(1000 * h.sum / h.count, 3) if h.count else 0.0,
+                "p50_ms": round(1000 * h.quantile(0.50), 3),
+                "p95_ms": round(1000 * h.quantile(0.95), 3),
+                "p99_ms": round(1000 * h.quantile(0.99), 3),
+                "max_ms": round(1000 * h.max, 3),
+            }
+            for stage, h in sorted(_histograms.items())
+        }
+        counters = {}
+        for (name, labels), value in sorted(_counters.items()):
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            counters[f"{name}{{{label}}}" if label else name] = value
+    return {"stages": stages, "counters": counters}
+
+
+def _escape(value):
+    """Label value escaped as the exposition format requires"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format"""
+    lines = ["# TYPE foundry_stage_seconds histogram"]
+    with _lock:
+        for stage, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.buckets):
+                cumulative += n
+                lines.append(f'foundry_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'foundry_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'foundry_stage_seconds_sum{{stage="{stage}"}} {h.sum:.6f}')
+            lines.append(f'foundry_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        names = sorted({name for name, _ in _counters})
+        for name in names:
+            lines.append(f"# TYPE foundry_{name}_total counter")
+            for (counter, labels), value in sorted(_counters.items()):
+                if counter == name:
+                    lines.append(f"foundry_{name}_total{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
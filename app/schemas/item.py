@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 class ItemPayload(BaseModel):
@@ -6,3 +7,36 @@ class ItemPayload(BaseModel):
     location: str
     category: str
     report_type: str  # "lost" or "found"
+
+class BatchReportItem(BaseModel):
+    image_url: str
+    description: str
+    location: str
+    category: str = "general"
+    report_type: str  # "lost" or "found"
+
+class BatchReportRequest(BaseModel):
+    items: List[BatchReportItem]
+
+class StoreItemRequest(BaseModel):
+    """An item encoded by a reader process, stored by the writer"""
+    image_url: str
+    description: str
+    location: str
+    category: str
+    report_type: str
+    embedding: List[float]
+    image_embedding: Optional[List[float]] = None
+    text_embedding: Optional[List[float]] = None
+    durability: str = "fsync"
+    image_hash: Optional[int] = None
+
+class FindSimilarRequest(BaseModel):
+    """One query vector (embedding) or many (embeddings) to match.
+    report_type is the type of the querying item: matches come from the
+    opposite one."""
+    embedding: Optional[List[float]] = None
+    embeddings: Optional[List[List[float]]] = None
+    top_k: int = 5
+    report_type: Optional[str] = None
+    category: Optional[str] = None
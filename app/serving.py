@@ -0,0 +1,101 @@
+"""Multi-process serving: one writer process and any number of readers.
+
+The writer (SERVE_ROLE="writer", or "single") owns ingest, the item log,
+the FAISS WAL and snapshots. Readers (SERVE_ROLE="reader") share the
+writer's memory-mapped snapshot, follow its WAL and item log in a
+background thread, and hand every request that changes state to the
+writer at WRITER_URL.
+
+Runtime knobs (POST /search-params, POST /log-level) are per process: they
+change only the process that serves the request, so with several workers
+each one has to be reached (or the setting put in its config).
+"""
+import threading
+import time
+
+import httpx
+from fastapi import Response
+
+from app import metrics
+from app.ai import faiss_index
+from app.config import SERVE_ROLE, WRITER_URL, READER_REFRESH_SECONDS
+from app.db import fake_db
+
+IS_READER = SERVE_ROLE == "reader"
+
+# (method, path prefix) of the requests only the writer serves
+WRITER_ROUTES = (
+    ("POST", "/report/batch"),
+    ("GET", "/report/batch/"),
+    ("POST", "/items/"),
+    ("DELETE", "/items/"),
+    ("POST", "/index/compact"),
+    ("POST", "/index/retention"),
+    ("GET", "/stats/index-shards"),
+    ("GET", "/matches/events"),
+    ("GET", "/stats/standing-matches"),
+)
+
+_client = None
+_refresher = None
+
+
+def _writer():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=WRITER_URL, timeout=30)
+    return _client
+
+
+def is_writer_route(method, path):
+    return any(method == m and path.startswith(prefix) for m, prefix in WRITER_ROUTES)
+
+
+async def forward(request):
+    """Replay a request on the writer and relay its response"""
+    headers = {name: value for name, value in request.headers.items()
+               if name in ("content-type", "accept")}
+    response = await _writer().request(
+        request.method, request.url.path, params=request.query_params,
+        content=await request.body(), headers=headers
+    )
+    return Response(content=response.content, status_code=response.status_code,
+                    media_type=response.headers.get("content-type"))
+
+
+async def store_on_writer(record):
+    """Have the writer persist and index a new item; returns (item_id,
+    duplicate) like main._store"""
+    response = await _writer().post("/internal/items", json=record)
+    response.raise_for_status()
+    body = response.json()
+    return body["item_id"], body.get("duplicate", False)
+
+
+def refresh():
+    """Catch up with the writer. The index goes first: the writer stores an
+    item before indexing it, so every hit can then be hydrated."""
+    with metrics.timer("refresh"):
+        faiss_index.refresh()
+        fake_db.refresh()
+
+
+def _follow():
+    while True:
+        time.sleep(READER_REFRESH_SECONDS)
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Error refreshing from the writer: {e}")
+
+
+def start_refresher():
+    global _refresher
+    if _refresher is None:
+        _refresher = threading.Thread(target=_follow, name="reader-refresh", daemon=True)
+        _refresher.start()
+
+
+async def close():
+    if _client is not None:
+        await _client.aclose()
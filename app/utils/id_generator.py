@@ -1,13 +1,81 @@
-import random
+import fcntl
+import json
+import os
 import string
+import threading
+import zlib
+from app.config import ID_BLOCK_SIZE
+from app.db.fake_db import has_item
+
+# IDs are PREFIX-CODE, e.g. LOST-WALLET-A9F2. The code is the next number
+# of a per-prefix sequence, so IDs never repeat; it is scrambled so that
+# consecutive IDs do not read as a counter. Processes reserve blocks of
+# sequence numbers from SEQUENCE_PATH under an exclusive lock on LOCK_PATH
+# and hand them out from memory; numbers of a block left unused by a
+# restart are skipped, never reissued.
+SEQUENCE_PATH = "./data/id_sequences.json"
+LOCK_PATH = "./data/id_sequences.lock"
+ALPHABET = string.digits + string.ascii_uppercase
+CODE_WIDTH = 4
+# Coprime with every 36 ** width (odd, not a multiple of 3), so that
+# n -> (n * MULTIPLIER + offset) % 36 ** width is a permutation; the
+# offset differs per prefix
+MULTIPLIER = 2654435761
+
+_lock = threading.Lock()
+# prefix -> [next sequence number, end of the reserved block]
+_blocks = {}
+
+
+def _code(sequence, offset=0):
+    """Base-36 code of a sequence number: the first 36**4 numbers map to
+    distinct 4-character codes, the next 36**5 to 5 characters, and so on"""
+    width = CODE_WIDTH
+    while sequence >= len(ALPHABET) ** width:
+        sequence -= len(ALPHABET) ** width
+        width += 1
+    n = (sequence * MULTIPLIER + offset) % len(ALPHABET) ** width
+    chars = []
+    for _ in range(width):
+        n, digit = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def _reserve(prefix, size=ID_BLOCK_SIZE):
+    """Reserve the next size sequence numbers of prefix for this process"""
+    os.makedirs(os.path.dirname(SEQUENCE_PATH), exist_ok=True)
+    with open(LOCK_PATH, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sequences = {}
+        if os.path.exists(SEQUENCE_PATH):
+            with open(SEQUENCE_PATH, 'r') as f:
+                sequences = json.load(f)
+        start = sequences.get(prefix, 0)
+        sequences[prefix] = start + size
+        tmp_path = SEQUENCE_PATH + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sequences, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SEQUENCE_PATH)
+    return [start, start + size]
+
 
 def generate_item_id(report_type: str, category: str) -> str:
     """
     Generates a human-readable unique item ID
     Example: LOST-WALLET-A9F2
     """
-    random_code = ''.join(
-        random.choices(string.ascii_uppercase + string.digits, k=4)
-    )
-
-    return f"{report_type.upper()}-{category.upper()}-{random_code}"
+    prefix = f"{report_type.upper()}-{category.upper()}"
+    with _lock:
+        while True:
+            block = _blocks.get(prefix)
+            if block is None or block[0] >= block[1]:
+                block = _blocks[prefix] = _reserve(prefix)
+            sequence = block[0]
+            block[0] += 1
+            item_id = f"{prefix}-{_code(sequence, zlib.crc32(prefix.encode()))}"
+            # IDs drawn at random before the sequences existed may be taken
+            if not has_item(item_id):
+                return item_id
@@ -0,0 +1,27 @@
+import re
+
+# Words that describe where inside or around a place something was, not
+# which place: "2nd floor of the Main Library" and "main library, near the
+# entrance" are the same place for matching. A number right after one of
+# them ("room 204", "level 2") goes too.
+_QUALIFIERS = {
+    "a", "an", "the", "of", "at", "in", "on", "by", "near", "next", "to", "outside",
+    "inside", "behind", "front", "around", "floor", "level", "room", "rm", "area",
+    "entrance", "exit", "hall", "hallway", "corridor", "lobby", "ground", "basement",
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ORDINAL = re.compile(r"\d+(st|nd|rd|th)")
+
+
+def normalize_location(location):
+    """Key that spellings of the same place share, e.g. "Main Library, 2nd
+    floor" and "the main library" both give "library main"; "" when the
+    location names no place"""
+    tokens, previous = set(), None
+    for token in _TOKEN.findall((location or "").lower()):
+        if token in _QUALIFIERS or _ORDINAL.fullmatch(token):
+            pass
+        elif not (token.isdigit() and previous in _QUALIFIERS):
+            tokens.add(token)
+        previous = token
+    return " ".join(sorted(tokens))
@@ -0,0 +1,23 @@
+import logging
+from app.config import LOG_LEVEL
+
+# Parent of every module logger (logging.getLogger(__name__) under app.*).
+# Per-request detail is logged at DEBUG so it costs a level check unless
+# switched on with set_level, which takes effect without a restart.
+logger = logging.getLogger("app")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(LOG_LEVEL)
+
+
+def set_level(level):
+    """Change the level of every app logger; returns the new level name"""
+    logger.setLevel(level.upper())
+    return get_level()
+
+
+def get_level():
+    return logging.getLevelName(logger.level)
@@ -0,0 +1,121 @@
+"""Write-behind persistence with group commit.
+
+With WRITE_BEHIND, the vector store, the item log and the FAISS WAL skip
+the fsync on every append: the data is written to the OS, so searches and
+reader processes see it at once and a crash of the process loses nothing,
+but a power loss can. One committer thread makes it durable: it fsyncs the
+three files whenever a caller waits for durability (durable() /
+durable_async()), and at least every WRITE_BEHIND_FLUSH_MS while there are
+unsynced writes. Callers that wait while an fsync is running are all served
+by the next one, so under concurrent ingest many writes share an fsync.
+
+Files are synced in dependency order, vectors, then item records, then the
+WAL, so every write made before a flush is durable with everything it
+depends on once the flush returns. Writes made while it runs may reach the
+disk out of order (as may any write the OS flushes on its own), which
+recovery repairs after a power loss: fake_db drops records whose vector
+rows are gone, sync_with_database removes index entries without a record
+and indexes records whose WAL entry was lost. FAISS snapshots sync the item
+store after copying the index, so a snapshot never holds an item whose
+record was not durable.
+"""
+import asyncio
+import atexit
+import threading
+import time
+from concurrent.futures import Future
+
+from app import metrics
+from app.ai import faiss_index
+from app.config import WRITE_BEHIND, WRITE_BEHIND_FLUSH_MS
+from app.db import fake_db, vector_store
+
+DURABILITY_MODES = ("memory", "fsync")
+
+_cond = threading.Condition()
+_waiting = []
+_thread = None
+_commits = 0
+_waits = 0
+
+
+def flush():
+    """fsync every write made so far, in dependency order; returns whether
+    there was anything to sync"""
+    start = time.perf_counter()
+    synced = [vector_store.sync(), fake_db.sync(), faiss_index.sync_wal()]
+    if any(synced):
+        metrics.observe("group_commit", time.perf_counter() - start)
+    return any(synced)
+
+
+def _run():
+    global _commits, _waits
+    interval = WRITE_BEHIND_FLUSH_MS / 1000.0
+    while True:
+        with _cond:
+            if not _waiting:
+                _cond.wait(interval)
+            batch, _waiting[:] = list(_waiting), []
+        try:
+            flush()
+        except Exception as e:
+            for future in batch:
+                future.set_exception(e)
+            continue
+        for future in batch:
+            future.set_result(None)
+        if batch:
+            with _cond:
+                _commits += 1
+                _waits += len(batch)
+            metrics.increment("group_commit_waiters", len(batch))
+
+
+def start():
+    """Start the committer thread (once)"""
+    global _thread
+    with _cond:
+        if _thread is None and WRITE_BEHIND:
+            _thread = threading.Thread(target=_run, name="write-behind", daemon=True)
+            _thread.start()
+            atexit.register(flush)
+
+
+def request_commit():
+    """Future that completes once every write made before the call is durable"""
+    future = Future()
+    if not WRITE_BEHIND:
+        # Every write was fsynced in place
+        future.set_result(None)
+        return future
+    start()
+    with _cond:
+        _waiting.append(future)
+        _cond.notify()
+    return future
+
+
+def durable():
+    """Block until the caller's writes so far are on disk"""
+    request_commit().result()
+
+
+async def durable_async():
+    """durable() without holding up the event loop"""
+    await asyncio.wrap_future(request_commit())
+
+
+def stats():
+    """Group commits served to waiting callers and how many each covered"""
+    with _cond:
+        return {
+            "enabled": WRITE_BEHIND,
+            "commits": _commits,
+            "waiters": _waits,
+            "avg_waiters_per_commit": _waits / _commits if _commits else 0.0,
+        }
+
+
+if not fake_db.READ_ONLY:
+    start()
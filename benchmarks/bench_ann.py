@@ -0,0 +1,100 @@
+"""Recall@K vs latency of approximate indexes against the exact flat index.
+
+Uses app.ai.index_factory (the same code that migrates partitions) on a
+clustered synthetic set of normalized 512-d vectors, sweeping efSearch for
+HNSW and nprobe for IVF indexes.
+
+    python -m benchmarks.bench_ann --items 100000 --queries 500
+    python -m benchmarks.bench_ann --factories "HNSW32,Flat" "IVF{nlist},PQ64" --json ann.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.ai.index_factory import build_index, factory_key, make_search_params  # noqa: E402
+
+DIM = 512
+
+
+def clustered_vectors(rng, centers, n, spread):
+    x = centers[rng.integers(0, len(centers), n)] + spread * rng.standard_normal((n, DIM)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def measure(index, queries, truth, top_k, params):
+    latencies, hits = [], 0
+    for q, t in zip(queries, truth):
+        start = time.perf_counter()
+        _, indices = index.search(q.reshape(1, DIM), top_k, params=params)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(indices[0]) & set(t))
+    return hits / (len(queries) * top_k), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--factories", nargs="+", default=["HNSW32,Flat", "IVF{nlist},Flat"])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--spread", type=float, default=1.0,
+                        help="within-cluster noise; higher makes neighbours harder to find")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((256, DIM)).astype("float32")
+    vectors = clustered_vectors(rng, centers, args.items, args.spread)
+    queries = clustered_vectors(rng, centers, args.queries, args.spread)
+
+    flat = faiss.IndexFlatIP(DIM)
+    flat.add(vectors)
+    _, truth = flat.search(queries, args.top_k)
+
+    rows = []
+
+    def report(name, param, build_s, index, params):
+        recall, latencies = measure(index, queries, truth, args.top_k, params)
+        row = {
+            "index": name, "param": param, "build_s": round(build_s, 2),
+            "size_mb": round(faiss.serialize_index(index).nbytes / 2**20, 1),
+            "recall": round(recall, 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        }
+        rows.append(row)
+        print(f"{name:<22}{param:<14}{row['build_s']:>9}{row['size_mb']:>10}"
+              f"{row['recall']:>9.4f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}", flush=True)
+
+    print(f"{args.items} vectors, {args.queries} queries, recall@{args.top_k} vs exact")
+    print(f"{'index':<22}{'param':<14}{'build s':>9}{'size MB':>10}{'recall':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    report("Flat", "-", 0.0, flat, None)
+
+    for factory in args.factories:
+        start = time.perf_counter()
+        index = build_index(vectors, factory)
+        build_s = time.perf_counter() - start
+        name = factory_key(args.items, factory)
+        if factory.startswith("HNSW"):
+            for ef in args.ef_search:
+                report(name, f"efSearch={ef}", build_s, index, make_search_params(index, ef_search=ef))
+        else:
+            for nprobe in args.nprobe:
+                report(name, f"nprobe={nprobe}", build_s, index, make_search_params(index, nprobe=nprobe))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"items": args.items, "queries": args.queries, "top_k": args.top_k, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Encode throughput with and without micro-batching at 1-64 concurrent clients.
+
+Each client thread calls the encoder in a loop for a fixed duration. The
+"numpy" backend stands in for CLIP with a two-layer MLP whose cost, like a
+transformer forward pass, is dominated by matmuls that get cheaper per row
+as the batch grows. "clip" runs the real ViT-B/32 image tower on random
+preprocessed tensors (needs torch and clip installed).
+
+    python -m benchmarks.bench_batching --clients 1 4 16 64 --seconds 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.ai.batching import MicroBatcher  # noqa: E402
+
+
+def numpy_backend(in_dim=4096, hidden=4096, out_dim=512):
+    rng = np.random.default_rng(0)
+    w1 = rng.standard_normal((in_dim, hidden)).astype("float32") / np.sqrt(in_dim)
+    w2 = rng.standard_normal((hidden, out_dim)).astype("float32") / np.sqrt(hidden)
+
+    def encode_batch(items):
+        x = np.stack(items)
+        emb = np.maximum(x @ w1, 0) @ w2
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+        return list(emb)
+
+    def make_input():
+        return rng.standard_normal(in_dim).astype("float32")
+
+    return encode_batch, make_input
+
+
+def clip_backend():
+    import torch
+    from app.ai.clip_model import encode_image_batch
+
+    def make_input():
+        return torch.randn(3, 224, 224)
+
+    return encode_image_batch, make_input
+
+
+def run(encode, make_input, clients, seconds):
+    inputs = [make_input() for _ in range(clients)]
+    counts = [0] * clients
+    latencies = [[] for _ in range(clients)]
+    stop = time.monotonic() + seconds
+
+    def client(i):
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            encode(inputs[i])
+            latencies[i].append(time.perf_counter() - start)
+            counts[i] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    all_latencies = np.concatenate([np.array(l) for l in latencies if l])
+    return sum(counts) / elapsed, float(np.percentile(all_latencies, 50) * 1000), \
+        float(np.percentile(all_latencies, 95) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["numpy", "clip"], default="numpy")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    encode_batch, make_input = numpy_backend() if args.backend == "numpy" else clip_backend()
+
+    def unbatched(item):
+        return encode_batch([item])[0]
+
+    print(f"backend={args.backend} max_batch={args.max_batch} window={args.window_ms}ms")
+    print(f"{'clients':>8}{'mode':>10}{'items/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'avg batch':>11}{'avg wait ms':>13}")
+    for clients in args.clients:
+        throughput, p50, p95 = run(unbatched, make_input, clients, args.seconds)
+        print(f"{clients:>8}{'single':>10}{throughput:>10.1f}{p50:>10.2f}{p95:>10.2f}{1:>11.2f}{0:>13.2f}")
+
+        batcher = MicroBatcher("bench", encode_batch, args.max_batch, args.window_ms)
+        throughput, p50, p95 = run(batcher, make_input, clients, args.seconds)
+        stats = batcher.stats()
+        print(f"{clients:>8}{'batched':>10}{throughput:>10.1f}{p50:>10.2f}{p95:>10.2f}"
+              f"{stats['avg_batch_size']:>11.2f}{stats['avg_queue_wait_ms']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
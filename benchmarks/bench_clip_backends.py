@@ -0,0 +1,162 @@
+"""Throughput and accuracy of the CLIP inference backends on CPU.
+
+Encodes a fixed image set (--image-dir, or --images deterministic
+synthetic JPEGs from benchmarks.image_server) and a fixed set of prompts
+with each of --backends, each in its own process with the given intra-op
+and inter-op thread counts. Reported per backend:
+
+  * load:     seconds to load the model (ONNX: export/quantize on first use)
+  * img/s:    images per second of encode_image_batch for each --batch-sizes
+              (preprocessing excluded; it is the same for every backend)
+  * text/s:   prompts per second at the largest batch size
+  * cos:      mean and minimum cosine similarity of the image and text
+              embeddings to those of the fp32 "clip" backend
+  * nn-agree: fraction of images whose nearest image and best-matching
+              prompt are the same as with fp32 embeddings
+
+    python -m benchmarks.bench_clip_backends --backends clip clip-int8 onnx onnx-int8
+    python -m benchmarks.bench_clip_backends --image-dir photos/ --threads 4 --inter-op 1
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE = "clip"
+
+PROMPTS = [
+    f"a photo of {thing} at {place}"
+    for thing in ("a black leather wallet", "a red backpack", "a silver laptop", "a set of keys",
+                  "a blue water bottle", "an umbrella", "a student id card", "wireless earbuds")
+    for place in ("the library", "the gym", "the cafeteria", "lecture hall 2")
+]
+
+
+def load_images(args):
+    from PIL import Image
+
+    if args.image_dir:
+        names = sorted(os.listdir(args.image_dir))[:args.images]
+        return [Image.open(os.path.join(args.image_dir, name)).convert("RGB") for name in names]
+    from io import BytesIO
+    from benchmarks.image_server import render_image
+    return [Image.open(BytesIO(render_image(seed, 640, 480, "jpg"))).convert("RGB")
+            for seed in range(args.images)]
+
+
+def run_backend(args):
+    """Worker: load one backend, time it and save its embeddings"""
+    import app.config
+    app.config.CLIP_BACKEND = args.backend
+    app.config.CLIP_INTRA_OP_THREADS = args.threads
+    app.config.CLIP_INTER_OP_THREADS = args.inter_op
+    if args.onnx_dir:
+        app.config.CLIP_ONNX_DIR = args.onnx_dir
+    module = "onnx_backend" if args.backend.startswith("onnx") else "clip_backend"
+    backend = importlib.import_module(f"app.ai.{module}")
+
+    start = time.perf_counter()
+    backend.load()
+    result = {"backend": args.backend, "load_s": time.perf_counter() - start, "images_per_s": {}}
+
+    images = [backend.preprocess(image) for image in load_images(args)]
+    backend.encode_image_batch(images[:max(args.batch_sizes)])  # warm-up
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            backend.encode_image_batch(images[i:i + batch_size])
+        result["images_per_s"][str(batch_size)] = len(images) / (time.perf_counter() - start)
+
+    batch_size = max(args.batch_sizes)
+    image_embeddings = np.concatenate([
+        np.stack(backend.encode_image_batch(images[i:i + batch_size]))
+        for i in range(0, len(images), batch_size)
+    ])
+    backend.encode_text_batch(PROMPTS[:batch_size])  # warm-up
+    start = time.perf_counter()
+    text_embeddings = np.concatenate([
+        np.stack(backend.encode_text_batch(PROMPTS[i:i + batch_size]))
+        for i in range(0, len(PROMPTS), batch_size)
+    ])
+    result["texts_per_s"] = len(PROMPTS) / (time.perf_counter() - start)
+    np.savez(args.out + ".npz", images=image_embeddings.astype("float32"),
+             texts=text_embeddings.astype("float32"))
+    with open(args.out, "w") as f:
+        json.dump(result, f)
+
+
+def agreement(embeddings, reference):
+    """Cosine to the reference embeddings and nearest-neighbour agreement"""
+    images, texts = embeddings["images"], embeddings["texts"]
+    ref_images, ref_texts = reference["images"], reference["texts"]
+    cos = np.concatenate([(images * ref_images).sum(axis=1), (texts * ref_texts).sum(axis=1)])
+
+    def nearest_image(x):
+        sims = x @ x.T
+        np.fill_diagonal(sims, -np.inf)
+        return sims.argmax(axis=1)
+
+    same = np.concatenate([
+        nearest_image(images) == nearest_image(ref_images),
+        (images @ texts.T).argmax(axis=1) == (ref_images @ ref_texts.T).argmax(axis=1),
+    ])
+    return float(cos.mean()), float(cos.min()), float(same.mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["clip", "clip-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--images", type=int, default=128, help="number of images")
+    parser.add_argument("--image-dir", help="directory of photos to use instead of synthetic images")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = runtime default)")
+    parser.add_argument("--inter-op", type=int, default=0, help="inter-op threads (0 = runtime default)")
+    parser.add_argument("--onnx-dir", help="where ONNX graphs are exported and reused (default: config)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args)
+        return
+
+    backends = [REFERENCE] + [backend for backend in args.backends if backend != REFERENCE]
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        for backend in backends:
+            print(f"Running {backend}", file=sys.stderr, flush=True)
+            out = os.path.join(work, f"{backend}.json")
+            command = [sys.executable, "-m", "benchmarks.bench_clip_backends", "--worker",
+                       "--backend", backend, "--out", out] + sys.argv[1:]
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            if subprocess.run(command, env=env).returncode != 0:
+                print(f"{backend} failed", file=sys.stderr)
+                continue
+            with open(out) as f:
+                results[backend] = json.load(f)
+            results[backend]["embeddings"] = dict(np.load(out + ".npz"))
+
+    if REFERENCE not in results:
+        sys.exit("the fp32 reference backend failed")
+    reference = results[REFERENCE]["embeddings"]
+    threads = f"{args.threads or 'default'} intra-op / {args.inter_op or 'default'} inter-op threads"
+    print(f"{args.images} images, {len(PROMPTS)} prompts, {threads}")
+    header = "".join(f"{f'img/s b{b}':>11}" for b in args.batch_sizes)
+    print(f"{'backend':<11}{'load s':>8}{header}{'text/s':>9}{'cos mean':>10}{'cos min':>9}{'nn-agree':>10}")
+    for backend, result in results.items():
+        cos_mean, cos_min, same = agreement(result["embeddings"], reference)
+        rates = "".join(f"{result['images_per_s'][str(b)]:>11.1f}" for b in args.batch_sizes)
+        print(f"{backend:<11}{result['load_s']:>8.1f}{rates}{result['texts_per_s']:>9.1f}"
+              f"{cos_mean:>10.4f}{cos_min:>9.4f}{same:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Decode time and peak memory of full-size vs reduced image decoding.
+
+Encodes --images deterministic synthetic photos per format (JPEG, PNG,
+WebP from benchmarks.image_server) at each --sizes to files, then decodes them
+through app.ai.image_decode.decode_rgb with min_side 0 (full size, the old
+path) and with --min-side (reduced: JPEG DCT scaling, then an integer box
+reduce), each followed by CLIP's preprocessing resize (bicubic short side
+to 224, center crop). Every (format, size, mode) runs in its own process
+so peak memory is not inherited. Reported:
+
+  * decode ms:   median decode_rgb time per image
+  * prep ms:     median time of the 224 resize + crop after it
+  * decoded:     size of the decoded image handed to preprocessing
+  * peak MB:     growth of the process's peak RSS while decoding
+  * diff:        mean / max absolute difference (0-255) of the 224x224
+                 preprocessed pixels from those of the full-size path
+
+    python -m benchmarks.bench_decode --sizes 4000x3000 2000x1500 1024x768
+    python -m benchmarks.bench_decode --formats jpg --min-side 336
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT_SIZE = 224
+
+
+def clip_resize(image):
+    """Resize + center crop of CLIP preprocessing, as uint8 pixels"""
+    from PIL import Image
+
+    width, height = image.size
+    if width <= height:
+        size = (INPUT_SIZE, int(INPUT_SIZE * height / width))
+    else:
+        size = (int(INPUT_SIZE * width / height), INPUT_SIZE)
+    image = image.resize(size, Image.BICUBIC)
+    left, top = round((size[0] - INPUT_SIZE) / 2), round((size[1] - INPUT_SIZE) / 2)
+    return np.asarray(image.crop((left, top, left + INPUT_SIZE, top + INPUT_SIZE)))
+
+
+def peak_rss_mb():
+    # VmHWM is reset by exec, unlike ru_maxrss, which a child starts off
+    # with from its parent on Linux
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(args):
+    """Worker: decode one format/size with one min_side and save the pixels"""
+    from benchmarks.image_server import render_image
+    from app.ai.image_decode import decode_rgb
+
+    images = []
+    for path in args.paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    clip_resize(decode_rgb(render_image(0, 64, 48, args.format), 0))  # warm-up (codec init)
+    baseline = peak_rss_mb()
+    decode_times, prep_times, pixels = [], [], []
+    for data in images:
+        start = time.perf_counter()
+        image = decode_rgb(data, args.case_min_side)
+        decoded = time.perf_counter()
+        pixels.append(clip_resize(image))
+        prep_times.append(time.perf_counter() - decoded)
+        decode_times.append(decoded - start)
+        decoded_size = image.size
+        del image
+    np.save(args.out + ".npy", np.stack(pixels))
+    with open(args.out, "w") as f:
+        json.dump({
+            "decode_ms": float(np.median(decode_times) * 1000),
+            "prep_ms": float(np.median(prep_times) * 1000),
+            "decoded": "x".join(map(str, decoded_size)),
+            "peak_mb": peak_rss_mb() - baseline,
+            "bytes": int(np.mean([len(data) for data in images])),
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", default=["jpg", "png", "webp"])
+    parser.add_argument("--sizes", nargs="+", default=["4000x3000", "2000x1500", "1024x768"])
+    parser.add_argument("--images", type=int, default=8, help="images per format and size")
+    parser.add_argument("--min-side", type=int, default=None,
+                        help="reduced decode target (default: IMAGE_DECODE_MIN_SIDE)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--format", help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs="+", help=argparse.SUPPRESS)
+    parser.add_argument("--case-min-side", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_case(args)
+        return
+
+    if args.min_side is None:
+        from app.config import IMAGE_DECODE_MIN_SIDE
+        args.min_side = IMAGE_DECODE_MIN_SIDE
+    import tempfile
+    from benchmarks.image_server import render_image
+
+    print(f"{args.images} images per case, reduced decode to a shorter side >= {args.min_side}")
+    print(f"{'format':<7}{'size':>11}{'KB':>7}{'mode':>9}{'decoded':>11}{'decode ms':>11}"
+          f"{'prep ms':>9}{'peak MB':>9}{'diff mean':>11}{'diff max':>10}")
+    with tempfile.TemporaryDirectory() as work:
+        for fmt in args.formats:
+            for size in args.sizes:
+                width, height = (int(x) for x in size.split("x"))
+                paths = [os.path.join(work, f"{fmt}-{size}-{seed}") for seed in range(args.images)]
+                for seed, path in enumerate(paths):
+                    with open(path, "wb") as f:
+                        f.write(render_image(seed, width, height, fmt))
+                results = {}
+                for mode, min_side in (("full", 0), ("reduced", args.min_side)):
+                    out = os.path.join(work, f"{fmt}-{size}-{mode}.json")
+                    command = [sys.executable, "-m", "benchmarks.bench_decode", "--worker",
+                               "--format", fmt, "--case-min-side", str(min_side),
+                               "--out", out, "--paths"] + paths
+                    env = dict(os.environ, PYTHONPATH=ROOT)
+                    if subprocess.run(command, env=env).returncode != 0:
+                        print(f"{fmt} {size} {mode} failed", file=sys.stderr)
+                        continue
+                    with open(out) as f:
+                        results[mode] = json.load(f)
+                    results[mode]["pixels"] = np.load(out + ".npy").astype("int16")
+                for mode, result in results.items():
+                    diff = np.abs(result["pixels"] - results["full"]["pixels"]) if "full" in results else None
+                    diffs = f"{diff.mean():>11.2f}{diff.max():>10d}" if diff is not None else f"{'-':>11}{'-':>10}"
+                    print(f"{fmt:<7}{size:>11}{result['bytes'] // 1024:>7}{mode:>9}{result['decoded']:>11}"
+                          f"{result['decode_ms']:>11.1f}{result['prep_ms']:>9.1f}{result['peak_mb']:>9.1f}{diffs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Duplicate report detection at ingest: accuracy, overhead, index savings.
+
+Images come from benchmarks.image_server, whose variants of a picture stand
+in for the ways a report gets repeated. Every mode runs in its own process
+and data directory.
+
+  * pairs:  for --pairs pictures, the fused embedding score and the image
+            hash distance between a report and each kind of repeat, and the
+            share app.ai.dedup would link:
+              retry        the same request again (same URL)
+              same bytes   the same file uploaded again (new URL)
+              resized      the photo at half size
+              recompressed the photo at JPEG quality 60
+              converted    the photo as WebP
+              reworded     the same photo, another description
+              other photo  a second photo of the scene (10% / 25% crop),
+                           which is not a duplicate
+              other item   a different picture, same description
+  * stream: --base-items random LOST/FOUND items reported within the window,
+            so the duplicate search runs over a realistic partition, then
+            --reports POST /report calls in-process, a --dup-rate share of
+            which repeat an earlier report (any repeat kind above but
+            "reworded"), and a --other-photo-rate share are second photos
+            of an earlier picture. Run with DEDUP off and on.
+
+Reported for the stream: items stored and indexed (the savings), repeats
+linked / missed, false links (a report linked to an item other than the
+one it repeats, or a second photo linked at all), copies of an item in its
+own top-5, the dedup stage time per report and /report latency.
+
+    python -m benchmarks.bench_dedup --base-items 50000 --reports 2000 --dup-rate 0.3
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 512
+CATEGORIES = ("wallet", "phone", "keys")
+LOCATION = "Library"
+REPEATS = {
+    "retry": "",
+    "same bytes": "&upload=2",
+    "resized": "&scale=0.5",
+    "recompressed": "&q=60",
+    "converted": ".webp",
+}
+
+
+def url(base, seed, variant="", crop=0.0):
+    """Image URL of seed's picture (cropped: a second photo); variant is a
+    query suffix or another extension"""
+    query = "?w=1024&h=768" + (f"&crop={crop}" if crop else "")
+    if variant.startswith("."):
+        return f"{base}/image/{seed}{variant}{query}"
+    return f"{base}/image/{seed}.jpg{query}{variant}"
+
+
+def description(seed):
+    return f"{random.Random(seed).choice(['black', 'brown', 'red', 'blue'])} {CATEGORIES[seed % 3]}"
+
+
+def setup(dedup):
+    """Configure and import the app against the current directory"""
+    sys.path.insert(0, ROOT)
+    import app.config
+    app.config.CLIP_BACKEND = "fake"
+    app.config.CLIP_LOAD_MODE = "lazy"
+    app.config.FAKE_ENCODER_BATCH_MS = 0
+    app.config.FAKE_ENCODER_ITEM_MS = 0
+    app.config.STANDING_MATCHES = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    app.config.DEDUP = dedup
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import main
+    return main
+
+
+def run_pairs(args):
+    """Worker: score and hash distance of each repeat kind"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_dedup_"))
+    setup(True)
+    from benchmarks.image_server import start_image_server
+    from app.ai.clip_model import encode_image_url, encode_text, image_hash
+    from app.ai.fusion import item_embedding, text_prompt
+    from app.ai.image_decode import hash_distance
+    from app.config import DEDUP_EMBEDDING_THRESHOLD, DEDUP_HASH_DISTANCE
+    _, base = start_image_server()
+
+    def report(image_url, text):
+        emb = item_embedding(encode_image_url(image_url), encode_text(text_prompt(text, LOCATION)), text)
+        return np.asarray(emb), image_hash(image_url)
+
+    kinds = dict(REPEATS, reworded="", **{"other photo 10%": "&crop=0.1", "other photo 25%": "&crop=0.25"})
+    results = {kind: {"scores": [], "distances": []} for kind in list(kinds) + ["other item"]}
+    for seed in range(args.pairs):
+        original, original_hash = report(url(base, seed), description(seed))
+        repeats = {kind: (url(base, seed, variant), description(seed)) for kind, variant in kinds.items()}
+        repeats["reworded"] = (url(base, seed, "&upload=3"), f"lost it near the {LOCATION} yesterday")
+        repeats["other item"] = (url(base, seed + args.pairs), description(seed))
+        for kind, (image_url, text) in repeats.items():
+            emb, hashed = report(image_url, text)
+            results[kind]["scores"].append(float(emb @ original))
+            results[kind]["distances"].append(hash_distance(hashed, original_hash))
+    for r in results.values():
+        scores, distances = np.array(r["scores"]), np.array(r["distances"])
+        r["linked"] = float(np.mean((scores >= DEDUP_EMBEDDING_THRESHOLD) & (distances <= DEDUP_HASH_DISTANCE)))
+    with open(args.out, "w") as f:
+        json.dump(results, f)
+
+
+def build_store(rng, count, chunk=5000):
+    """count random items of every category and type, created now"""
+    from app.ai import faiss_index
+    from app.db import fake_db
+
+    for start in range(0, count, chunk):
+        rows = range(start, min(start + chunk, count))
+        vectors = rng.standard_normal((len(rows), DIM)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        records = [{
+            "item_id": f"{('LOST', 'FOUND')[i % 2]}-{CATEGORIES[i % 3].upper()}-S{i:07d}",
+            "category": CATEGORIES[i % 3], "description": "item", "location": LOCATION,
+            "reportType": ("lost", "found")[i % 2], "embedding": vector,
+        } for i, vector in zip(rows, vectors)]
+        fake_db.insert_items(records)
+        faiss_index.add_vectors(vectors, [record["item_id"] for record in records])
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+
+
+def plan(args):
+    """The report stream: (picture, variant, kind, repeated picture or None).
+    A picture is (seed, crop): a second photo is a picture of its own,
+    which later reports can repeat."""
+    rng = random.Random(args.seed)
+    pictures, reports = [], []
+    for _ in range(args.reports):
+        roll = rng.random()
+        if pictures and roll < args.dup_rate:
+            kind = rng.choice(list(REPEATS))
+            picture = rng.choice(pictures)
+            reports.append((picture, REPEATS[kind], kind, picture))
+            continue
+        if pictures and roll < args.dup_rate + args.other_photo_rate:
+            seed, _ = rng.choice(pictures)
+            picture = (seed, rng.choice([0.1, 0.25]))
+            if picture not in pictures:
+                pictures.append(picture)
+                reports.append((picture, "", "other photo", None))
+                continue
+        picture = (1000 + len(pictures), 0.0)
+        pictures.append(picture)
+        reports.append((picture, "", "new", None))
+    return reports
+
+
+def run_stream(args):
+    """Worker: the report stream with DEDUP on or off"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_dedup_"))
+    main = setup(args.mode == "on")
+    from fastapi.testclient import TestClient
+    from benchmarks.image_server import start_image_server
+    from app import metrics
+    from app.ai import faiss_index
+    from app.db import fake_db
+    _, base = start_image_server()
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_store(np.random.default_rng(args.seed), args.base_items)
+    indexed_before = faiss_index.ntotal()
+
+    owner = {}  # picture -> item_id of its first report
+    picture_of = {}  # item_id of every stored report -> its picture
+    counts = dict.fromkeys(("repeats", "linked", "missed", "false links"), 0)
+    latencies = []
+    with TestClient(main.app) as client:
+        metrics.reset()
+        for i, (picture, variant, kind, repeated) in enumerate(plan(args)):
+            seed, crop = picture
+            report_type = ("lost", "found")[seed % 2]
+            start = time.perf_counter()
+            response = client.post("/report", data={
+                "image_url": url(base, seed, variant, crop), "description": description(seed),
+                "location": LOCATION, "category": CATEGORIES[seed % 3], "report_type": report_type,
+            }).json()
+            latencies.append(time.perf_counter() - start)
+            if "item_id" not in response:
+                sys.exit(f"report {i} failed: {response}")
+            if repeated is not None:
+                counts["repeats"] += 1
+                if response["duplicate"]:
+                    counts["linked" if response["item_id"] == owner[repeated] else "false links"] += 1
+                else:
+                    counts["missed"] += 1
+            elif response["duplicate"]:
+                counts["false links"] += 1
+            if repeated is None:
+                owner[picture] = response["item_id"]
+            if not response["duplicate"]:
+                picture_of[response["item_id"]] = picture
+        dedup = metrics.snapshot()["stages"].get("dedup", {})
+
+    # Copies of an item crowding its own top-5
+    copies = []
+    for picture, item_id in list(owner.items())[:200]:
+        hits = faiss_index.search_vectors(fake_db.get_item_embedding(item_id), 5,
+                                          report_type=("lost", "found")[picture[0] % 2])
+        copies.append(sum(picture_of.get(hit["item_id"]) == picture for hit in hits) - 1)
+
+    with open(args.out, "w") as f:
+        json.dump(dict(counts, reports=len(latencies),
+                       stored=len(picture_of),
+                       indexed=faiss_index.ntotal() - indexed_before,
+                       copies_in_top5=float(np.mean(copies)) if copies else 0.0,
+                       dedup_mean_ms=dedup.get("mean_ms", 0.0), dedup_p95_ms=dedup.get("p95_ms", 0.0),
+                       report_mean_ms=float(np.mean(latencies) * 1000),
+                       report_p95_ms=float(np.percentile(latencies, 95) * 1000)), f)
+
+
+def worker(args, extra):
+    out = os.path.join(tempfile.gettempdir(), f"bench_dedup_{os.getpid()}_{'_'.join(extra)}.json")
+    command = [sys.executable, "-m", "benchmarks.bench_dedup", "--out", out] + extra + sys.argv[1:]
+    if subprocess.run(command, stdout=subprocess.DEVNULL, env=dict(os.environ, PYTHONPATH=ROOT)).returncode != 0:
+        sys.exit(f"{' '.join(extra)} failed")
+    with open(out) as f:
+        result = json.load(f)
+    os.unlink(out)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=100, help="pictures in the pairs part")
+    parser.add_argument("--base-items", type=int, default=50000, help="items already in the window")
+    parser.add_argument("--reports", type=int, default=2000)
+    parser.add_argument("--dup-rate", type=float, default=0.3, help="share of reports repeating one")
+    parser.add_argument("--other-photo-rate", type=float, default=0.1, help="share of second photos")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pairs-only", action="store_true")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--pairs-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.pairs_worker:
+        return run_pairs(args)
+    if args.mode:
+        return run_stream(args)
+
+    from app.config import DEDUP_EMBEDDING_THRESHOLD, DEDUP_HASH_DISTANCE
+    pairs = worker(args, ["--pairs-worker"])
+    print(f"{args.pairs} pictures; linked: score >= {DEDUP_EMBEDDING_THRESHOLD} "
+          f"and hash distance <= {DEDUP_HASH_DISTANCE}")
+    print(f"{'repeat kind':<18}{'score p5':>9}{'median':>8}{'dist median':>12}{'p95':>5}{'max':>5}{'linked':>8}")
+    for kind, r in pairs.items():
+        scores, distances = np.array(r["scores"]), np.array(r["distances"])
+        print(f"{kind:<18}{np.percentile(scores, 5):>9.3f}{np.median(scores):>8.3f}"
+              f"{np.median(distances):>12.0f}{np.percentile(distances, 95):>5.0f}{distances.max():>5}"
+              f"{r['linked']:>8.0%}")
+    if args.pairs_only:
+        return
+
+    print(f"\n{args.reports} reports ({args.dup_rate:.0%} repeats, {args.other_photo_rate:.0%} second photos) "
+          f"over {args.base_items} items in the window")
+    print(f"{'dedup':<6}{'stored':>8}{'indexed':>9}{'linked':>8}{'missed':>8}{'false':>7}"
+          f"{'copies/top5':>12}{'dedup ms':>10}{'p95':>7}{'report ms':>11}{'p95':>7}")
+    results = {}
+    for mode in ("off", "on"):
+        r = results[mode] = worker(args, ["--mode", mode])
+        print(f"{mode:<6}{r['stored']:>8}{r['indexed']:>9}{r['linked']:>8}{r['missed']:>8}{r['false links']:>7}"
+              f"{r['copies_in_top5']:>12.2f}{r['dedup_mean_ms']:>10.2f}{r['dedup_p95_ms']:>7.2f}"
+              f"{r['report_mean_ms']:>11.2f}{r['report_p95_ms']:>7.2f}")
+    saved = 1 - results["on"]["indexed"] / results["off"]["indexed"]
+    print(f"index growth from the reports: {results['off']['indexed']} -> {results['on']['indexed']} "
+          f"vectors ({saved:.0%} smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Recall and latency of partitioned search vs overfetch-and-filter.
+
+Builds a synthetic index dominated by LOST items and runs "lost" queries
+that should return FOUND matches. Compares:
+
+  * filter:      one flat index, search top_k * overfetch, then drop
+                 non-FOUND results (what find_matches used to do)
+  * partitioned: app.ai.faiss_index.search_vectors with report_type="found"
+
+Recall is measured against the exact top_k over FOUND items.
+
+    python -m benchmarks.bench_filtered_search --items 50000 --found-fraction 0.1
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+DIM = 512
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def recall(results, truth):
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / max(1, sum(len(t) for t in truth))
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--found-fraction", type=float, default=0.1)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = normalized(rng.standard_normal((args.items, DIM)))
+    is_found = rng.random(args.items) < args.found_fraction
+    item_ids = [
+        f"{'FOUND' if found else 'LOST'}-GENERAL-{i:07d}"
+        for i, found in enumerate(is_found)
+    ]
+    found_rows = np.flatnonzero(is_found)
+
+    # Queries sit near a random FOUND item, like a lost report of a found object
+    anchors = rng.choice(found_rows, args.queries)
+    queries = normalized(vectors[anchors] + 0.8 * rng.standard_normal((args.queries, DIM)))
+
+    found_scores = queries @ vectors[found_rows].T
+    truth = [
+        [item_ids[found_rows[j]] for j in np.argsort(-row)[:args.top_k]]
+        for row in found_scores
+    ]
+
+    # Run the index module against a scratch data directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_filtered_"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app.config
+    app.config.WAL_FSYNC = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.ai import faiss_index
+        for vector, item_id in zip(vectors, item_ids):
+            faiss_index.add_vector(vector, item_id)
+
+    flat = faiss.IndexFlatIP(DIM)
+    flat.add(vectors)
+
+    print(f"{args.items} items, {len(found_rows)} FOUND, {args.queries} queries, top_k={args.top_k}")
+    print(f"{'strategy':<22}{'recall@k':>10}{'avg hits':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+    for factor in args.overfetch:
+        results, latencies = [], []
+        for q in queries:
+            start = time.perf_counter()
+            _, indices = flat.search(q.reshape(1, DIM), args.top_k * factor)
+            kept = [item_ids[i] for i in indices[0] if i >= 0 and is_found[i]][:args.top_k]
+            latencies.append(time.perf_counter() - start)
+            results.append(kept)
+        print(f"{f'filter x{factor}':<22}{recall(results, truth):>10.3f}"
+              f"{np.mean([len(r) for r in results]):>10.2f}"
+              f"{percentile_ms(latencies, 50):>10.3f}{percentile_ms(latencies, 95):>10.3f}")
+
+    results, latencies = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for q in queries:
+            start = time.perf_counter()
+            hits = faiss_index.search_vectors(q, args.top_k, report_type="found")
+            latencies.append(time.perf_counter() - start)
+            results.append([hit["item_id"] for hit in hits])
+    print(f"{'partitioned':<22}{recall(results, truth):>10.3f}"
+          f"{np.mean([len(r) for r in results]):>10.2f}"
+          f"{percentile_ms(latencies, 50):>10.3f}{percentile_ms(latencies, 95):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Latency of many single /find-similar queries vs one batched request.
+
+Builds a store of --items FOUND items (--factory index once it holds
+ANN_MIN_VECTORS of them) and, for each --batch-sizes n, matches n "lost"
+query embeddings near stored items:
+
+  * single:  n POST /find-similar requests of one embedding each
+  * batch:   one POST /find-similar with all n embeddings
+  * matcher: find_matches per query vs one find_matches_batch call, i.e.
+             the same without HTTP and JSON
+
+Requests go through the FastAPI app in-process (no network), so the
+single column is a lower bound of what N round trips cost. Reported: ms
+per request set and per query, and the speedup of batching.
+
+    python -m benchmarks.bench_find_similar --items 100000 --batch-sizes 1 16 64 256
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIM = 512
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def build_store(vectors, chunk=5000):
+    from app.ai import faiss_index
+    from app.db import fake_db
+
+    for start in range(0, len(vectors), chunk):
+        rows = range(start, min(start + chunk, len(vectors)))
+        ids = [f"FOUND-WALLET-S{i:07d}" for i in rows]
+        fake_db.insert_items([{
+            "item_id": item_id, "itemType": "wallet", "category": "wallet",
+            "description": "black wallet", "location": "Library", "reportType": "found",
+            "embedding": vectors[i],
+        } for i, item_id in zip(rows, ids)])
+        faiss_index.add_vectors(vectors[rows.start:rows.stop], ids)
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+
+
+def best_of(repeats, run):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--factory", default=None, help="ANN_INDEX_FACTORY (default: config)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = normalized(rng.standard_normal((args.items, DIM)))
+    anchors = rng.choice(args.items, max(args.batch_sizes))
+    queries = normalized(vectors[anchors] + rng.standard_normal((len(anchors), DIM)) / np.sqrt(DIM))
+
+    # Run the app against a scratch data directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_find_similar_"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app.config
+    app.config.CLIP_BACKEND = "fake"
+    app.config.CLIP_LOAD_MODE = "lazy"
+    app.config.STANDING_MATCHES = False
+    app.config.WAL_FSYNC = False
+    app.config.DB_FSYNC = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    if args.factory:
+        app.config.ANN_INDEX_FACTORY = args.factory
+    with contextlib.redirect_stdout(io.StringIO()):
+        from fastapi.testclient import TestClient
+        from app.ai.matcher import find_matches, find_matches_batch
+        from app.main import app as api
+        build_store(vectors)
+        client = TestClient(api)
+
+    def post(body):
+        response = client.post("/find-similar", json=body)
+        response.raise_for_status()
+        return response.json()
+
+    # Every query finds its anchor
+    found = post({"embeddings": queries[:8].tolist(), "top_k": args.top_k, "report_type": "lost"})
+    assert all(result["matches"] for result in found["results"])
+
+    print(f"{args.items} FOUND items, top_k={args.top_k}, best of {args.repeats}")
+    print(f"{'n':>5}{'single ms':>12}{'batch ms':>11}{'speedup':>9}{'ms/query':>10}"
+          f"{'matcher 1x ms':>15}{'matcher batch ms':>18}{'speedup':>9}")
+    for n in args.batch_sizes:
+        rows = queries[:n]
+        bodies = [{"embedding": row.tolist(), "top_k": args.top_k, "report_type": "lost"} for row in rows]
+        batch_body = {"embeddings": rows.tolist(), "top_k": args.top_k, "report_type": "lost"}
+        single = best_of(args.repeats, lambda: [post(body) for body in bodies])
+        batch = best_of(args.repeats, lambda: post(batch_body))
+        loop = best_of(args.repeats, lambda: [find_matches(row, args.top_k, report_type="lost") for row in rows])
+        batched = best_of(args.repeats, lambda: find_matches_batch(rows, args.top_k, report_type="lost"))
+        print(f"{n:>5}{single * 1000:>12.1f}{batch * 1000:>11.1f}{single / batch:>9.1f}"
+              f"{batch * 1000 / n:>10.3f}{loop * 1000:>15.1f}{batched * 1000:>18.1f}{loop / batched:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Throughput and uniqueness of item ID allocation.
+
+Compares the former generator (4 random base-36 characters, no collision
+check) with app.utils.id_generator (per-prefix sequence reserved in blocks
+from a shared file, scrambled into the same format, checked against the
+item store), on a scratch store holding --existing items of the prefix:
+
+  * random:    ids/s of the random draw and how many of --ids were
+               duplicates
+  * allocator: ids/s from one thread, from --threads threads, and from
+               --processes processes at once; every ID is collected and
+               checked for duplicates across all of them
+
+    python -m benchmarks.bench_id_alloc --ids 200000 --threads 8 --processes 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_TYPE, CATEGORY = "lost", "wallet"
+
+
+def random_id(report_type, category):
+    code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+    return f"{report_type.upper()}-{category.upper()}-{code}"
+
+
+def setup(data_dir, existing=0, read_only=False):
+    """Import the allocator against data_dir, seeding the store with
+    existing random IDs (as issued before the allocator)"""
+    os.chdir(data_dir)
+    sys.path.insert(0, ROOT)
+    import app.config
+    app.config.WRITE_BEHIND = False
+    app.config.DB_FSYNC = False
+    if read_only:
+        # Worker processes only look IDs up; the parent owns the store
+        app.config.SERVE_ROLE = "reader"
+    from app.db import fake_db
+    if existing:
+        ids = {random_id(REPORT_TYPE, CATEGORY) for _ in range(existing)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            fake_db.insert_items([{"item_id": item_id, "description": ""} for item_id in ids])
+    from app.utils import id_generator
+    return id_generator
+
+
+def allocate(id_generator, n, threads):
+    """Allocate n IDs from threads threads; returns (ids, seconds)"""
+    per_thread = [[] for _ in range(threads)]
+
+    def work(out, count):
+        for _ in range(count):
+            out.append(id_generator.generate_item_id(REPORT_TYPE, CATEGORY))
+
+    workers = [threading.Thread(target=work, args=(out, n // threads + (i < n % threads)))
+               for i, out in enumerate(per_thread)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [item_id for out in per_thread for item_id in out], time.perf_counter() - start
+
+
+def run_process(args):
+    """Worker process: allocate --ids IDs and write them to --out"""
+    id_generator = setup(args.data, read_only=True)
+    ids, seconds = allocate(id_generator, args.ids, 1)
+    with open(args.out, "w") as f:
+        json.dump({"ids": ids, "seconds": seconds}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=200000, help="IDs per run (per process with --processes)")
+    parser.add_argument("--existing", type=int, default=100000, help="random IDs already in the store")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_process(args)
+        return
+
+    data = tempfile.mkdtemp(prefix="bench_id_alloc_")
+    start = time.perf_counter()
+    drawn = [random_id(REPORT_TYPE, CATEGORY) for _ in range(args.ids)]
+    seconds = time.perf_counter() - start
+    print(f"{args.ids} IDs per run, {args.existing} random IDs already stored")
+    print(f"{'generator':<28}{'ids/s':>12}{'duplicates':>12}")
+    print(f"{'random (former)':<28}{args.ids / seconds:>12.0f}{args.ids - len(set(drawn)):>12}")
+
+    id_generator = setup(data, args.existing)
+    from app.db import fake_db
+    issued = []
+    for threads in (1, args.threads):
+        ids, seconds = allocate(id_generator, args.ids, threads)
+        issued += ids
+        clashes = sum(fake_db.has_item(item_id) for item_id in ids)
+        print(f"{f'allocator, {threads} thread(s)':<28}{len(ids) / seconds:>12.0f}"
+              f"{len(ids) - len(set(ids)) + clashes:>12}")
+
+    outs = [os.path.join(data, f"ids.{i}.json") for i in range(args.processes)]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    workers = [subprocess.Popen([sys.executable, "-m", "benchmarks.bench_id_alloc", "--worker",
+                                 "--data", data, "--out", out, "--ids", str(args.ids)], env=env)
+               for out in outs]
+    if any(worker.wait() != 0 for worker in workers):
+        sys.exit("an allocating process failed")
+    seconds = time.perf_counter() - start
+    for out in outs:
+        with open(out) as f:
+            issued += json.load(f)["ids"]
+    total = args.ids * args.processes
+    print(f"{f'allocator, {args.processes} processes':<28}{total / seconds:>12.0f}{'':>12}")
+    print(f"all {len(issued)} allocated IDs unique: {len(set(issued)) == len(issued)}, "
+          f"none taken by stored IDs: {not any(fake_db.has_item(item_id) for item_id in issued)}, "
+          f"code lengths: {sorted({len(item_id.rsplit('-', 1)[1]) for item_id in issued})}")
+
+
+if __name__ == "__main__":
+    main()
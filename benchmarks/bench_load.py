@@ -0,0 +1,423 @@
+"""Load and latency benchmark of the /report pipeline and of search.
+
+Runs the real FastAPI app in-process (httpx ASGI transport) with the
+deterministic fake encoder (CLIP_BACKEND="fake") against images served by
+benchmarks.image_server, on a synthetic store of each --sizes. Every size
+runs in its own process and data directory. For each --concurrency level:
+
+  * report: POST /report, alternating lost/found, one unseen image each.
+            Every lost report has planted near-duplicate FOUND items in
+            the store, so matching and hydration do real work.
+  * search: find_matches for perturbed copies of stored embeddings
+            (fused, image and text), i.e. ANN candidates plus re-rank.
+
+Reported per scenario: throughput, p50/p95/p99 end-to-end latency and the
+same percentiles per stage (fetch, decode, image_encode, text_encode,
+fusion, search, hydration, rerank, persist_db, persist_index). Encode
+stages include the time spent waiting for a micro-batch. --no-rerank
+ranks by the fused vector alone, for comparison.
+
+    python -m benchmarks.bench_load --sizes 10000 100000 1000000 --concurrency 1 8 32 --out load.json
+    python -m benchmarks.bench_load --sizes 10000 --encoder-item-ms 5 --out after.json
+    python -m benchmarks.bench_load --compare before.json after.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIM = 512
+PERCENTILES = (50, 95, 99)
+# Seeds of report images start here so they never collide with store items
+REPORT_SEED = 10_000_000
+
+
+def summarize(samples):
+    """count, mean and percentiles in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    summary = {"count": len(samples), "mean": round(float(ms.mean()), 3)}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = round(float(np.percentile(ms, q)), 3)
+    return summary
+
+
+class StageTimer:
+    """Per-stage latency samples, collected by wrapping the app's functions"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def summary(self):
+        with self._lock:
+            return {stage: summarize(samples) for stage, samples in sorted(self.samples.items())}
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage, fn):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_batcher(self, stage, batcher):
+        """Proxy whose submit() times each item from enqueue to result"""
+        timer = self
+
+        class TimedBatcher:
+            def submit(self, item):
+                start = time.perf_counter()
+                future = batcher.submit(item)
+                future.add_done_callback(lambda _: timer.record(stage, time.perf_counter() - start))
+                return future
+
+            def __call__(self, item):
+                return self.submit(item).result()
+
+            def __getattr__(self, name):
+                return getattr(batcher, name)
+
+        return TimedBatcher()
+
+
+def instrument(timer):
+    """Patch the stage boundaries of the pipeline with timing wrappers"""
+    import app.main as main
+    import app.ai.clip_model as clip_model
+    import app.ai.matcher as matcher
+
+    clip_model.fetch_image_bytes_async = timer.wrap_async("fetch", clip_model.fetch_image_bytes_async)
+    clip_model.decode_image = timer.wrap("decode", clip_model.decode_image)
+    clip_model.image_batcher = timer.wrap_batcher("image_encode", clip_model.image_batcher)
+    clip_model.text_batcher = timer.wrap_batcher("text_encode", clip_model.text_batcher)
+    main.item_embedding = timer.wrap("fusion", main.item_embedding)
+    matcher.search_vectors_batch = timer.wrap("search", matcher.search_vectors_batch)
+    matcher.get_items_by_ids = timer.wrap("hydration", matcher.get_items_by_ids)
+    matcher.rerank = timer.wrap("rerank", matcher.rerank)
+    main.insert_item = timer.wrap("persist_db", main.insert_item)
+    main.add_vector = timer.wrap("persist_index", main.add_vector)
+
+
+def report_form(i, base_url, image_size):
+    """Deterministic /report form fields for request i"""
+    return {
+        "image_url": f"{base_url}/image/{REPORT_SEED + i}.jpg?w={image_size}&h={image_size}",
+        "description": f"black leather wallet {i} with a student id card",
+        "location": f"library floor {i % 5}",
+        "category": "wallet",
+        "report_type": "lost" if i % 2 == 0 else "found",
+    }
+
+
+def planted_embeddings(forms):
+    """Fused, image and text embeddings the pipeline will compute for the
+    lost reports, encoded directly so the embedding cache stays cold"""
+    from app.ai.clip_model import decode_image, encode_image_batch, encode_text_batch
+    from app.ai.fusion import item_embedding, text_prompt
+    from benchmarks.image_server import render_image
+
+    embeddings, images, texts = [], [], []
+    for form in forms:
+        seed = int(form["image_url"].rsplit("/", 1)[1].split(".")[0])
+        size = int(form["image_url"].rsplit("w=", 1)[1].split("&")[0])
+        image = decode_image(render_image(seed, size, size, "jpg"))
+        img_emb = encode_image_batch([image])[0]
+        txt_emb = encode_text_batch([text_prompt(form["description"], form["location"])])[0]
+        embeddings.append(item_embedding(img_emb, txt_emb, form["description"]))
+        images.append(img_emb)
+        texts.append(txt_emb)
+    return tuple(np.asarray(vectors, dtype="float32") for vectors in (embeddings, images, texts))
+
+
+def near(rng, vectors, noise):
+    x = vectors + noise * rng.standard_normal(vectors.shape).astype("float32") / np.sqrt(DIM)
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def build_store(size, planted, rng, chunk=10000):
+    """Fill the store with size synthetic items, planted FOUND matches first.
+
+    Planted items carry image and text embeddings for the re-rank; the
+    filler only has a fused one, like items stored before modalities were kept.
+    """
+    from app.db import fake_db
+
+    def record(item_id, report_type, vector, i, **modalities):
+        return {
+            "item_id": item_id, "itemType": "wallet", "category": "wallet",
+            "description": f"synthetic item {i}", "location": "campus",
+            "reportType": report_type, "imageUrl": f"https://example.com/{i}.jpg",
+            "embedding": vector, **modalities,
+        }
+
+    matches, images, texts = (near(rng, np.repeat(vectors, 2, axis=0), 0.5) for vectors in planted)
+    fake_db.insert_items([
+        record(f"FOUND-WALLET-P{i:07d}", "found", vector, i,
+               image_embedding=images[i], text_embedding=texts[i])
+        for i, vector in enumerate(matches)
+    ])
+    for start in range(len(matches), size, chunk):
+        n = min(chunk, size - start)
+        vectors = near(rng, rng.standard_normal((n, DIM)).astype("float32"), 0.0)
+        fake_db.insert_items([
+            record(f"{'LOST' if i % 2 else 'FOUND'}-WALLET-S{i:07d}", "lost" if i % 2 else "found",
+                   vectors[i - start], i)
+            for i in range(start, start + n)
+        ])
+
+
+async def drive(concurrency, total, call):
+    """Run call(i) for i in range(total) with concurrency workers; returns
+    (latencies, errors, elapsed seconds)"""
+    latencies, errors = [], []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors.append(repr(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_size(args):
+    """Build one store in a fresh data directory and run every scenario"""
+    import app.config as config
+    config.CLIP_BACKEND = "fake"
+    config.CLIP_LOAD_MODE = "eager"
+    config.FAKE_ENCODER_BATCH_MS = args.encoder_batch_ms
+    config.FAKE_ENCODER_ITEM_MS = args.encoder_item_ms
+    config.RERANK = not args.no_rerank
+    if args.no_fsync:
+        config.DB_FSYNC = False
+        config.WAL_FSYNC = False
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    total = args.warmup + args.requests
+    report_rounds = len(args.concurrency)
+
+    from benchmarks.image_server import start_image_server
+    server, base_url = start_image_server()
+    forms = [report_form(i, base_url, args.image_size) for i in range(total * report_rounds)]
+
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    started = time.perf_counter()
+    with quiet:
+        lost_forms = [form for form in forms if form["report_type"] == "lost"]
+        planted = planted_embeddings(lost_forms)
+        build_store(args.size, planted, rng)
+        import app.ai.faiss_index as faiss_index
+        # Approximate indexes are built in the background; wait for them
+        while faiss_index._rebuilding:
+            time.sleep(0.5)
+        import app.main as main
+        from app.ai.matcher import find_matches
+        from app.config import TOP_K
+    build_s = time.perf_counter() - started
+    print(f"[{args.size}] store ready in {build_s:.1f}s "
+          f"({faiss_index.ntotal()} vectors)", file=sys.stderr, flush=True)
+
+    timer = StageTimer()
+    instrument(timer)
+    import httpx
+
+    queries = [near(rng, vectors, 0.3) for vectors in planted]
+    results = []
+
+    async def scenarios():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for round_no, concurrency in enumerate(args.concurrency):
+                offset = round_no * total
+
+                async def report(i):
+                    response = await client.post("/report", data=forms[offset + i])
+                    body = response.json()
+                    if response.status_code != 200 or "error" in body:
+                        raise RuntimeError(body.get("error", response.status_code))
+
+                await drive(concurrency, args.warmup, report)
+                timer.reset()
+                latencies, errors, elapsed = await drive(
+                    concurrency, args.requests, lambda i: report(args.warmup + i))
+                results.append(scenario_result("report", concurrency, latencies, errors, elapsed, timer))
+
+            for concurrency in args.concurrency:
+                pool = ThreadPoolExecutor(max_workers=concurrency)
+                loop = asyncio.get_running_loop()
+
+                async def search(i):
+                    fused, image, text = (vectors[i % len(vectors)] for vectors in queries)
+                    await loop.run_in_executor(pool, lambda: find_matches(
+                        fused, TOP_K, report_type="lost", image_embedding=image, text_embedding=text))
+
+                await drive(concurrency, args.warmup, search)
+                timer.reset()
+                latencies, errors, elapsed = await drive(concurrency, args.requests, search)
+                pool.shutdown()
+                results.append(scenario_result("search", concurrency, latencies, errors, elapsed, timer))
+
+    with quiet:
+        asyncio.run(scenarios())
+    server.shutdown()
+    return {"size": args.size, "build_s": round(build_s, 2), "results": results}
+
+
+def scenario_result(scenario, concurrency, latencies, errors, elapsed, timer):
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "stages_ms": timer.summary(),
+    }
+    if errors:
+        result["first_error"] = errors[0]
+    line = result["latency_ms"]
+    print(f"  {scenario:<7} c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+          f"p50 {line.get('p50', 0):>8.2f}  p95 {line.get('p95', 0):>8.2f}  p99 {line.get('p99', 0):>8.2f} ms"
+          f"  errors {len(errors)}", file=sys.stderr, flush=True)
+    return result
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    import faiss
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "args": {key: value for key, value in vars(args).items() if key not in ("compare", "worker", "out", "size")},
+    }
+
+
+def compare(before_path, after_path):
+    """Print throughput and latency changes between two result files"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta']['commit'] or before_path} -> {after['meta']['commit'] or after_path}")
+    print(f"{'size':>9} {'scenario':<8}{'c':>4}{'rps':>18}{'p50 ms':>20}{'p95 ms':>20}{'p99 ms':>20}")
+
+    def key(size, result):
+        return size["size"], result["scenario"], result["concurrency"]
+
+    old = {key(size, r): r for size in before["sizes"] for r in size["results"]}
+    for size in after["sizes"]:
+        for new in size["results"]:
+            prev = old.get(key(size, new))
+            if prev is None:
+                continue
+            cells = [(prev["throughput_rps"], new["throughput_rps"])]
+            cells += [(prev["latency_ms"].get(p, 0), new["latency_ms"].get(p, 0)) for p in ("p50", "p95", "p99")]
+            text = "".join(
+                f"{b:>8.1f}->{a:<7.1f}{(a - b) / b * 100 if b else 0:+.0f}%".rjust(20) for b, a in cells
+            )
+            print(f"{size['size']:>9} {new['scenario']:<8}{new['concurrency']:>4}{text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--encoder-batch-ms", type=float, default=0.0,
+                        help="simulated model cost per batch for the fake encoder")
+    parser.add_argument("--encoder-item-ms", type=float, default=0.0,
+                        help="simulated model cost per item for the fake encoder")
+    parser.add_argument("--no-fsync", action="store_true", help="turn off DB and WAL fsync")
+    parser.add_argument("--no-rerank", action="store_true", help="rank by the fused vector only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep the service's own output")
+    parser.add_argument("--out", default="bench_load.json", help="results file (JSON)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two results files")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.worker:
+        # One size, in the data directory the parent created for it
+        result = run_size(args)
+        with open(args.out, "w") as f:
+            json.dump(result, f)
+        return
+
+    sizes = []
+    for size in args.sizes:
+        print(f"Running size {size}", file=sys.stderr, flush=True)
+        with tempfile.TemporaryDirectory() as work:
+            command = [sys.executable, "-m", "benchmarks.bench_load", "--worker", "--size", str(size)]
+            result_path = os.path.join(work, "result.json")
+            command += sys.argv[1:] + ["--out", result_path]
+            env = dict(os.environ, PYTHONPATH=ROOT)
+            if subprocess.run(command, cwd=work, env=env).returncode != 0:
+                sys.exit(f"size {size} failed")
+            with open(result_path) as f:
+                sizes.append(json.load(f))
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": metadata(args), "sizes": sizes}, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
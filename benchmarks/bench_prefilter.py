@@ -0,0 +1,169 @@
+"""Recall and latency of location/time prefilters vs search-then-filter.
+
+Builds a store of --items FOUND items spread over --places locations and
+--days days of created_at, then runs "lost" queries that sit near an item
+at the query's location found after the query's loss date. For filters on
+location, on the time window (found since the loss date) and on both it
+compares:
+
+  * post xN:   app.ai.faiss_index.search_vectors for top_k * N without
+               filters, then drop the items the filter rejects
+  * prefilter: search_vectors with location/since, pushed into the index
+               (exact scoring below PREFILTER_EXACT_MAX candidates)
+
+Recall is measured against the exact top_k among the items passing the
+filter; "sel" is the fraction of items that pass it.
+
+    python -m benchmarks.bench_prefilter --items 100000 --places 40 --days 180
+    python -m benchmarks.bench_prefilter --items 50000 --factory "IVF{nlist},Flat"
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DIM = 512
+EPOCH = datetime(2024, 1, 1)
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def recall(results, truth):
+    hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+    return hits / max(1, sum(len(t) for t in truth))
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def build_store(vectors, places, days, chunk=5000):
+    """Insert FOUND items day by day (created_at = that day) and index them"""
+    from app.ai import faiss_index
+    from app.db import fake_db
+
+    class Clock(datetime):
+        now = EPOCH
+
+        @classmethod
+        def utcnow(cls):
+            return cls.now
+
+    real_datetime, fake_db.datetime = fake_db.datetime, Clock
+    try:
+        for day in np.unique(days):
+            Clock.now = EPOCH + timedelta(days=int(day))
+            rows = np.flatnonzero(days == day)
+            for start in range(0, len(rows), chunk):
+                part = rows[start:start + chunk]
+                ids = [f"FOUND-WALLET-P{i:07d}" for i in part]
+                fake_db.insert_items([{
+                    "item_id": item_id, "itemType": "wallet", "category": "wallet",
+                    "description": "black wallet", "location": f"Building {places[i]}, 2nd floor",
+                    "reportType": "found", "embedding": vectors[i],
+                } for i, item_id in zip(part, ids)])
+                faiss_index.add_vectors(vectors[part], ids)
+    finally:
+        fake_db.datetime = real_datetime
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--places", type=int, default=40)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--factory", help="ANN index of the FOUND partition, e.g. HNSW32,Flat (default: config)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = normalized(rng.standard_normal((args.items, DIM)))
+    places = rng.integers(args.places, size=args.items)
+    days = rng.integers(args.days, size=args.items)
+    item_ids = np.array([f"FOUND-WALLET-P{i:07d}" for i in range(args.items)])
+
+    # A lost report near an item found at its location after the loss date
+    anchors = rng.choice(args.items, args.queries)
+    queries = normalized(vectors[anchors] + 0.8 * rng.standard_normal((args.queries, DIM)) / np.sqrt(DIM))
+    lost_days = np.array([rng.integers(0, days[a] + 1) for a in anchors])
+
+    # Run the app modules against a scratch data directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_prefilter_"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app.config
+    app.config.DB_FSYNC = False
+    app.config.WAL_FSYNC = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    # One FOUND partition for the filters to work in, dated in the past
+    app.config.INDEX_SHARD_DAYS = 0
+    app.config.INDEX_RETENTION_DAYS = 0
+    if args.factory:
+        app.config.ANN_INDEX_FACTORY = args.factory
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.ai import faiss_index
+        build_store(vectors, places, days)
+    index_type = type(faiss_index.base_index(faiss_index.partitions["FOUND"].index)).__name__
+    print(f"{args.items} FOUND items ({index_type}) at {args.places} places over {args.days} days, "
+          f"built in {time.perf_counter() - started:.1f}s; {args.queries} queries, top_k={args.top_k}")
+    print(f"{'filter':<12}{'strategy':<12}{'sel':>8}{'recall@k':>10}{'avg hits':>10}{'p50 ms':>10}{'p95 ms':>10}")
+
+    scenarios = {
+        "location": lambda q: places == places[anchors[q]],
+        "since": lambda q: days >= lost_days[q],
+        "both": lambda q: (places == places[anchors[q]]) & (days >= lost_days[q]),
+    }
+    for name, passing in scenarios.items():
+        masks = [passing(q) for q in range(args.queries)]
+        truth = []
+        for q, mask in zip(queries, masks):
+            rows = np.flatnonzero(mask)
+            truth.append(list(item_ids[rows[np.argsort(-(vectors[rows] @ q))[:args.top_k]]]))
+        selectivity = np.mean([mask.mean() for mask in masks])
+        location = name in ("location", "both")
+        since = name in ("since", "both")
+
+        def row(strategy, results, latencies):
+            print(f"{name:<12}{strategy:<12}{selectivity:>8.3f}{recall(results, truth):>10.3f}"
+                  f"{np.mean([len(r) for r in results]):>10.2f}"
+                  f"{percentile_ms(latencies, 50):>10.3f}{percentile_ms(latencies, 95):>10.3f}", flush=True)
+
+        for factor in args.overfetch:
+            results, latencies = [], []
+            for q, mask in zip(queries, masks):
+                start = time.perf_counter()
+                hits = faiss_index.search_vectors(q, args.top_k * factor, report_type="found")
+                kept = [h["item_id"] for h in hits if mask[int(h["item_id"][-7:])]][:args.top_k]
+                latencies.append(time.perf_counter() - start)
+                results.append(kept)
+            row(f"post x{factor}", results, latencies)
+
+        results, latencies = [], []
+        for i, q in enumerate(queries):
+            filters = {}
+            if location:
+                filters["location"] = f"building {places[anchors[i]]}"
+            if since:
+                filters["since"] = (EPOCH + timedelta(days=int(lost_days[i]))).isoformat()
+            start = time.perf_counter()
+            hits = faiss_index.search_vectors(q, args.top_k, report_type="found", **filters)
+            latencies.append(time.perf_counter() - start)
+            results.append([h["item_id"] for h in hits])
+        row("prefilter", results, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Concurrent searches against ingest, deletes and compaction.
+
+Builds an index of --items FOUND items, then for each --threads level runs
+that many threads calling app.ai.faiss_index.search_vectors for --seconds
+while one more thread keeps adding items (add_vectors) and another
+deletes items and forces compactions. Two modes:
+
+  * serialized: every search holds the index-wide lock, as before
+                partitions had locks of their own
+  * concurrent: the current code (searches share a partition, changes
+                wait only for the searches on the partition they change)
+
+Reported: searches/s over all threads, search p50/p95, add p50/p99 and
+the number of errors and inconsistent results (a hit for an item that was
+deleted before the search started, or duplicate hits). With --ann-min the
+partition is migrated to an approximate index during the first level.
+
+    python -m benchmarks.bench_search_concurrency --items 50000 --threads 1 4 8
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 512
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def run_level(faiss_index, search, threads, seconds, rng_seed, deleted):
+    """One level: returns (searches, search latencies, add latencies, problems)"""
+    stop = threading.Event()
+    latencies = [[] for _ in range(threads)]
+    add_latencies = []
+    problems = []
+    counter = itertools.count()
+
+    def searcher(out, seed):
+        rng = np.random.default_rng(seed)
+        while not stop.is_set():
+            query = normalized(rng.standard_normal((1, DIM)))[0]
+            gone = set(deleted)
+            start = time.perf_counter()
+            try:
+                hits = search(query, 10, report_type="found")
+            except Exception as e:
+                problems.append(f"search failed: {e!r}")
+                continue
+            out.append(time.perf_counter() - start)
+            ids = [hit["item_id"] for hit in hits]
+            if len(set(ids)) != len(ids) or gone & set(ids):
+                problems.append(f"inconsistent hits: {ids}")
+
+    def adder():
+        rng = np.random.default_rng(rng_seed)
+        while not stop.is_set():
+            vectors = normalized(rng.standard_normal((8, DIM)))
+            ids = [f"FOUND-WALLET-N{next(counter):07d}X{rng_seed}" for _ in range(8)]
+            start = time.perf_counter()
+            faiss_index.add_vectors(vectors, ids)
+            add_latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    def churner():
+        rng = np.random.default_rng(rng_seed + 1)
+        while not stop.is_set():
+            victims = [item_id for item_id in rng.choice(list(faiss_index.indexed_ids), 50)]
+            faiss_index.remove_vectors(victims)
+            # Only once removed: a search started before that may still see them
+            deleted.update(victims)
+            faiss_index.compact_index(force=True)
+            time.sleep(0.05)
+
+    workers = [threading.Thread(target=searcher, args=(out, rng_seed * 100 + i)) for i, out in enumerate(latencies)]
+    workers += [threading.Thread(target=adder), threading.Thread(target=churner)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    flat = [x for out in latencies for x in out]
+    return len(flat), flat, add_latencies, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--ann-min", type=int, default=0, help="ANN_MIN_VECTORS (default: config)")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_search_concurrency_"))
+    sys.path.insert(0, ROOT)
+    import app.config
+    app.config.DB_FSYNC = False
+    app.config.WAL_FSYNC = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    if args.ann_min:
+        app.config.ANN_MIN_VECTORS = args.ann_min
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.ai import faiss_index
+        rng = np.random.default_rng(0)
+        for start in range(0, args.items, 10000):
+            n = min(10000, args.items - start)
+            faiss_index.add_vectors(normalized(rng.standard_normal((n, DIM))),
+                                    [f"FOUND-WALLET-B{i:07d}" for i in range(start, start + n)])
+
+    def serialized(*a, **kw):
+        with faiss_index._lock:
+            return faiss_index.search_vectors(*a, **kw)
+
+    print(f"{args.items} FOUND items, {args.seconds:.0f}s per level, {os.cpu_count()} CPUs")
+    print(f"{'mode':<12}{'threads':>8}{'search/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'add p50':>9}{'add p99':>9}{'problems':>10}")
+    deleted = set()
+    for seed, (mode, search) in enumerate((("serialized", serialized), ("concurrent", faiss_index.search_vectors))):
+        for threads in args.threads:
+            with contextlib.redirect_stdout(io.StringIO()):
+                n, latencies, adds, problems = run_level(faiss_index, search, threads, args.seconds,
+                                                         seed * 1000 + threads, deleted)
+            print(f"{mode:<12}{threads:>8}{n / args.seconds:>10.0f}"
+                  f"{np.percentile(latencies, 50) * 1000:>9.2f}{np.percentile(latencies, 95) * 1000:>9.2f}"
+                  f"{np.percentile(adds, 50) * 1000:>9.2f}{np.percentile(adds, 99) * 1000:>9.2f}"
+                  f"{len(problems):>10}", flush=True)
+            for problem in problems[:3]:
+                print(f"  {problem}")
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+    print(f"index types: {sorted({type(faiss_index.base_index(p.index)).__name__ for p in faiss_index.partitions.values()})}")
+
+
+if __name__ == "__main__":
+    main()
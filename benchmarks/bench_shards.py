@@ -0,0 +1,214 @@
+"""Search latency, recall and index size of weekly time shards.
+
+Builds a store of --items items (half FOUND) created over the last --weeks
+weeks, then runs "lost" queries against the FOUND items: most sit near an
+item found recently (the week of the match is drawn geometrically, newest
+weeks first), --unmatched of them near nothing. Each layout runs in its
+own process and data directory:
+
+  * single:    INDEX_SHARD_DAYS = 0, one partition per report type
+               (approximate once it passes ANN_MIN_VECTORS)
+  * weekly:    INDEX_SHARD_DAYS = 7, no retention
+  * retention: INDEX_SHARD_DAYS = 7, shards older than --retention-days
+               retired (archived) at startup
+
+Per layout and search: p50/p95 latency of one search_vectors call, shards
+searched per call, recall of the planted match and recall@k against the
+exact top_k over every FOUND item. Searches: all shards (the default),
+early stop after top_k hits scoring --stop-score (the matcher with
+SEARCH_EARLY_STOP_SCORE set) and, for comparison, after 1 such hit, and a
+since window of --since-days. "MB" is the size of the searched FOUND
+partitions.
+
+    python -m benchmarks.bench_shards --items 100000 --weeks 52
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 512
+LAYOUTS = {"single": (0, 0), "weekly": (7, 0), "retention": (7, None)}
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def dataset(args):
+    """Vectors, created_at offsets (seconds before now), item IDs, queries
+    and the planted match of each query (-1 for none)"""
+    rng = np.random.default_rng(args.seed)
+    vectors = normalized(rng.standard_normal((args.items, DIM)))
+    ages = rng.uniform(0, args.weeks * 7 * 86400, size=args.items)
+    item_ids = np.array([f"{'FOUND' if i % 2 == 0 else 'LOST'}-WALLET-S{i:07d}" for i in range(args.items)])
+    found = np.flatnonzero(np.arange(args.items) % 2 == 0)
+    weeks = (ages[found] // (7 * 86400)).astype(int)
+    anchors = []
+    for _ in range(args.queries - args.unmatched):
+        week = min(int(rng.geometric(0.3)) - 1, args.weeks - 1)
+        candidates = found[weeks == week]
+        anchors.append(int(rng.choice(candidates)) if len(candidates) else int(rng.choice(found)))
+    anchors += [-1] * args.unmatched
+    anchors = np.array(anchors)
+    noise = rng.standard_normal((args.queries, DIM)) / np.sqrt(DIM)
+    queries = normalized(np.where(anchors[:, None] >= 0, vectors[anchors] + 0.6 * noise, noise))
+    return vectors, ages, item_ids, found, queries, anchors
+
+
+def build_store(vectors, ages, item_ids):
+    """Insert the items day by day, oldest first, and index them"""
+    from app.ai import faiss_index
+    from app.db import fake_db
+
+    class Clock(datetime):
+        now = None
+
+        @classmethod
+        def utcnow(cls):
+            return cls.now
+
+    real_now = datetime.utcnow()
+    days = (ages // 86400).astype(int)
+    real_datetime, fake_db.datetime = fake_db.datetime, Clock
+    try:
+        for day in np.unique(days)[::-1]:
+            rows = np.flatnonzero(days == day)
+            Clock.now = real_now - timedelta(days=int(day))
+            fake_db.insert_items([{
+                "item_id": item_ids[i], "itemType": "wallet", "category": "wallet",
+                "description": "black wallet", "location": "library",
+                "reportType": item_ids[i].split("-")[0].lower(), "embedding": vectors[i],
+            } for i in rows])
+            faiss_index.add_vectors(vectors[rows], list(item_ids[rows]))
+    finally:
+        fake_db.datetime = real_datetime
+    faiss_index.save_index()
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+
+
+def run_layout(args):
+    """Worker: build (or reopen) the store in one layout and time the searches"""
+    shard_days, retention = LAYOUTS[args.layout]
+    os.chdir(args.data)
+    sys.path.insert(0, ROOT)
+    import app.config
+    app.config.DB_FSYNC = False
+    app.config.WAL_FSYNC = False
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    app.config.INDEX_SHARD_DAYS = shard_days
+    app.config.INDEX_RETENTION_DAYS = args.retention_days if retention is None else retention
+    vectors, ages, item_ids, found, queries, anchors = dataset(args)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import metrics
+        from app.ai import faiss_index
+        if args.build:
+            build_store(vectors, ages, item_ids)
+    opened = time.perf_counter() - started
+    if args.build:
+        return
+
+    # Exact top_k over every FOUND item, retired or not
+    scores = queries @ vectors[found].T
+    truth = [set(item_ids[found[np.argsort(-row)[:args.top_k]]]) for row in scores]
+    planted = [item_ids[a] if a >= 0 else None for a in anchors]
+    found_parts = [part for key, part in faiss_index.partitions.items() if key.startswith("FOUND")]
+    result = {
+        "open_s": opened,
+        "partitions": len(found_parts),
+        "vectors": sum(part.live_count() for part in found_parts),
+        "mb": sum(faiss_index.faiss.serialize_index(part.index).nbytes for part in found_parts) / 2 ** 20,
+        "searches": {},
+    }
+    since = (datetime.utcnow() - timedelta(days=args.since_days)).isoformat()
+    searches = {
+        "all shards": {},
+        "stop top_k": {"stop_after": (args.top_k, args.stop_score)},
+        "stop 1": {"stop_after": (1, args.stop_score)},
+        f"since {args.since_days}d": {"since": since},
+    }
+    for name, filters in searches.items():
+        latencies, hits = [], []
+        metrics.reset()
+        for q in queries:
+            start = time.perf_counter()
+            hits.append([h["item_id"] for h in faiss_index.search_vectors(q, args.top_k, report_type="found",
+                                                                          **filters)])
+            latencies.append(time.perf_counter() - start)
+        matched = [(p, h) for p, h in zip(planted, hits) if p is not None]
+        result["searches"][name] = {
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "shards": metrics.snapshot()["counters"].get("index_shards_searched", 0) / len(queries),
+            "planted": sum(p in h for p, h in matched) / max(1, len(matched)),
+            "recall": sum(len(t & set(h)) for t, h in zip(truth, hits)) / sum(len(t) for t in truth),
+        }
+    with open(args.out, "w") as f:
+        json.dump(result, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--unmatched", type=int, default=60, help="queries with no planted match")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--since-days", type=int, default=30)
+    parser.add_argument("--stop-score", type=float, default=0.75, help="score of an early stop hit")
+    parser.add_argument("--retention-days", type=int, default=182)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS), choices=LAYOUTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layout", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--build", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.layout:
+        return run_layout(args)
+
+    results = {}
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    with tempfile.TemporaryDirectory() as work:
+        for layout in args.layouts:
+            print(f"Running {layout}", file=sys.stderr, flush=True)
+            data = os.path.join(work, layout)
+            os.makedirs(data)
+            out = os.path.join(work, f"{layout}.json")
+            command = [sys.executable, "-m", "benchmarks.bench_shards", "--layout", layout,
+                       "--data", data, "--out", out] + sys.argv[1:]
+            # Built in one process, searched after a restart in another
+            if subprocess.run(command + ["--build"], env=env, stdout=subprocess.DEVNULL).returncode != 0 or \
+                    subprocess.run(command, env=env, stdout=subprocess.DEVNULL).returncode != 0:
+                print(f"{layout} failed", file=sys.stderr)
+                continue
+            with open(out) as f:
+                results[layout] = json.load(f)
+
+    print(f"{args.items} items over {args.weeks} weeks, {args.queries} queries "
+          f"({args.unmatched} without a match), top_k={args.top_k}")
+    print(f"{'layout':<11}{'parts':>6}{'vectors':>9}{'MB':>8}{'open s':>8}  {'search':<12}"
+          f"{'shards':>7}{'p50 ms':>8}{'p95 ms':>8}{'planted':>9}{'recall@k':>10}")
+    for layout, r in results.items():
+        for i, (name, s) in enumerate(r["searches"].items()):
+            head = (f"{layout:<11}{r['partitions']:>6}{r['vectors']:>9}{r['mb']:>8.1f}{r['open_s']:>8.2f}"
+                    if i == 0 else " " * 42)
+            print(f"{head}  {name:<12}{s['shards']:>7.1f}{s['p50_ms']:>8.2f}{s['p95_ms']:>8.2f}"
+                  f"{s['planted']:>9.3f}{s['recall']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Throughput of standing-query matching (FOUND inserts vs open LOST reports).
+
+Builds a store of --lost open LOST reports (fused, image and text
+embeddings), then matches --found new FOUND items against them, a
+--planted fraction of which sit near a known LOST report. Compares:
+
+  * rescan:   exact scores of each FOUND item against every LOST vector
+              (what matching without an index would cost per insert)
+  * per-item: app.ai.standing_matches.match_found_items on one item at a time
+  * batched:  submit_found for chunks of STANDING_MATCH_BATCH items at a
+              time (like a bulk ingest chunk), grouped by the micro-batcher
+
+Reported: items/s, p50/p95 latency per item (submit to events recorded),
+events per item and recall of the planted pairs.
+
+    python -m benchmarks.bench_standing --lost 100000 --found 2000
+    python -m benchmarks.bench_standing --lost 200000 --factory "HNSW32,Flat" --no-fsync
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+DIM = 512
+
+
+def normalized(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def build_store(rng, lost, chunk=10000):
+    """Insert lost LOST reports; returns their (fused, image, text) vectors"""
+    from app.ai import faiss_index
+    from app.db import fake_db
+
+    fused, images, texts = (normalized(rng.standard_normal((lost, DIM))) for _ in range(3))
+    for start in range(0, lost, chunk):
+        stop = min(start + chunk, lost)
+        ids = [f"LOST-WALLET-S{i:07d}" for i in range(start, stop)]
+        fake_db.insert_items([{
+            "item_id": item_id, "itemType": "wallet", "category": "wallet",
+            "description": f"black leather wallet {i}", "location": "campus", "reportType": "lost",
+            "imageUrl": f"https://example.com/{i}.jpg", "embedding": fused[i],
+            "image_embedding": images[i], "text_embedding": texts[i],
+        } for i, item_id in zip(range(start, stop), ids)])
+        faiss_index.add_vectors(fused[start:stop], ids)
+    while faiss_index._rebuilding:
+        time.sleep(0.5)
+    return fused, images, texts
+
+
+def found_items(rng, lost_vectors, count, planted):
+    """FOUND items to match; planted ones are noisy copies of a LOST report"""
+    fused, images, texts = lost_vectors
+    items, expected = [], {}
+    for i in range(count):
+        item_id = f"FOUND-WALLET-N{i:07d}"
+        if rng.random() < planted:
+            target = int(rng.integers(len(fused)))
+            vectors = [normalized(v[target:target + 1] + 0.5 * rng.standard_normal((1, DIM)) / np.sqrt(DIM))[0]
+                       for v in (fused, images, texts)]
+            expected[item_id] = f"LOST-WALLET-S{target:07d}"
+        else:
+            vectors = list(normalized(rng.standard_normal((3, DIM))))
+        items.append({"item_id": item_id, "embedding": vectors[0], "image_embedding": vectors[1],
+                      "text_embedding": vectors[2], "description": "black leather wallet"})
+    return items, expected
+
+
+def planted_recall(expected, events):
+    matched = {(e["found_item_id"], e["lost_item_id"]) for e in events}
+    return sum((found, lost) in matched for found, lost in expected.items()) / max(1, len(expected))
+
+
+def report(name, latencies, elapsed, count, events, recall):
+    print(f"{name:<12}{count / elapsed:>12.1f}{percentile_ms(latencies, 50):>10.3f}"
+          f"{percentile_ms(latencies, 95):>10.3f}{events / count:>12.2f}{recall:>10.3f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lost", type=int, default=100000)
+    parser.add_argument("--found", type=int, default=2000)
+    parser.add_argument("--planted", type=float, default=0.2, help="fraction of FOUND items with a LOST match")
+    parser.add_argument("--factory", help="ANN index of the LOST partition, e.g. HNSW32,Flat (default: config)")
+    parser.add_argument("--no-fsync", action="store_true", help="turn off DB, WAL and event fsync")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Run the app modules against a scratch data directory
+    os.chdir(tempfile.mkdtemp(prefix="bench_standing_"))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app.config
+    app.config.WAL_SNAPSHOT_EVERY = 1 << 62
+    if args.factory:
+        app.config.ANN_INDEX_FACTORY = args.factory
+    if args.no_fsync:
+        app.config.DB_FSYNC = False
+        app.config.WAL_FSYNC = False
+
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        lost_vectors = build_store(rng, args.lost)
+        from app.ai import faiss_index, standing_matches
+        from app.config import SCORE_THRESHOLD, STANDING_MATCH_TOP_K, STANDING_MATCH_BATCH
+    items, expected = found_items(rng, lost_vectors, args.found, args.planted)
+    lost_index = next(part.index for key, part in faiss_index.partitions.items() if key.startswith("LOST"))
+    print(f"{args.lost} open LOST reports ({type(faiss_index.base_index(lost_index)).__name__}) "
+          f"built in {time.perf_counter() - started:.1f}s; {args.found} FOUND items, {len(expected)} planted")
+    print(f"{'strategy':<12}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'events/item':>12}{'recall':>10}")
+
+    # rescan: exact image/text late fusion against every LOST report
+    fused, images, texts = lost_vectors
+    latencies, events = [], []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        scores = 0.6 * (images @ item["image_embedding"]) + 0.4 * (texts @ item["text_embedding"])
+        top = np.argsort(-scores)[:STANDING_MATCH_TOP_K]
+        events.extend({"found_item_id": item["item_id"], "lost_item_id": f"LOST-WALLET-S{j:07d}"}
+                      for j in top if scores[j] >= SCORE_THRESHOLD)
+        latencies.append(time.perf_counter() - t)
+    report("rescan", latencies, time.perf_counter() - start, len(items), len(events),
+           planted_recall(expected, events))
+
+    # per-item: one reverse search per insert
+    first = standing_matches.last_event_id()
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        standing_matches.match_found_items([item])
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    events = standing_matches.events_after(first, limit=10 ** 9)
+    report("per-item", latencies, elapsed, len(items), len(events), planted_recall(expected, events))
+
+    # batched: chunks of inserts grouped by the micro-batcher
+    first = standing_matches.last_event_id()
+    latencies = []
+    start = time.perf_counter()
+    for chunk in range(0, len(items), STANDING_MATCH_BATCH):
+        t = time.perf_counter()
+        futures = [
+            standing_matches.submit_found(item["item_id"], item["embedding"], item["image_embedding"],
+                                          item["text_embedding"], item["description"])
+            for item in items[chunk:chunk + STANDING_MATCH_BATCH]
+        ]
+        for future in futures:
+            future.result()
+        latencies.extend([time.perf_counter() - t] * len(futures))
+    elapsed = time.perf_counter() - start
+    events = standing_matches.events_after(first, limit=10 ** 9)
+    report("batched", latencies, elapsed, len(items), len(events), planted_recall(expected, events))
+    print(f"batch sizes: {standing_matches.stats()['batching']['batch_sizes']}")
+
+
+if __name__ == "__main__":
+    main()
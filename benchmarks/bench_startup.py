@@ -0,0 +1,150 @@
+"""Cold-start time of the storage and index layers.
+
+Builds a data directory with N synthetic items (records, vectors, a FAISS
+snapshot), then times fresh interpreter imports of app.db.fake_db and
+app.ai.faiss_index with and without the keydir hint file, the sync
+watermark and memory-mapped index loading. With --model, also times how
+long the CLIP model takes to become ready in the background.
+
+    python -m benchmarks.bench_startup --items 100000
+    python -m benchmarks.bench_startup --items 20000 --factory "HNSW32,Flat" --json startup.json
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 512
+
+# Runs in a child process inside the data directory; prints elapsed seconds
+PROBE = """
+import sys, time, contextlib, io
+sys.path.insert(0, {root!r})
+import app.config
+app.config.INDEX_MMAP = {mmap}
+app.config.ANN_MIN_VECTORS = 10 ** 12
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import {module}
+    {after}
+print("elapsed", time.perf_counter() - start)
+"""
+
+
+def build_data_dir(path, items, factory):
+    """Populate path/data through the app's own storage code"""
+    sys.path.insert(0, ROOT)
+    os.chdir(path)
+    import app.config
+    app.config.DB_FSYNC = False
+    app.config.WAL_FSYNC = False
+    app.config.ANN_MIN_VECTORS = 10 ** 12
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.db import fake_db
+        rng = np.random.default_rng(0)
+        for start in range(0, items, 10000):
+            n = min(10000, items - start)
+            vectors = rng.standard_normal((n, DIM)).astype("float32")
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            fake_db.insert_items([{
+                "item_id": f"{'LOST' if i % 2 else 'FOUND'}-WALLET-{i:06d}",
+                "itemType": "wallet", "category": "wallet",
+                "description": f"black leather wallet {i} with student id and bank cards",
+                "location": "central library, second floor", "reportType": "lost" if i % 2 else "found",
+                "imageUrl": f"https://res.cloudinary.com/demo/image/upload/v1700000000/items/{i}.jpg",
+                "embedding": vectors[i - start],
+            } for i in range(start, start + n)])
+        fake_db.save_hint()
+        from app.ai import faiss_index
+        if factory != "Flat":
+            from app.ai.index_factory import build_index
+            for part in faiss_index.partitions.values():
+                vectors, ids = part.vectors(0, part.index.ntotal)
+                part.index = build_index(vectors, factory, ids=ids)
+                part.mapped = False
+                part.version += 1
+            faiss_index.save_index()
+        # As if the last sync ran a while after these items were written
+        faiss_index._write_watermark(datetime.utcnow().isoformat())
+    # The temporary directory is gone by the time this process exits
+    atexit.unregister(fake_db.save_hint)
+
+
+def probe(data_dir, module, mmap=True, after="pass", drop=()):
+    """Copy the data dir, drop some files, and time one import in a fresh process"""
+    with tempfile.TemporaryDirectory() as work:
+        # Hard links keep inodes, so the copied hint file still matches its log
+        shutil.copytree(os.path.join(data_dir, "data"), os.path.join(work, "data"), copy_function=os.link)
+        for name in drop:
+            path = os.path.join(work, "data", name)
+            if os.path.exists(path):
+                os.remove(path)
+        code = PROBE.format(root=ROOT, mmap=mmap, module=module, after=after)
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=work, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if out.returncode != 0:
+            raise RuntimeError(out.stderr)
+        elapsed = [line for line in out.stdout.splitlines() if line.startswith("elapsed ")][-1]
+        return float(elapsed.split()[1]), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--factory", default="Flat", help="index type of the snapshot, e.g. HNSW32,Flat")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", action="store_true", help="also time background CLIP loading")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("db open, full scan", "app.db.fake_db", dict(after="app.db.fake_db._open()", drop=("items.hint",))),
+        ("db open, hint", "app.db.fake_db", dict(after="app.db.fake_db._open()")),
+        ("index, full sync, read", "app.ai.faiss_index", dict(mmap=False, drop=("items.hint", "sync_watermark.json"))),
+        ("index, full sync, mmap", "app.ai.faiss_index", dict(drop=("items.hint", "sync_watermark.json"))),
+        ("index, watermark, read", "app.ai.faiss_index", dict(mmap=False)),
+        ("index, watermark, mmap", "app.ai.faiss_index", dict()),
+    ]
+    if args.model:
+        scenarios.append(("clip ready (background)", "app.ai.clip_model",
+                          dict(after="app.ai.clip_model.start_background_load(); "
+                                     "app.ai.clip_model._ready.wait()")))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        cwd = os.getcwd()
+        started = time.perf_counter()
+        build_data_dir(data_dir, args.items, args.factory)
+        os.chdir(cwd)
+        print(f"Built {args.items} items ({args.factory}) in {time.perf_counter() - started:.1f}s")
+
+        rows = []
+        print(f"{'scenario':<28}{'import s':>10}{'process s':>11}")
+        for name, module, options in scenarios:
+            timings = [probe(data_dir, module, **options) for _ in range(args.repeat)]
+            row = {
+                "scenario": name,
+                "import_s": round(min(t for t, _ in timings), 3),
+                "process_s": round(min(w for _, w in timings), 3),
+            }
+            rows.append(row)
+            print(f"{name:<28}{row['import_s']:>10.3f}{row['process_s']:>11.3f}", flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"items": args.items, "factory": args.factory, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
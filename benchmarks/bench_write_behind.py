@@ -0,0 +1,299 @@
+"""Ingest throughput of write-behind persistence, and a crash test.
+
+Stores items through app.main._store, the persistence path of /report
+(item log + vector store append, index add, WAL append), from --concurrency
+concurrent tasks, without fetching or encoding: every item gets a random
+embedding. Each mode runs in its own process and data directory:
+
+  * sync:   WRITE_BEHIND off, every append is fsynced in place
+  * fsync:  write-behind, each call waits for the group commit
+  * memory: write-behind, calls return once the item is searchable
+
+Reported: items/s, p50/p99 latency per call and, for write-behind, the
+average number of waiting calls covered by one group commit.
+
+--crash-rounds N instead runs N rounds of: start an ingest process (mixed
+durability), SIGKILL it after a random delay, reopen the data directory
+and check that the item store and the index agree: every live item is
+indexed with its own embedding, no two records share a vector store row,
+the index holds nothing the store does not, and every call acknowledged
+with durability "fsync" survived. A
+SIGKILL keeps everything written to the OS; with --power-loss each round
+also simulates losing the page cache: the ingester logs the size of every
+file it fsyncs, and after the kill each file is cut back to a random
+length between what its last fsync covered and what was written, every
+file independently, as the OS may have written back any part of the rest.
+
+    python -m benchmarks.bench_write_behind --items 2000 --concurrency 1 8 32
+    python -m benchmarks.bench_write_behind --crash-rounds 20 --power-loss
+
+The crash test exits with status 1 if any round found a problem;
+benchmarks.check_crash runs it as a pass/fail check.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 512
+MODES = ("sync", "fsync", "memory")
+
+
+def setup(write_behind):
+    """Configure and import the app against the current directory"""
+    sys.path.insert(0, ROOT)
+    import app.config
+    app.config.CLIP_BACKEND = "fake"
+    app.config.CLIP_LOAD_MODE = "lazy"
+    app.config.STANDING_MATCHES = False
+    app.config.WRITE_BEHIND = write_behind
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import main
+    # Unique ids: random 4-character codes can collide at this volume
+    counter = itertools.count()
+    main.generate_item_id = lambda report_type, category: \
+        f"{report_type.upper()}-{category.upper()}-B{os.getpid()}X{next(counter)}"
+    return main
+
+
+def store_one(main, rng, i, durability):
+    vector = rng.standard_normal(DIM).astype("float32")
+    vector /= np.linalg.norm(vector)
+    report_type = "lost" if i % 2 else "found"
+    return main._store("wallet", "Library", report_type, f"http://images/{i}.jpg", "black wallet",
+                       vector, vector, vector, durability)
+
+
+async def ingest(main, items, concurrency, durability, acked=None):
+    """Store items from concurrency tasks; returns per-call latencies"""
+    rng = np.random.default_rng()
+    latencies = []
+    counter = itertools.count()
+
+    async def worker():
+        while (i := next(counter)) < items:
+            mode = durability if durability != "mixed" else random.choice(("memory", "fsync"))
+            start = time.perf_counter()
+            item_id, _ = await store_one(main, rng, i, mode)
+            latencies.append(time.perf_counter() - start)
+            if acked is not None and mode == "fsync":
+                print(item_id, file=acked, flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def run_mode(args):
+    """Worker: throughput of one mode at each concurrency level"""
+    os.chdir(tempfile.mkdtemp(prefix="bench_write_behind_"))
+    main = setup(args.mode != "sync")
+    from app import write_behind
+    results = {}
+    for concurrency in args.concurrency:
+        before = write_behind.stats()
+        start = time.perf_counter()
+        latencies = asyncio.run(ingest(main, args.items, concurrency,
+                                       "memory" if args.mode == "memory" else "fsync"))
+        elapsed = time.perf_counter() - start
+        after = write_behind.stats()
+        commits = after["commits"] - before["commits"]
+        results[str(concurrency)] = {
+            "items_per_s": args.items / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "waiters_per_commit": (after["waiters"] - before["waiters"]) / commits if commits else 0.0,
+        }
+    write_behind.flush()
+    with open(args.out, "w") as f:
+        json.dump(results, f)
+
+
+def record_fsyncs(path):
+    """Log the path and size of every file at each fsync (the size before
+    it, as appends may go on while it runs), and every rename, which takes
+    the durable size along to the new name"""
+    real_fsync, real_replace = os.fsync, os.replace
+    out = open(path, "a")
+    lock = threading.Lock()
+
+    def fsync(fd):
+        size = os.fstat(fd).st_size
+        real_fsync(fd)
+        with lock:
+            print(json.dumps(["fsync", os.readlink(f"/proc/self/fd/{fd}"), size]), file=out, flush=True)
+
+    def replace(src, dst):
+        real_replace(src, dst)
+        with lock:
+            print(json.dumps(["replace", os.path.realpath(src), os.path.realpath(dst)]), file=out, flush=True)
+
+    os.fsync, os.replace = fsync, replace
+
+
+def power_loss(data, synced):
+    """Cut every file of the data directory back to a random length between
+    its last fsync and its current size"""
+    durable = {}
+    if os.path.exists(synced):
+        with open(synced) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    continue
+                op, a, b = json.loads(line)
+                if op == "fsync":
+                    durable[a] = max(durable.get(a, 0), b)
+                else:
+                    durable[b] = durable.pop(a, 0)
+    cut = 0
+    for name in os.listdir(data):
+        path = os.path.realpath(os.path.join(data, name))
+        size = os.path.getsize(path)
+        if os.path.isfile(path) and size > durable.get(path, 0):
+            os.truncate(path, random.randint(durable.get(path, 0), size))
+            cut += 1
+    return cut
+
+
+def run_ingester(args):
+    """Crash test worker: ingest until killed, logging fsync-acked ids"""
+    os.chdir(args.data)
+    if args.power_loss:
+        record_fsyncs(os.path.join(args.data, "synced.txt"))
+    main = setup(True)
+    with open(args.acked, "a") as acked:
+        asyncio.run(ingest(main, 1 << 30, 16, "mixed", acked=acked))
+
+
+def check(args):
+    """Crash test worker: reopen the data directory and compare store and index"""
+    os.chdir(args.data)
+    if args.power_loss:
+        # Recovery writes too (snapshots, tombstones)
+        record_fsyncs(os.path.join(args.data, "synced.txt"))
+    setup(True)
+    from app.ai import faiss_index
+    from app.db import fake_db, vector_store
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = fake_db.get_all_items()
+    live = {item["item_id"]: item for item in items if item.get("embedding_row") is not None}
+    indexed = set(faiss_index.indexed_ids)
+    problems = []
+    problems += [f"not indexed: {item_id}" for item_id in live.keys() - indexed]
+    problems += [f"indexed without record: {item_id}" for item_id in indexed - live.keys()]
+    # Every record's vectors must exist and belong to it alone
+    owners = {}
+    for item_id, item in live.items():
+        for field in fake_db.EMBEDDING_FIELDS.values():
+            row = item.get(field)
+            if row is not None and row >= vector_store.count():
+                problems.append(f"row past the vector store: {item_id}")
+            elif row is not None and owners.setdefault(row, item_id) != item_id:
+                problems.append(f"row shared: {item_id}, {owners[row]}")
+    sample = random.sample(sorted(live.keys() & indexed), min(200, len(live.keys() & indexed)))
+    for item_id in sample:
+        embedding = vector_store.get(live[item_id]["embedding_row"])
+        hits = faiss_index.search_vectors(embedding, 1, report_type=live[item_id]["reportType"])
+        if not hits or hits[0]["item_id"] != item_id or hits[0]["score"] < 0.999:
+            problems.append(f"wrong vector: {item_id} -> {hits[:1]}")
+    acked = []
+    if os.path.exists(args.acked):
+        with open(args.acked) as f:
+            # A line cut short by the kill was never acknowledged
+            acked = [line.strip() for line in f if line.endswith("\n")]
+    problems += [f"acked but lost: {item_id}" for item_id in acked if item_id not in live]
+    print(json.dumps({"items": len(live), "indexed": len(indexed), "acked": len(acked),
+                      "problems": problems[:20], "problem_count": len(problems)}))
+
+
+def crash_test(args):
+    """Run args.crash_rounds crash rounds in one data directory; returns the
+    number of rounds whose check found problems"""
+    data = tempfile.mkdtemp(prefix="bench_crash_")
+    acked = os.path.join(data, "acked.txt")
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    failures = 0
+    for round_ in range(args.crash_rounds):
+        ingester = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_write_behind", "--ingester", "--data", data,
+             "--acked", acked] + (["--power-loss"] if args.power_loss else []),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        time.sleep(random.uniform(2.0, 4.0))
+        ingester.send_signal(signal.SIGKILL)
+        ingester.wait()
+        cut = power_loss(os.path.join(data, "data"), os.path.join(data, "synced.txt")) if args.power_loss else 0
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_write_behind", "--check", "--data", data,
+             "--acked", acked] + (["--power-loss"] if args.power_loss else []),
+            capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            sys.exit(f"round {round_}: check failed to run")
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        failures += report["problem_count"] > 0
+        print(f"round {round_:>3}: {report['items']:>7} items, {report['indexed']:>7} indexed, "
+              f"{report['acked']:>6} fsync-acked, {cut} files cut, {report['problem_count']} problems "
+              f"{report['problems'][:3] if report['problems'] else ''}")
+    print(f"{args.crash_rounds - failures}/{args.crash_rounds} rounds consistent")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=2000, help="items per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--crash-rounds", type=int, default=0)
+    parser.add_argument("--power-loss", action="store_true", help="crash test: also lose unsynced writes")
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--ingester", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--check", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    parser.add_argument("--acked", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ingester:
+        return run_ingester(args)
+    if args.check:
+        return check(args)
+    if args.mode:
+        return run_mode(args)
+    if args.crash_rounds:
+        sys.exit(1 if crash_test(args) else 0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work:
+        for mode in args.modes:
+            print(f"Running {mode}", file=sys.stderr, flush=True)
+            out = os.path.join(work, f"{mode}.json")
+            command = [sys.executable, "-m", "benchmarks.bench_write_behind", "--mode", mode,
+                       "--out", out] + sys.argv[1:]
+            if subprocess.run(command, env=dict(os.environ, PYTHONPATH=ROOT)).returncode != 0:
+                print(f"{mode} failed", file=sys.stderr)
+                continue
+            with open(out) as f:
+                results[mode] = json.load(f)
+
+    print(f"{args.items} items per level")
+    print(f"{'mode':<8}{'conc':>6}{'items/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'waiters/commit':>16}")
+    for mode, levels in results.items():
+        for concurrency, r in levels.items():
+            print(f"{mode:<8}{concurrency:>6}{r['items_per_s']:>10.0f}{r['p50_ms']:>9.2f}"
+                  f"{r['p99_ms']:>9.2f}{r['waiters_per_commit']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Local stand-in for Cloudinary that serves deterministic synthetic images.
+
+GET /image/<seed>.<jpg|png|webp>?w=640&h=480&delay_ms=0 returns an image
+whose pixels depend only on the seed, so the same URL always yields the
+same bytes. delay_ms simulates a slow origin. scale=0.5, q=60 (JPEG/WebP
+quality) and crop=0.1 (fraction of the width cut off the left, the rest
+stretched back to w x h) serve variants of the seed's picture: the same
+photo uploaded again at another size or compression, or a second photo
+framed differently.
+
+    python -m benchmarks.image_server --port 8765
+
+or in-process:
+
+    server, base_url = start_image_server()
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+FORMATS = {"jpg": ("JPEG", "image/jpeg"), "png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp")}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def render_image(seed, width, height, ext, scale=1.0, quality=90, crop=0.0):
+    """Encoded bytes of a smooth random image for seed, or of a variant of
+    it (see the module docstring)"""
+    key = (seed, width, height, ext, scale, quality, crop)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+    rng = np.random.default_rng(seed)
+    # Low-resolution noise upscaled, so images compress like photos
+    small = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    if crop:
+        image = image.crop((round(width * crop), 0, width, height)).resize((width, height), Image.BILINEAR)
+    if scale != 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BILINEAR)
+    buf = BytesIO()
+    if ext == "png":
+        image.save(buf, "PNG")
+    else:
+        image.save(buf, FORMATS[ext][0], quality=quality)
+    data = buf.getvalue()
+    with _cache_lock:
+        _cache[key] = data
+    return data
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        name = parsed.path.rsplit("/", 1)[-1]
+        stem, _, ext = name.partition(".")
+        if not parsed.path.startswith("/image/") or ext not in FORMATS or not stem.isdigit():
+            self.send_error(404)
+            return
+        params = parse_qs(parsed.query)
+        width = int(params.get("w", ["640"])[0])
+        height = int(params.get("h", ["480"])[0])
+        delay_ms = float(params.get("delay_ms", ["0"])[0])
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        data = render_image(int(stem), width, height, ext, float(params.get("scale", ["1"])[0]),
+                            int(params.get("q", ["90"])[0]), float(params.get("crop", ["0"])[0]))
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[ext][1])
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_image_server(host="127.0.0.1", port=0):
+    """Serve images on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), ImageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="image-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), ImageHandler)
+    print(f"Serving synthetic images on http://{args.host}:{args.port}/image/<seed>.jpg")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -129,7 +129,8 @@ router.post('/lost', async (req, res) => {
         description,
         location,
         category: itemType,
-        reportType: 'lost'
+        reportType: 'lost',
+        lostDate: dateLost
       });
 
       console.log('✅ AI service response received:', aiResponse);
@@ -237,7 +238,9 @@ router.post('/found', async (req, res) => {
       // Check for matches with existing lost items
       try {
         console.log('Checking for matches with lost items...');
-        const matchesResponse = await aiService.findSimilarItems(aiResponse.embedding || '', 5);
+        const matchesResponse = aiResponse.embedding
+          ? await aiService.getSimilarItems(aiResponse.embedding, 5, 'found')
+          : [];
         
         if (matchesResponse && matchesResponse.length > 0) {
           console.log(`Found ${matchesResponse.length} potential matches for found item`);
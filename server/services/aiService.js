@@ -15,6 +15,10 @@ class AIService {
       formData.append('location', itemData.location || '');
       formData.append('category', itemData.category || 'general');
       formData.append('report_type', itemData.reportType || '');
+      // Lost reports are only matched against items found since the loss
+      if (itemData.lostDate && !isNaN(new Date(itemData.lostDate))) {
+        formData.append('lost_date', new Date(itemData.lostDate).toISOString());
+      }
 
       const response = await axios.post(`${this.fastApiUrl}/report`, formData, {
         headers: {
@@ -34,18 +38,53 @@ class AIService {
     }
   }
 
-  async getSimilarItems(embedding, topK = 5) {
+  // reportType is the type of the item the embedding belongs to; matches
+  // are drawn from the opposite type
+  async getSimilarItems(embedding, topK = 5, reportType = null) {
     try {
       const response = await axios.post(`${this.fastApiUrl}/find-similar`, {
         embedding,
-        top_k: topK
+        top_k: topK,
+        report_type: reportType
       });
       return response.data.matches || [];
     } catch (error) {
-      console.error('Error finding similar items:', error);
+      console.error('Error finding similar items:', error.response?.data || error.message);
       return [];
     }
   }
+
+  // Matches for many embeddings in one request (one batched search);
+  // returns one match list per embedding, in order
+  async getSimilarItemsBatch(embeddings, topK = 5, reportType = null) {
+    try {
+      const response = await axios.post(`${this.fastApiUrl}/find-similar`, {
+        embeddings,
+        top_k: topK,
+        report_type: reportType
+      });
+      return (response.data.results || []).map(result => result.matches || []);
+    } catch (error) {
+      console.error('Error finding similar items:', error.response?.data || error.message);
+      return embeddings.map(() => []);
+    }
+  }
+
+  // Matches of newly found items against open lost reports, after the
+  // cursor returned by the previous call. With wait > 0 the AI service
+  // holds the request up to that many seconds until an event arrives.
+  async getMatchEvents(after = 0, wait = 25, limit = 100) {
+    try {
+      const response = await axios.get(`${this.fastApiUrl}/matches/events`, {
+        params: { after, wait, limit },
+        timeout: (wait + 10) * 1000
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching match events:', error.response?.data || error.message);
+      return { events: [], cursor: after };
+    }
+  }
 }
 
 module.exports = new AIService();